@@ -3,12 +3,13 @@ import json
 from datetime import datetime
 from dotenv import load_dotenv
 from .utils import is_android
+from .context_window import ContextWindow
 
 try:
-    import openai
-    OPENAI_ENABLED = True
+    from .llm_client import LLMClient, LLMError
+    LLM_ENABLED = True
 except ImportError:
-    OPENAI_ENABLED = False
+    LLM_ENABLED = False
 
 # Load environment variables - completely generic
 def load_env():
@@ -33,42 +34,46 @@ def load_env():
 load_env()
 
 class AICore:
-    def __init__(self):
-        self.context = self._load_context()
-        self.max_history = 5
+    def __init__(self, prompt_budget: int = 1200, summary_budget: int = 120):
+        # Mobile networks stall more; give up sooner than the desktop does
+        self.client = LLMClient(model="gpt-3.5-turbo", deadline=15.0) if LLM_ENABLED else None
+        self.window = ContextWindow(self._system_prompt(), prompt_budget, self._summarize, summary_budget)
         
-    def _load_context(self):
-        return [
-            {
-                "role": "system", 
-                "content": (
-                    "You are Klaus, a helpful mobile AI assistant. "
-                    "Keep responses concise and mobile-friendly. "
-                    f"Today is {datetime.now().strftime('%A, %B %d')}."
-                )
-            }
-        ]
+    def _system_prompt(self) -> str:
+        return (
+            "You are Klaus, a helpful mobile AI assistant. "
+            "Keep responses concise and mobile-friendly. "
+            f"Today is {datetime.now().strftime('%A, %B %d')}."
+        )
+
+    @property
+    def context(self):
+        return self.window.prompt()
+
+    def _summarize(self, summary, turns):
+        # Offline, ContextWindow falls back to keeping the first sentence of each turn
+        if self.client is None or not self.client.configured:
+            return None
+        transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+        return self.client.chat(
+            [{"role": "system", "content": "Condense this conversation into a few sentences, "
+                                           "keeping names, facts and open requests. Reply with the summary only."},
+             {"role": "user", "content": f"Summary so far: {summary or 'none'}\n\nNew turns:\n{transcript}"}],
+            temperature=0.2,
+            max_tokens=self.window.summary_budget
+        )
     
     def process_query(self, user_input: str) -> str:
-        self.context.append({"role": "user", "content": user_input})
+        self.window.add("user", user_input)
         
-        if not OPENAI_ENABLED or not os.getenv("OPENAI_API_KEY"):
+        if self.client is None or not self.client.configured:
             return "I'm offline right now. Try basic commands."
         
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=self.context,
-                temperature=0.7,
-                max_tokens=150
-            )
-            
-            ai_reply = response.choices[0].message['content']
-            self.context.append({"role": "assistant", "content": ai_reply})
-            
-            if len(self.context) > self.max_history:
-                self.context = [self.context[0]] + self.context[-self.max_history+1:]
-                
+            ai_reply = self.client.chat(self.window.prompt(), temperature=0.7, max_tokens=150)
+            self.window.add("assistant", ai_reply)
             return ai_reply
+        except LLMError as e:
+            return f"Sorry, I encountered an error: {str(e)}"
         except Exception as e:
-            return f"Sorry, I encountered an error: {str(e)}"
\ No newline at end of file
+            return f"An unexpected error occurred: {str(e)}"
\ No newline at end of file
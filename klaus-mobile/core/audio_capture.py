@@ -0,0 +1,207 @@
+import threading
+import time
+from typing import Optional
+import numpy as np
+from .audio_frames import PolyphaseResampler, to_mono_float32
+
+try:
+    import sounddevice as sd
+    STREAMING_AVAILABLE = True
+except (ImportError, OSError):
+    # OSError is raised when the PortAudio library itself is missing
+    STREAMING_AVAILABLE = False
+
+
+class RingBuffer:
+    """Fixed-size float32 ring buffer addressed by absolute sample position"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.total_written = 0
+        self._data = np.zeros(capacity, dtype=np.float32)
+        self._cond = threading.Condition()
+
+    def write(self, samples: np.ndarray):
+        """Append samples, overwriting the oldest audio when full"""
+        count = len(samples)
+        if count > self.capacity:
+            samples = samples[-self.capacity:]
+        with self._cond:
+            # Position the (possibly truncated) block so it ends at the new write head
+            start = (self.total_written + count - len(samples)) % self.capacity
+            first = min(len(samples), self.capacity - start)
+            self._data[start:start + first] = samples[:first]
+            self._data[:len(samples) - first] = samples[first:]
+            self.total_written += count
+            self._cond.notify_all()
+
+    def oldest(self) -> int:
+        """Absolute position of the oldest sample still held"""
+        return max(0, self.total_written - self.capacity)
+
+    def read(self, start: int, end: int) -> np.ndarray:
+        """Copy out samples in [start, end), clamped to what is still buffered"""
+        with self._cond:
+            start = max(start, self.oldest())
+            end = min(end, self.total_written)
+            if end <= start:
+                return np.zeros(0, dtype=np.float32)
+            first = start % self.capacity
+            last = first + (end - start)
+            if last <= self.capacity:
+                return self._data[first:last].copy()
+            return np.concatenate((self._data[first:], self._data[:last - self.capacity]))
+
+    def wait_for(self, position: int, timeout: float) -> bool:
+        """Block until at least `position` samples have been written"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.total_written >= position, timeout)
+
+
+class EnergyVAD:
+    """Frame-level voice activity detector based on RMS energy"""
+
+    def __init__(self, threshold: float = 0.01):
+        """
+        Args:
+            threshold: RMS level (float32 full scale) above which a frame counts as speech
+        """
+        self.threshold = threshold
+
+    def is_speech(self, frame: np.ndarray) -> bool:
+        rms = float(np.sqrt(np.mean(np.square(frame))))
+        return rms > self.threshold
+
+
+def default_input_rate(device: Optional[int] = None) -> Optional[float]:
+    """Native sample rate of an input device, None if it can't be queried"""
+    if not STREAMING_AVAILABLE:
+        return None
+    try:
+        return sd.query_devices(device, 'input')['default_samplerate']
+    except Exception:
+        return None
+
+
+class StreamingCapture:
+    def __init__(self, samplerate: int = 16000, device: Optional[int] = None,
+                 frame_ms: int = 30, buffer_seconds: float = 30.0,
+                 vad: Optional[EnergyVAD] = None, onset_frames: int = 3,
+                 trailing_silence: float = 0.8, pre_roll: float = 0.3,
+                 device_rate: Optional[float] = None):
+        """
+        Microphone capture into a ring buffer with VAD endpointing
+
+        Args:
+            samplerate: Capture rate in Hz (Whisper expects 16000)
+            device: sounddevice input device, None for the system default
+            frame_ms: VAD frame length in milliseconds
+            buffer_seconds: Ring buffer length, also caps a single utterance
+            vad: Voice activity detector, defaults to EnergyVAD()
+            onset_frames: Consecutive speech frames needed to start an utterance
+            trailing_silence: Seconds of silence that close an utterance
+            pre_roll: Seconds of audio kept from before the detected onset
+            device_rate: Open the device at this (native) rate and resample to
+                `samplerate`, instead of relying on the driver to convert
+        """
+        self.samplerate = samplerate
+        self.device = device
+        self.frame_len = int(samplerate * frame_ms / 1000)
+        self.device_rate = int(device_rate) if device_rate else samplerate
+        self.device_frame_len = int(self.device_rate * frame_ms / 1000)
+        self.resampler = None
+        if self.device_rate != samplerate:
+            self.resampler = PolyphaseResampler(self.device_rate, samplerate,
+                                                max_block=self.device_frame_len)
+        self.vad = vad or EnergyVAD()
+        self.onset_frames = onset_frames
+        self.trailing_silence = trailing_silence
+        self.pre_roll = pre_roll
+        self.buffer = RingBuffer(int(samplerate * buffer_seconds))
+        self.stream = None
+
+    def start(self):
+        """Open the input stream"""
+        if not STREAMING_AVAILABLE:
+            raise RuntimeError("Streaming capture requires sounddevice")
+        if self.stream is None:
+            if self.resampler is not None:
+                self.resampler.reset()
+            self.stream = sd.InputStream(
+                samplerate=self.device_rate,
+                device=self.device,
+                channels=1,
+                dtype='float32',
+                blocksize=self.device_frame_len,
+                callback=self._callback
+            )
+            self.stream.start()
+
+    def stop(self):
+        """Close the input stream"""
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _callback(self, indata, frames, time_info, status):
+        """PortAudio callback - keep it short, just copy into the ring buffer"""
+        samples = to_mono_float32(indata)
+        if self.resampler is not None:
+            samples = self.resampler.process(samples)
+        self.buffer.write(samples)
+
+    def capture_utterance(self, timeout: float = 5, phrase_time_limit: float = 10) -> Optional[np.ndarray]:
+        """
+        Wait for speech and return it once the speaker goes quiet
+
+        Args:
+            timeout: Seconds to wait for speech onset
+            phrase_time_limit: Maximum utterance length in seconds
+
+        Returns:
+            Mono float32 audio, or None if nobody spoke before the timeout
+        """
+        sr = self.samplerate
+        silence_limit = int(self.trailing_silence * sr)
+        max_samples = int(min(phrase_time_limit, self.buffer.capacity / sr) * sr)
+        onset_deadline = time.monotonic() + timeout
+
+        pos = self.buffer.total_written
+        speech_run = 0
+        start = None
+        silence = 0
+
+        while True:
+            if not self.buffer.wait_for(pos + self.frame_len, timeout=0.5):
+                if self.stream is None or not self.stream.active:
+                    return None
+                if start is None and time.monotonic() > onset_deadline:
+                    return None
+                continue
+
+            frame = self.buffer.read(pos, pos + self.frame_len)
+            pos += self.frame_len
+            speech = self.vad.is_speech(frame)
+
+            if start is None:
+                speech_run = speech_run + 1 if speech else 0
+                if speech_run >= self.onset_frames:
+                    onset = pos - speech_run * self.frame_len
+                    start = max(onset - int(self.pre_roll * sr), self.buffer.oldest())
+                elif time.monotonic() > onset_deadline:
+                    return None
+                continue
+
+            silence = 0 if speech else silence + self.frame_len
+            if silence >= silence_limit or pos - start >= max_samples:
+                # Keep a short tail after the last speech frame
+                end = pos - silence + min(silence, int(0.2 * sr))
+                return self.buffer.read(start, end)
@@ -0,0 +1,143 @@
+from math import gcd
+from typing import Dict, Optional, Tuple
+import numpy as np
+
+TARGET_RATE = 16000  # Whisper and the VAD work at 16 kHz
+
+
+def to_mono_float32(block: np.ndarray) -> np.ndarray:
+    """
+    Mono float32 samples from a captured block, without copying when possible
+
+    A float32 (frames, 1) block - what sounddevice hands the callback - comes
+    back as a 1-D view of the same memory. Multi-channel blocks are averaged
+    and int16 blocks scaled to [-1, 1), which does allocate.
+    """
+    if block.ndim == 2:
+        if block.shape[1] == 1:
+            block = block[:, 0]
+        else:
+            block = block.mean(axis=1, dtype=np.float32)
+    if block.dtype == np.int16:
+        return block.astype(np.float32) / 32768.0
+    if block.dtype != np.float32:
+        block = block.astype(np.float32)
+    return np.ascontiguousarray(block)
+
+
+def _design_filter(up: int, down: int, taps_per_phase: int) -> np.ndarray:
+    """Windowed-sinc lowpass at the upsampled rate, split into `up` polyphase rows"""
+    length = up * taps_per_phase
+    # Cut off a little below the lower Nyquist so the transition band doesn't alias
+    cutoff = 0.45 / max(up, down)
+    n = np.arange(length) - (length - 1) / 2
+    h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, 8.0)
+    h *= up / h.sum()
+    # Row p holds taps p, p + up, p + 2*up, ...
+    return h.reshape(taps_per_phase, up).T.astype(np.float32).copy()
+
+
+class PolyphaseResampler:
+    def __init__(self, in_rate: int, out_rate: int = TARGET_RATE, taps_per_phase: int = 24,
+                 max_block: int = 4096):
+        """
+        Streaming rational resampler (e.g. 48 kHz or 44.1 kHz down to 16 kHz)
+
+        Keeps the filter history between calls so consecutive blocks join
+        without clicks. Work and output buffers are allocated once up to
+        max_block input samples; when the block length stays the same and
+        covers whole resampling periods (30 ms frames at 44.1/48 kHz do),
+        the gather indices are reused too, so steady-state capture does no
+        allocation beyond NumPy temporaries.
+
+        Args:
+            in_rate: Device sample rate in Hz
+            out_rate: Output rate in Hz
+            taps_per_phase: Filter length per output sample when not decimating
+                (quality vs. CPU); scaled up by the decimation ratio
+            max_block: Largest input block expected; bigger blocks are split
+        """
+        in_rate, out_rate = int(round(in_rate)), int(round(out_rate))
+        g = gcd(in_rate, out_rate)
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.up = out_rate // g
+        self.down = in_rate // g
+        # Decimating needs a proportionally longer filter for the same stopband
+        self.taps = taps_per_phase * -(-self.down // self.up)
+        self.max_block = max_block
+        self.bank = _design_filter(self.up, self.down, self.taps)
+        history = self.taps - 1
+        self._work = np.zeros(history + max_block, dtype=np.float32)
+        max_out = max_block * self.up // self.down + 2
+        self._out = np.zeros(max_out, dtype=np.float32)
+        self._gather = np.zeros((max_out, self.taps), dtype=np.float32)
+        self._plans: Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray]] = {}
+        self.reset()
+
+    def reset(self):
+        self._work[:self.taps - 1] = 0.0
+        self._in_pos = 0     # input samples consumed so far
+        self._out_pos = 0    # output samples produced so far
+
+    def _plan(self, count: int, offset: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Gather indices and filter rows for a block; offset = out_pos*down - in_pos*up"""
+        key = (count, offset)
+        plan = self._plans.get(key)
+        if plan is not None:
+            return plan
+        # Outputs m = 0.. whose newest input sample falls inside this block
+        last = (count * self.up - 1 - offset) // self.down
+        m = np.arange(max(last + 1, 0))
+        u = offset + m * self.down           # upsampled index relative to block start * up
+        base = u // self.up + self.taps - 1  # newest input in the work buffer
+        indices = base[:, None] - np.arange(self.taps)[None, :]
+        rows = self.bank[u % self.up]
+        plan = (indices, rows)
+        if len(self._plans) < 16:
+            self._plans[key] = plan
+        return plan
+
+    def process(self, block: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Resample the next block of mono float32 input
+
+        Returns a view into an internal buffer that is overwritten by the
+        next call (copy it, or pass `out`, if it must be kept).
+        """
+        if self.up == self.down:
+            return block
+        if len(block) > self.max_block:
+            parts = [self.process(block[i:i + self.max_block]).copy()
+                     for i in range(0, len(block), self.max_block)]
+            return np.concatenate(parts)
+
+        history = self.taps - 1
+        count = len(block)
+        self._work[history:history + count] = block
+        offset = self._out_pos * self.down - self._in_pos * self.up
+        indices, rows = self._plan(count, offset)
+        produced = len(indices)
+
+        gather = self._gather[:produced]
+        np.take(self._work, indices, out=gather)
+        result = self._out[:produced] if out is None else out[:produced]
+        np.einsum('ij,ij->i', gather, rows, out=result)
+
+        # Slide the newest samples into the history slot for the next block
+        self._work[:history] = self._work[count:count + history]
+        self._in_pos += count
+        self._out_pos += produced
+        # Keep the counters small; only their relation matters
+        periods = min(self._in_pos // self.down, self._out_pos // self.up)
+        self._in_pos -= periods * self.down
+        self._out_pos -= periods * self.up
+        return result
+
+
+def resample(samples: np.ndarray, in_rate: int, out_rate: int = TARGET_RATE) -> np.ndarray:
+    """Resample a whole recording in one go"""
+    if int(in_rate) == int(out_rate) or not len(samples):
+        return np.asarray(samples, dtype=np.float32)
+    resampler = PolyphaseResampler(in_rate, out_rate, max_block=min(len(samples), 1 << 16))
+    return resampler.process(to_mono_float32(samples)).copy()
@@ -0,0 +1,174 @@
+import re
+import threading
+from typing import Callable, Dict, List, Optional
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+MESSAGE_OVERHEAD = 4  # role and separators around each chat message
+_encoding = None
+
+
+def _get_encoding():
+    """tiktoken's encoding, loaded on first use (it may download its vocabulary)"""
+    global _encoding, TIKTOKEN_AVAILABLE
+    if _encoding is None and TIKTOKEN_AVAILABLE:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"tiktoken unavailable, estimating tokens: {str(e)}")
+            TIKTOKEN_AVAILABLE = False
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Tokens in text: exact with tiktoken, otherwise OpenAI's ~4 characters per token"""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def message_tokens(message: Dict) -> int:
+    return count_tokens(message.get("content") or "") + MESSAGE_OVERHEAD
+
+
+def _truncate(text: str, budget: int) -> str:
+    """The end of text that fits in `budget` tokens"""
+    while text and count_tokens(text) > budget:
+        text = text[len(text) // 4 or 1:]
+        text = text[text.find(" ") + 1:] if " " in text else text
+    return text
+
+
+def extractive_summary(summary: str, turns: List[Dict], budget: int) -> str:
+    """Fallback summary: the previous one plus the first sentence of each folded turn"""
+    names = {"user": "User", "assistant": "Klaus"}
+    notes = []
+    for turn in turns:
+        first = re.split(r"(?<=[.!?])\s", (turn.get("content") or "").strip(), maxsplit=1)[0]
+        if first:
+            notes.append(f"{names.get(turn['role'], turn['role'])}: {first}")
+    return _truncate(" ".join(filter(None, [summary] + notes)), budget)
+
+
+class ContextWindow:
+    def __init__(self, system_prompt: str, budget: int = 3000,
+                 summarizer: Optional[Callable[[str, List[Dict]], str]] = None,
+                 summary_budget: int = 250):
+        """
+        Chat history that fits a token budget, older turns folded into a rolling summary
+
+        prompt() returns the system prompt, the summary and as many of the
+        newest turns as fit in `budget` tokens. Turns that no longer fit are
+        summarised on a background thread; until that finishes they are just
+        left out, so building a prompt never waits on the summariser and its
+        size stays bounded however long the session runs.
+
+        Args:
+            system_prompt: First message of every prompt
+            budget: Most prompt tokens (the reply's max_tokens come on top)
+            summarizer: summarizer(previous_summary, turns) -> new summary, e.g. an
+                LLM call; falls back to extractive_summary() when missing or failing
+            summary_budget: Most tokens the summary may take, at most a quarter of budget
+        """
+        self.system_prompt = system_prompt
+        self.budget = budget
+        self.summarizer = summarizer
+        self.summary_budget = min(summary_budget, budget // 4)
+        self.summary = ""
+        self.turns: List[Dict] = []
+        self.folds = 0
+        self._generation = 0  # bumped by clear() so a fold in flight doesn't apply
+        self._lock = threading.Lock()
+        self._folding: Optional[threading.Thread] = None
+
+    def add(self, role: str, content: str):
+        with self._lock:
+            self.turns.append({"role": role, "content": content})
+            self._fit()
+
+    def extend(self, messages: List[Dict]):
+        """Append earlier conversation (system messages are dropped; the prompt has its own)"""
+        with self._lock:
+            self.turns.extend({"role": m["role"], "content": m["content"]}
+                              for m in messages if m.get("role") != "system")
+            self._fit()
+
+    def clear(self):
+        with self._lock:
+            self.turns = []
+            self.summary = ""
+            self._generation += 1
+
+    def _header(self) -> List[Dict]:
+        header = [{"role": "system", "content": self.system_prompt}]
+        if self.summary:
+            header.append({"role": "system", "content": f"Summary of the conversation so far: {self.summary}"})
+        return header
+
+    def _fit(self, reserve: int = 0) -> List[Dict]:
+        """Newest turns within budget after `reserve` tokens (with none, the latest always); schedules folding of the rest"""
+        used = reserve + sum(message_tokens(m) for m in self._header())
+        kept = 0
+        for turn in reversed(self.turns):
+            cost = message_tokens(turn)
+            if (kept or reserve) and used + cost > self.budget:
+                break
+            used += cost
+            kept += 1
+        overflow = len(self.turns) - kept
+        if overflow and self._folding is None:
+            self._folding = threading.Thread(target=self._fold,
+                                             args=(self.summary, self.turns[:overflow], self._generation),
+                                             name="context-fold", daemon=True)
+            self._folding.start()
+        return self.turns[overflow:]
+
+    def prompt(self, pending: Optional[List[Dict]] = None) -> List[Dict]:
+        """
+        Messages to send: system prompt, summary, newest turns
+
+        Args:
+            pending: Messages to end with that aren't history yet (a question
+                whose reply may be abandoned); they count against the budget
+        """
+        pending = [dict(m) for m in pending or []]
+        with self._lock:
+            turns = self._fit(sum(message_tokens(m) for m in pending))
+            return self._header() + [dict(turn) for turn in turns] + pending
+
+    def tokens(self) -> int:
+        return sum(message_tokens(m) for m in self.prompt())
+
+    def _fold(self, summary: str, turns: List[Dict], generation: int):
+        new_summary = None
+        if self.summarizer is not None:
+            try:
+                new_summary = self.summarizer(summary, turns)
+            except Exception as e:
+                print(f"Context summary failed, keeping notes instead: {str(e)}")
+        if not new_summary:
+            new_summary = extractive_summary(summary, turns, self.summary_budget)
+        with self._lock:
+            self._folding = None
+            if generation == self._generation:
+                self.summary = _truncate(new_summary.strip(), self.summary_budget)
+                # Only this thread removes turns, so the oldest ones are still the ones folded
+                del self.turns[:len(turns)]
+                self.folds += 1
+            self._fit()  # a long summary or new turns may already need another fold
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Wait for background summarisation to finish; True if nothing is pending"""
+        while True:
+            with self._lock:
+                folding = self._folding
+            if folding is None:
+                return True
+            folding.join(timeout)
+            if folding.is_alive():
+                return False
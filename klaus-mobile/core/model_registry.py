@@ -0,0 +1,195 @@
+import gc
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+
+def current_rss_mb() -> Optional[float]:
+    """Resident set size of this process in MB, None if it can't be measured"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+INT8_SUFFIX = "-int8"  # registry name suffix for a dynamically quantized model, e.g. "tiny-int8"
+
+
+def int8_supported() -> bool:
+    """True if torch can run int8 dynamically quantized Linear layers on this CPU"""
+    try:
+        import torch
+    except ImportError:
+        return False
+    if torch.cuda.is_available():
+        return False  # GPUs are better served by fp16
+    return any(engine in torch.backends.quantized.supported_engines
+               for engine in ("x86", "fbgemm", "qnnpack"))
+
+
+def quantize_int8(model):
+    """
+    Swap a Whisper model's Linear layers for int8 dynamically quantized ones, in place
+
+    The attention and MLP projections hold most of the weights and compute;
+    they keep int8 weights and quantize activations on the fly. Convolutions,
+    embeddings and layer norms stay float32.
+    """
+    import torch
+    engines = torch.backends.quantized.supported_engines
+    if torch.backends.quantized.engine not in engines or torch.backends.quantized.engine == "none":
+        # Some ARM builds ship qnnpack without selecting it
+        torch.backends.quantized.engine = next(e for e in ("x86", "fbgemm", "qnnpack") if e in engines)
+    # Whisper's Linear subclass (it casts weights for fp16) isn't recognised by the quantizer
+    for parent in list(model.modules()):
+        for child_name, child in list(parent.named_children()):
+            if isinstance(child, torch.nn.Linear) and type(child) is not torch.nn.Linear:
+                plain = torch.nn.Linear(child.in_features, child.out_features,
+                                        bias=child.bias is not None, device="meta")
+                plain.weight, plain.bias = child.weight, child.bias
+                setattr(parent, child_name, plain)
+    # In place, so the float weights are dropped as each layer is swapped rather than kept alongside
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def _load_whisper(name: str):
+    from whisper import load_model
+    if not name.endswith(INT8_SUFFIX):
+        return load_model(name)
+    base = name[:-len(INT8_SUFFIX)]
+    try:
+        return quantize_int8(load_model(base, device="cpu"))
+    except Exception as e:
+        print(f"int8 quantization of {base} failed, using float32: {str(e)}")
+        return load_model(base, device="cpu")
+
+
+class _Entry:
+    def __init__(self):
+        self.model = None
+        self.lock = threading.Lock()
+        self.last_used = 0.0
+
+
+class ModelRegistry:
+    def __init__(self, loader: Callable = _load_whisper, idle_timeout: float = 600,
+                 memory_watermark_mb: Optional[float] = None, check_interval: float = 30):
+        """
+        Process-wide cache of ASR models
+
+        Each model is loaded once and shared by every VoiceEngine in the
+        process. Models that have not been used for idle_timeout seconds, or
+        the least recently used ones while RSS is above the watermark, are
+        dropped and reloaded on next use.
+
+        Args:
+            loader: Function that loads a model by name
+            idle_timeout: Seconds of disuse before a model is unloaded (0 disables)
+            memory_watermark_mb: Unload models while RSS exceeds this many MB
+            check_interval: Seconds between eviction checks
+        """
+        self.loader = loader
+        self.idle_timeout = idle_timeout
+        self.memory_watermark_mb = memory_watermark_mb
+        self.check_interval = check_interval
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    def _entry(self, name: str) -> _Entry:
+        with self._lock:
+            if name not in self._entries:
+                self._entries[name] = _Entry()
+            return self._entries[name]
+
+    def get(self, name: str):
+        """Return the named model, loading it (or waiting for a preload) if needed"""
+        entry = self._entry(name)
+        with entry.lock:
+            if entry.model is None:
+                start = time.monotonic()
+                print(f"Loading {name} speech model...")
+                entry.model = self.loader(name)
+                print(f"Loaded {name} speech model in {time.monotonic() - start:.1f}s")
+                self._start_reaper()
+            entry.last_used = time.monotonic()
+            return entry.model
+
+    def preload(self, name: str) -> threading.Thread:
+        """Load a model in a background thread so the first listen() doesn't wait"""
+        def warm_up():
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"Model preload failed: {str(e)}")
+
+        thread = threading.Thread(target=warm_up, daemon=True)
+        thread.start()
+        return thread
+
+    def is_loaded(self, name: str) -> bool:
+        entry = self._entries.get(name)
+        return entry is not None and entry.model is not None
+
+    def evict(self, name: str) -> bool:
+        """Drop a model unless it is being loaded right now"""
+        entry = self._entries.get(name)
+        if entry is None or not entry.lock.acquire(blocking=False):
+            return False
+        try:
+            if entry.model is None:
+                return False
+            entry.model = None
+        finally:
+            entry.lock.release()
+        gc.collect()
+        print(f"Unloaded {name} speech model")
+        return True
+
+    def _start_reaper(self):
+        with self._lock:
+            if self._reaper is None and (self.idle_timeout or self.memory_watermark_mb):
+                self._reaper = threading.Thread(target=self._reap, daemon=True)
+                self._reaper.start()
+
+    def _reap(self):
+        """Background eviction of idle models and memory pressure relief"""
+        while True:
+            time.sleep(self.check_interval)
+            now = time.monotonic()
+            loaded = sorted(
+                (entry.last_used, name) for name, entry in list(self._entries.items())
+                if entry.model is not None
+            )
+
+            if self.idle_timeout:
+                for last_used, name in loaded:
+                    if now - last_used > self.idle_timeout:
+                        self.evict(name)
+
+            if self.memory_watermark_mb:
+                for _, name in loaded:
+                    rss = current_rss_mb()
+                    if rss is None or rss <= self.memory_watermark_mb:
+                        break
+                    self.evict(name)
+
+
+def _env_float(name: str, default: Optional[float]) -> Optional[float]:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+# Shared by every VoiceEngine in the process
+registry = ModelRegistry(
+    idle_timeout=_env_float("KLAUS_MODEL_IDLE_TIMEOUT", 600),
+    memory_watermark_mb=_env_float("KLAUS_MODEL_MEMORY_MB", None)
+)
@@ -10,37 +10,61 @@ class Skills:
         self.gps_enabled = False
         self.gps_data = {}
         
+    def route(self, command: str) -> str:
+        """Name of the skill handle_command() would run for this text ("" for none), without running it"""
+        command = command.lower()
+        if "time" in command:
+            return "time"
+        if "date" in command or "today" in command:
+            return "date"
+        if "open youtube" in command:
+            return "youtube"
+        if "search for" in command:
+            return "search"
+        if "location" in command or "where am i" in command:
+            return "location"
+        if "battery" in command:
+            return "battery"
+        if "notify me" in command:
+            return "notify"
+        return ""
+
     def handle_command(self, command: str) -> str:
         command = command.lower()
+        skill = self.route(command)
         
         # Time
-        if "time" in command:
+        if skill == "time":
             return datetime.datetime.now().strftime("It's %I:%M %p")
         
         # Date
-        if "date" in command or "today" in command:
+        if skill == "date":
             return datetime.datetime.now().strftime("Today is %A, %B %d")
         
         # Web
-        if "open youtube" in command:
+        if skill == "youtube":
             webbrowser.open("https://youtube.com")
             return "Opening YouTube"
         
-        if "search for" in command:
+        if skill == "search":
             query = command.split("search for")[-1].strip()
             webbrowser.open(f"https://google.com/search?q={query}")
             return f"Searching for {query}"
         
         # Location
-        if "location" in command or "where am i" in command:
+        if skill == "location":
             return "Location services not implemented"
         
         # Device info
-        if "battery" in command:
+        if skill == "battery":
             return "Battery info not available"
         
         # Notifications
-        if "notify me" in command:
+        if skill == "notify":
             return "Notification system not implemented"
         
-        return ""
\ No newline at end of file
+        return ""
+
+    def matches(self, command: str) -> bool:
+        """True if handle_command() would route this text to a skill (no side effects)"""
+        return bool(self.route(command))
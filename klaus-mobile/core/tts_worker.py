@@ -0,0 +1,126 @@
+import itertools
+import queue
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 9
+
+
+@dataclass(order=True)
+class Utterance:
+    priority: int
+    seq: int
+    text: Optional[str] = field(compare=False)
+    future: Future = field(compare=False, default_factory=Future)
+
+
+class TTSWorker:
+    def __init__(self, engine_factory: Callable, name: str = "tts-worker"):
+        """
+        Owns the pyttsx3 engine on a dedicated thread
+
+        pyttsx3 engines are not thread-safe, so the engine is created and
+        driven only from the worker thread. Other threads queue utterances
+        with say() and get a Future that resolves to True when the text was
+        spoken in full, or False if it was interrupted or failed. Cancel a
+        queued utterance with future.cancel() or cancel(); interrupt() stops
+        the one playing.
+
+        Args:
+            engine_factory: Creates and configures the TTS engine (runs on the worker thread)
+            name: Worker thread name
+        """
+        self._factory = engine_factory
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._ready = threading.Event()
+        self._interrupted = False
+        self.speaking = threading.Event()
+        self.current: Optional[Utterance] = None
+        self.engine = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Wait for engine initialisation; True if it finished in time"""
+        return self._ready.wait(timeout)
+
+    def say(self, text: str, priority: int = PRIORITY_NORMAL) -> Future:
+        """Queue text for speech; lower priority values are spoken first"""
+        utterance = Utterance(priority, next(self._seq), text)
+        self._queue.put(utterance)
+        return utterance.future
+
+    def cancel(self, future: Future):
+        """Drop a queued utterance, or stop it if it is already playing"""
+        if not future.cancel():
+            current = self.current
+            if current is not None and current.future is future:
+                self.interrupt()
+
+    def interrupt(self):
+        """Stop the utterance currently playing"""
+        if self.speaking.is_set():
+            self._interrupted = True
+
+    def cancel_all(self):
+        """Drop everything queued and stop the current utterance"""
+        while True:
+            try:
+                utterance = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if utterance.text is None:
+                # Keep a pending shutdown request
+                self._queue.put(utterance)
+                break
+            utterance.future.cancel()
+        self.interrupt()
+
+    def shutdown(self, wait: bool = True):
+        self.cancel_all()
+        self._queue.put(Utterance(-1, next(self._seq), None))
+        if wait:
+            self._thread.join(timeout=5)
+
+    def _on_word(self, name, location, length):
+        # Called by pyttsx3 on the worker thread, the only safe place to stop it
+        if self._interrupted:
+            self.engine.stop()
+
+    def _run(self):
+        try:
+            self.engine = self._factory()
+            self.engine.connect('started-word', self._on_word)
+        except Exception as e:
+            print(f"TTS initialization failed: {str(e)}")
+            self.engine = None
+        self._ready.set()
+
+        while True:
+            utterance = self._queue.get()
+            if utterance.text is None:
+                break
+            if not utterance.future.set_running_or_notify_cancel():
+                continue
+            if self.engine is None:
+                utterance.future.set_result(False)
+                continue
+
+            self._interrupted = False
+            self.current = utterance
+            self.speaking.set()
+            try:
+                self.engine.say(utterance.text)
+                self.engine.runAndWait()
+                utterance.future.set_result(not self._interrupted)
+            except Exception as e:
+                print(f"Speech synthesis failed: {str(e)}")
+                utterance.future.set_result(False)
+            finally:
+                self.speaking.clear()
+                self.current = None
@@ -3,7 +3,12 @@ import numpy as np
 import pyttsx3
 import threading
 from .utils import is_android
-from typing import Tuple, Optional
+from .audio_capture import StreamingCapture, STREAMING_AVAILABLE, default_input_rate
+from .audio_frames import TARGET_RATE, resample, to_mono_float32
+from .model_registry import int8_supported, registry as model_registry
+from .asr_backends import CascadeBackend, default_offline_backend
+from .tts_worker import TTSWorker
+from typing import Callable, Tuple, Optional
 
 try:
     import sounddevice as sd
@@ -13,38 +18,60 @@ except ImportError:
     OFFLINE_ENABLED = False
 
 class VoiceEngine:
-    def __init__(self, use_offline=True, energy_threshold=4000):
+    def __init__(self, use_offline=True, energy_threshold=4000, streaming=True, trailing_silence=0.8,
+                 cascade=False, transcript_check: Optional[Callable[[str], bool]] = None):
+        """
+        Args:
+            cascade: Decode with tiny and re-decode with base only when tiny looks wrong
+            transcript_check: In cascade mode, text it rejects is re-decoded (e.g. Skills.matches)
+        """
         self.use_offline = use_offline
+        self.cascade = cascade
+        self.transcript_check = transcript_check
         self.energy_threshold = energy_threshold
+        self.streaming = streaming and STREAMING_AVAILABLE
+        self.trailing_silence = trailing_silence
         self._init_tts()
         self._init_recognition()
         
     def _init_tts(self):
-        try:
-            self.engine = pyttsx3.init()
-            self.engine.setProperty('rate', 160)
-            voices = self.engine.getProperty('voices')
-            
-            # Voice selection
-            for voice in voices:
-                if 'english' in voice.id.lower():
-                    self.engine.setProperty('voice', voice.id)
-                    break
-        except:
-            self.engine = None
+        # One worker thread owns the engine; pyttsx3 is not thread-safe
+        self.tts = TTSWorker(self._create_tts_engine)
+
+    def _create_tts_engine(self):
+        engine = pyttsx3.init()
+        engine.setProperty('rate', 160)
+        voices = engine.getProperty('voices')
+        
+        # Voice selection
+        for voice in voices:
+            if 'english' in voice.id.lower():
+                engine.setProperty('voice', voice.id)
+                break
+        return engine
+
+    @property
+    def engine(self):
+        return self.tts.engine
     
     def _init_recognition(self):
         if self.use_offline and OFFLINE_ENABLED:
-            try:
-                import whisper
-                self.model = whisper.load_model("tiny")
-            except:
-                self.use_offline = False
-    
-    def listen(self, timeout=5) -> Tuple[bool, str]:
+            # int8 weights are much faster than float32 on ARM CPUs
+            if self.cascade:
+                self.asr = CascadeBackend(("tiny", "base"), accept=self.transcript_check,
+                                          int8=int8_supported())
+                first = self.asr.stages[0]
+            else:
+                self.asr = first = default_offline_backend("tiny")
+            # Load off the UI thread; listen() waits for it if it isn't ready yet
+            model_registry.preload(first.model_name)
+        else:
+            self.use_offline = False
+
+    def listen(self, timeout=5, phrase_time_limit=10) -> Tuple[bool, str]:
         try:
             if self.use_offline:
-                return self._listen_offline(timeout)
+                return self._listen_offline(timeout, phrase_time_limit)
             return self._listen_online(timeout)
         except Exception as e:
             print(f"Listen error: {str(e)}")
@@ -64,29 +91,29 @@ class VoiceEngine:
         except:
             return self._listen_offline(timeout)
     
-    def _listen_offline(self, timeout) -> Tuple[bool, str]:
+    def _listen_offline(self, timeout, phrase_time_limit=10) -> Tuple[bool, str]:
         try:
-            fs = 16000
-            recording = sd.rec(int(timeout * fs), 
-                              samplerate=fs, 
-                              channels=1, 
-                              blocking=True)
-            
-            audio = np.array(recording, dtype=np.float32).flatten()
-            result = self.model.transcribe(audio)
-            return True, result["text"].lower()
+            # Open the mic at its native rate (often 44.1/48 kHz) and resample once
+            fs = int(default_input_rate() or TARGET_RATE)
+            if self.streaming:
+                with StreamingCapture(trailing_silence=self.trailing_silence, device_rate=fs) as capture:
+                    audio = capture.capture_utterance(timeout, phrase_time_limit)
+                if audio is None:
+                    return False, ""
+            else:
+                recording = sd.rec(int(timeout * fs), 
+                                  samplerate=fs, 
+                                  channels=1, 
+                                  dtype='float32',
+                                  blocking=True)
+                audio = resample(to_mono_float32(recording), fs)
+            return True, self.asr.transcribe(audio).lower()
         except Exception as e:
             return False, f"Offline error: {str(e)}"
     
     def speak(self, text: str):
-        if not self.engine:
-            return
-            
-        def speak_thread():
-            try:
-                self.engine.say(text)
-                self.engine.runAndWait()
-            except:
-                pass
-                
-        threading.Thread(target=speak_thread, daemon=True).start()
\ No newline at end of file
+        """Queue text on the TTS worker; returns a Future that resolves when it has been spoken"""
+        return self.tts.say(text)
+
+    def stop_speaking(self):
+        self.tts.cancel_all()
@@ -67,9 +67,10 @@ Builder.load_string('''
 class KlausMobile(BoxLayout):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.voice = VoiceEngine(use_offline=True)
-        self.ai = AICore()
         self.skills = Skills()
+        # Tiny model first; base only for utterances tiny gets wrong
+        self.voice = VoiceEngine(use_offline=True, cascade=True, transcript_check=self.skills.matches)
+        self.ai = AICore()
         self.listening = False
         self.update_chat("Klaus Mobile initialized\nTap mic to speak")
     
@@ -1,58 +1,369 @@
-import openai
-import os
 from dotenv import load_dotenv
 from datetime import datetime
-import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from llm_client import LLMClient, LLMError
+from context_window import ContextWindow
+from response_cache import ResponseCache, fingerprint, refers_back
 
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
 
-class AICore:
+# Words ending in a period that don't end a sentence
+ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "prof", "st", "vs", "etc", "e.g", "i.e", "approx", "no"}
+SENTENCE_END = re.compile(r'([.!?]+["\')\]]*|\n+)\s')
+SYSTEM_PROMPT = (
+    "You are Klaus, an advanced AI assistant. Your personality is helpful, precise, "
+    "and efficient. Respond concisely but naturally. Today's date is {date}. "
+    "You have access to various skills. When asked to perform tasks, "
+    "use the available functions or provide helpful information."
+)
+# Replies given in place of the model's when a request fails
+ERROR_REPLY = "Sorry, I encountered an error: "
+UNEXPECTED_REPLY = "An unexpected error occurred: "
+BUSY_REPLY = "Sorry, I'm still working on your earlier requests."
+DEFAULT_SESSION = "default"
+SUMMARY_PROMPT = (
+    "Condense this conversation between a user and Klaus, a voice assistant, into a few "
+    "sentences. Keep names, facts, preferences and open requests; drop small talk. "
+    "Reply with the summary only."
+)
+
+def is_error_reply(text):
+    return text.startswith((ERROR_REPLY, UNEXPECTED_REPLY, BUSY_REPLY))
+
+def iter_sentences(chunks):
+    """
+    Regroup streamed text chunks into whole sentences
+    
+    A sentence is released as soon as its closing punctuation is followed by
+    whitespace, so the first one is ready long before the reply finishes.
+    """
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        start = 0
+        for match in SENTENCE_END.finditer(buffer):
+            words = buffer[start:match.start() + 1].split()
+            last_word = words[-1].rstrip('.').lower() if words else ""
+            if match.group(1).startswith('.') and last_word in ABBREVIATIONS:
+                continue
+            sentence = buffer[start:match.end()].strip()
+            if sentence:
+                yield sentence
+            start = match.end()
+        buffer = buffer[start:]
+    if buffer.strip():
+        yield buffer.strip()
+
+class CancelToken:
+    """Cancels a request from another thread; callbacks registered with on_cancel run once"""
     def __init__(self):
-        self.context = self.load_context()
-        self.max_history = 20  # Maintain last 20 exchanges
+        self._cancelled = False
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def set(self):
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def is_set(self):
+        return self._cancelled
+
+    def on_cancel(self, callback):
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+class Session:
+    def __init__(self, session_id, window, max_in_flight=1):
+        """
+        One conversation: its history and how many requests it may have running
+
+        Args:
+            session_id: Caller's name for the conversation (user, device, ...)
+            window: The conversation's ContextWindow
+            max_in_flight: Requests allowed at once; with 1, turns run in arrival order
+        """
+        self.id = session_id
+        self.window = window
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.checkouts = 0  # requests holding or waiting for a slot (guarded by AICore._lock)
+        self.last_used = time.monotonic()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Take an in-flight slot; False if none came free within timeout seconds"""
+        if not self._slots.acquire(timeout=timeout):
+            return False
+        with self._lock:
+            self.in_flight += 1
+            self.last_used = time.monotonic()
+        return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self.last_used = time.monotonic()
+        self._slots.release()
+
+    def releaser(self):
+        """release() for one acquired slot, safe to call more than once"""
+        once = threading.Lock()
+
+        def release():
+            if once.acquire(blocking=False):
+                self.release()
+        return release
+
+class AICore:
+    def __init__(self, client: LLMClient = None, prompt_budget: int = 3000, summary_budget: int = 250,
+                 cache: ResponseCache = None, max_in_flight: int = 1, max_sessions: int = 100,
+                 queue_timeout: float = 60.0):
+        """
+        Conversations with the LLM, any number of them at once
+
+        Each session (default: one shared by the whole app) has its own
+        context window and in-flight limit, so turns from different users or
+        devices never mix. Within a session an exchange is added to the
+        history in one step, once the reply is complete. The LLM client and
+        response cache are shared.
+
+        Args:
+            client: LLM connection, defaults to LLMClient() (OpenAI, or $OPENAI_BASE_URL)
+            prompt_budget: Most tokens of history sent with a query; older turns are summarised
+            summary_budget: Most tokens of that summary
+            cache: Replies to repeated questions, defaults to ResponseCache() (~/.cache/klaus)
+            max_in_flight: Requests a session may have running at once
+            max_sessions: Sessions kept; beyond that the least recently used one not in use is dropped
+            queue_timeout: Seconds a request waits for a slot before BUSY_REPLY
+        """
+        self.client = client or LLMClient(model="gpt-4-turbo")
+        self.cache = cache if cache is not None else ResponseCache()
+        self.prompt_budget = prompt_budget
+        self.summary_budget = summary_budget
+        self.max_in_flight = max_in_flight
+        self.max_sessions = max_sessions
+        self.queue_timeout = queue_timeout
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
         
-    def load_context(self):
-        """Initialize AI context with system prompt"""
-        return [
-            {
-                "role": "system", 
-                "content": (
-                    "You are Klaus, an advanced AI assistant. Your personality is helpful, precise, "
-                    "and efficient. Respond concisely but naturally. Today's date is "
-                    f"{datetime.now().strftime('%A, %B %d, %Y')}. "
-                    "You have access to various skills. When asked to perform tasks, "
-                    "use the available functions or provide helpful information."
-                )
-            }
-        ]
+    def system_prompt(self):
+        """Klaus's instructions, the first message of every request"""
+        return SYSTEM_PROMPT.format(date=datetime.now().strftime('%A, %B %d, %Y'))
+
+    def session(self, session_id=DEFAULT_SESSION):
+        """The session with this id, started on first use"""
+        with self._lock:
+            return self._session(session_id)
+
+    def _session(self, session_id):
+        """session() for a caller that holds _lock"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            window = ContextWindow(self.system_prompt(), self.prompt_budget, self._summarize,
+                                   self.summary_budget)
+            session = self._sessions[session_id] = Session(session_id, window, self.max_in_flight)
+            self._evict(keep=session_id)
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _checkout(self, session_id):
+        """The session with this id, safe from eviction until _checkin()"""
+        with self._lock:
+            session = self._session(session_id)
+            session.checkouts += 1
+            return session
+
+    def _checkin(self, session):
+        with self._lock:
+            session.checkouts -= 1
+
+    def _evict(self, keep):
+        """Drop least recently used sessions not checked out beyond max_sessions (caller holds _lock)"""
+        for session_id in list(self._sessions):
+            if len(self._sessions) <= self.max_sessions:
+                return
+            if session_id != keep and self._sessions[session_id].checkouts == 0:
+                del self._sessions[session_id]
+
+    def end_session(self, session_id):
+        """Forget a conversation"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def sessions(self):
+        with self._lock:
+            return list(self._sessions)
+
+    @property
+    def window(self):
+        """Context window of the default session"""
+        return self.session().window
+
+    @property
+    def context(self):
+        """Messages the default session's next request would send"""
+        return self.window.prompt()
+
+    def restore_history(self, messages, session_id=DEFAULT_SESSION):
+        """Continue an earlier conversation, e.g. from MemorySystem.get_recent_context()"""
+        session = self._checkout(session_id)
+        try:
+            session.window.extend(messages)
+        finally:
+            self._checkin(session)
+
+    def _summarize(self, summary, turns):
+        """Fold turns that left the prompt budget into the running summary (background thread)"""
+        transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+        return self.client.chat(
+            [{"role": "system", "content": SUMMARY_PROMPT},
+             {"role": "user", "content": f"Summary so far: {summary or 'none'}\n\nNew turns:\n{transcript}"}],
+            temperature=0.2,
+            max_tokens=self.summary_budget
+        )
+
+    def _cache_context(self, user_input, session):
+        """
+        What a cached reply to user_input must have been generated under
+
+        Self-contained questions share replies across conversations; one
+        that refers back ("why is that?") also keys on the session's last
+        exchange. The date in the system prompt is left out - time-sensitive
+        queries bypass the cache instead.
+        """
+        history = []
+        if refers_back(user_input):
+            history = [turn["content"] for turn in session.window.turns[-2:]]
+        return fingerprint(self.client.model, SYSTEM_PROMPT, history)
+
+    def _cached_reply(self, user_input, use_cache, session):
+        """(cached reply or None, context fingerprint or None when not caching)"""
+        if not use_cache:
+            self.cache.stats.count("bypassed")
+            return None, None
+        context = self._cache_context(user_input, session)
+        return self.cache.get(user_input, context), context
+
+    def cache_metrics(self):
+        return {**self.cache.stats.summary(), "entries": len(self.cache)}
+
+    def close(self):
+        """Persist cached replies"""
+        self.cache.save()
+
+    def _remember_reply(self, session, user_input, ai_reply):
+        """Add the exchange to the session's history in one step, once the reply is complete"""
+        session.window.extend([{"role": "user", "content": user_input},
+                               {"role": "assistant", "content": ai_reply}])
     
-    def process_query(self, user_input):
-        """Process user input through AI model"""
-        # Add user input to context
-        self.context.append({"role": "user", "content": user_input})
-        
+    def stream_query(self, user_input, use_cache=True, cancel=None, session_id=DEFAULT_SESSION):
+        """
+        Process user input, yielding the reply in chunks as the model generates it
+
+        The exchange only enters the conversation once the reply is complete,
+        so a cancelled or failed request leaves no trace in later prompts.
+
+        Args:
+            user_input: What the user said
+            use_cache: False to always ask the model (answers that must be fresh)
+            cancel: CancelToken that stops generation and closes the connection. The
+                session's slot is given back at once, without waiting for the reply's
+                first bytes, so a cancelled request never holds up the next one
+            session_id: Conversation the input belongs to
+        """
+        session = self._checkout(session_id)
         try:
-            # Use gpt-4-turbo for best results
-            response = openai.ChatCompletion.create(
-                model="gpt-4-turbo",
-                messages=self.context,
-                temperature=0.7,
-                max_tokens=300
-            )
+            yield from self._stream_reply(session, user_input, use_cache, cancel)
+        finally:
+            self._checkin(session)
+
+    def _stream_reply(self, session, user_input, use_cache, cancel):
+        if not session.acquire(self.queue_timeout):
+            yield BUSY_REPLY
+            return
+        release = session.releaser()
+        if cancel is not None:
+            cancel.on_cancel(release)
+        try:
+            cached, context = self._cached_reply(user_input, use_cache, session)
+            if cached is not None:
+                yield cached
+                if cancel is None or not cancel.is_set():
+                    self._remember_reply(session, user_input, cached)
+                return
             
-            ai_reply = response.choices[0].message['content']
+            parts = []
+            question = {"role": "user", "content": user_input}
+            stream = self.client.stream_chat(session.window.prompt([question]), temperature=0.7, max_tokens=300)
+            try:
+                for text in stream:
+                    if cancel is not None and cancel.is_set():
+                        return
+                    parts.append(text)
+                    yield text
+                        
+            except LLMError as e:
+                yield f"{ERROR_REPLY}{str(e)}"
+                return
+            except Exception as e:
+                yield f"{UNEXPECTED_REPLY}{str(e)}"
+                return
+            finally:
+                stream.close()
             
-            # Add AI response to context
-            self.context.append({"role": "assistant", "content": ai_reply})
+            if cancel is not None and cancel.is_set():
+                return
+            ai_reply = "".join(parts)
+            self._remember_reply(session, user_input, ai_reply)
+            if context is not None:
+                self.cache.put(user_input, ai_reply, context)
+        finally:
+            release()
+    
+    def stream_sentences(self, user_input, use_cache=True, session_id=DEFAULT_SESSION):
+        """Process user input, yielding each sentence of the reply as soon as it is complete"""
+        return iter_sentences(self.stream_query(user_input, use_cache, session_id=session_id))
+    
+    def process_query(self, user_input, use_cache=True, session_id=DEFAULT_SESSION):
+        """Process user input through AI model (or the response cache)"""
+        session = self._checkout(session_id)
+        try:
+            return self._reply(session, user_input, use_cache)
+        finally:
+            self._checkin(session)
+
+    def _reply(self, session, user_input, use_cache):
+        if not session.acquire(self.queue_timeout):
+            return BUSY_REPLY
+        try:
+            cached, context = self._cached_reply(user_input, use_cache, session)
+            if cached is not None:
+                self._remember_reply(session, user_input, cached)
+                return cached
             
-            # Maintain context size
-            if len(self.context) > self.max_history:
-                self.context = [self.context[0]] + self.context[-self.max_history+1:]
-                
+            # Use gpt-4-turbo for best results
+            question = {"role": "user", "content": user_input}
+            ai_reply = self.client.chat(session.window.prompt([question]), temperature=0.7, max_tokens=300)
+            self._remember_reply(session, user_input, ai_reply)
+            if context is not None:
+                self.cache.put(user_input, ai_reply, context)
             return ai_reply
             
-        except openai.error.OpenAIError as e:
-            return f"Sorry, I encountered an error: {str(e)}"
+        except LLMError as e:
+            return f"{ERROR_REPLY}{str(e)}"
         except Exception as e:
-            return f"An unexpected error occurred: {str(e)}"
\ No newline at end of file
+            return f"{UNEXPECTED_REPLY}{str(e)}"
+        finally:
+            session.release()
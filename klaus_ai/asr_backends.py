@@ -0,0 +1,312 @@
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Optional, Union
+import numpy as np
+from model_registry import INT8_SUFFIX, int8_supported, registry as model_registry
+from decode_profiles import DecodeProfile, DecodeStats, get_profile
+from weights_cache import mmap_supported
+
+SAMPLE_RATE = 16000
+
+
+@dataclass
+class Transcript:
+    """Recognised text with Whisper's confidence signals for it"""
+    text: str
+    avg_logprob: float = 0.0
+    no_speech_prob: float = 0.0
+    compression_ratio: float = 1.0
+
+
+class ASRBackend:
+    """Speech recognition engine: 16 kHz mono float32 audio in, text out"""
+    name = "asr"
+    mel_bins: Optional[int] = None  # set when transcribe_mel() takes features.FeatureCache output
+
+    def load(self):
+        """Load models up front (otherwise the first transcribe() pays for it)"""
+
+    def transcribe(self, audio: np.ndarray) -> str:
+        raise NotImplementedError
+
+    def transcribe_mel(self, mel: np.ndarray) -> str:
+        """Decode from precomputed, Whisper-normalised log-mel frames (n_mels, frames)"""
+        raise NotImplementedError
+
+    def record_decode(self, key: str, seconds: float, audio_seconds: float, fallbacks: int = 0):
+        """Add a decode to the timing stats kept per profile (or per model)"""
+        if not hasattr(self, "stats"):
+            self.stats: Dict[str, DecodeStats] = {}
+        self.stats.setdefault(key, DecodeStats()).record(seconds, audio_seconds, fallbacks)
+
+
+class WhisperBackend(ASRBackend):
+    def __init__(self, model_name: str = "base", profile: Union[str, DecodeProfile] = "command",
+                 **decode_options):
+        """
+        Local Whisper model, shared through the model registry
+
+        Args:
+            model_name: Whisper model size ("tiny", "base", "small", ...)
+            profile: Decode profile name or instance (see decode_profiles.DECODE_PROFILES)
+            decode_options: model.transcribe() arguments that override the profile
+        """
+        self.model_name = model_name
+        self.profile = get_profile(profile)
+        self.decode_options = decode_options
+        self.name = f"whisper-{model_name}"
+
+    @property
+    def model(self):
+        return model_registry.get(self.model_name)
+
+    def load(self):
+        model_registry.get(self.model_name)
+
+    @property
+    def mel_bins(self) -> int:
+        return 128 if self.model_name.startswith("large-v3") else 80
+
+    def _prepare(self):
+        """Model for the next decode, with the profile's thread count applied"""
+        model = self.model
+        if self.profile.threads:
+            import torch
+            if torch.get_num_threads() != self.profile.threads:
+                torch.set_num_threads(self.profile.threads)
+        return model
+
+    def recognize(self, audio: np.ndarray) -> Transcript:
+        """Transcribe with model.transcribe() and keep the confidence signals"""
+        model = self._prepare()
+        options = {**self.profile.transcribe_options(), **self.decode_options}
+        options.setdefault("fp16", model.device.type == "cuda")
+        start = time.perf_counter()
+        result = model.transcribe(audio, **options)
+        segments = result.get("segments", [])
+        fallbacks = sum(1 for seg in segments if seg.get("temperature", 0) > 0)
+        self.record_decode(self.profile.name, time.perf_counter() - start, len(audio) / SAMPLE_RATE, fallbacks)
+        if not segments:
+            return Transcript(result["text"].strip(), no_speech_prob=1.0)
+        return Transcript(
+            result["text"].strip(),
+            avg_logprob=float(np.mean([seg["avg_logprob"] for seg in segments])),
+            no_speech_prob=float(segments[0]["no_speech_prob"]),
+            compression_ratio=float(max(seg["compression_ratio"] for seg in segments))
+        )
+
+    def transcribe(self, audio: np.ndarray) -> str:
+        return self.recognize(audio).text
+
+    def recognize_mel(self, mel: np.ndarray) -> Transcript:
+        """
+        One 30 s window through whisper.decode with the profile's fallback policy
+
+        A window judged to be silence comes back with empty text.
+        """
+        import torch
+        import whisper
+        model = self._prepare()
+        profile = self.profile
+        frames = whisper.audio.N_FRAMES
+        audio_seconds = min(mel.shape[1], frames) / 100  # 10 ms frames
+        if mel.shape[1] < frames:
+            # Whisper pads with silence, which its normalisation maps to 2 below the peak
+            pad = np.full((mel.shape[0], frames - mel.shape[1]), mel.max() - 2.0, dtype=np.float32)
+            mel = np.concatenate((mel, pad), axis=1)
+        segment = torch.from_numpy(np.ascontiguousarray(mel[:, :frames])).to(model.device)
+
+        fields = whisper.DecodingOptions.__dataclass_fields__
+        overrides = {k: v for k, v in self.decode_options.items() if k in fields}
+        start = time.perf_counter()
+        fallbacks = -1
+        text = ""
+        for temperature in profile.temperatures:
+            fallbacks += 1
+            options = whisper.DecodingOptions(**{
+                "language": profile.language,
+                "temperature": temperature,
+                # Beam search at 0, sampling for the fallback temperatures
+                "beam_size": profile.beam_size if temperature == 0 else None,
+                "best_of": profile.best_of if temperature > 0 else None,
+                "without_timestamps": profile.without_timestamps,
+                "fp16": model.device.type == "cuda",
+                **overrides
+            })
+            result = whisper.decode(model, segment, options)
+            too_repetitive = (profile.compression_ratio_threshold is not None
+                              and result.compression_ratio > profile.compression_ratio_threshold)
+            too_unsure = (profile.logprob_threshold is not None
+                          and result.avg_logprob < profile.logprob_threshold)
+            if (profile.no_speech_threshold is not None and too_unsure
+                    and result.no_speech_prob > profile.no_speech_threshold):
+                break  # silence - retrying would only hallucinate
+            text = result.text.strip()
+            if not (too_repetitive or too_unsure):
+                break
+        self.record_decode(profile.name, time.perf_counter() - start, audio_seconds, fallbacks)
+        return Transcript(text, float(result.avg_logprob), float(result.no_speech_prob),
+                          float(result.compression_ratio))
+
+    def transcribe_mel(self, mel: np.ndarray) -> str:
+        """Decode a command-length utterance from cached features, skipping Whisper's own STFT"""
+        return self.recognize_mel(mel).text
+
+
+class QuantizedWhisperBackend(WhisperBackend):
+    def __init__(self, model_name: str = "tiny", profile: Union[str, DecodeProfile] = "command",
+                 **decode_options):
+        """
+        The same Whisper weights with int8 Linear layers, for CPU-only machines
+
+        Quantized once at load (model_registry.quantize_int8): a quarter of
+        the projection weight memory and faster CPU matrix multiplies, for a
+        small accuracy cost - compare with benchmark.py on your own audio.
+        The int8 weights are private to each process, unlike the float ones
+        mapped from weights_cache.
+        """
+        super().__init__(model_name + INT8_SUFFIX, profile, **decode_options)
+
+
+def default_offline_backend(model_name: str = "base",
+                            profile: Union[str, DecodeProfile] = "command") -> WhisperBackend:
+    """
+    Float32 Whisper mapped from the weights cache, so Klaus processes share its pages
+
+    Quantizing allocates the int8 weights anew in every process, so int8 is
+    only the default where torch can't map the float weights anyway. Ask for
+    "whisper-<size>-int8" when benchmark.py shows it wins on your machine.
+    """
+    if int8_supported() and not mmap_supported():
+        return QuantizedWhisperBackend(model_name, profile)
+    return WhisperBackend(model_name, profile)
+
+
+class CascadeBackend(ASRBackend):
+    def __init__(self, models: Iterable[str] = ("tiny", "base"),
+                 profile: Union[str, DecodeProfile] = "command",
+                 accept: Optional[Callable[[str], bool]] = None,
+                 min_logprob: float = -0.7, max_no_speech: float = 0.5,
+                 max_compression_ratio: float = 2.2, int8: bool = False):
+        """
+        Decode with the smallest model, escalate only when the result looks wrong
+
+        Every utterance goes to the first model. A larger model re-decodes it
+        when the transcript's average log-prob is low, it might be silence
+        but has text, it is repetitive (high compression ratio), or `accept`
+        rejects the text - e.g. Skills.matches, since a real command that
+        matches no skill is more often a misrecognition than a new request.
+
+        Args:
+            models: Whisper sizes from fastest to most accurate
+            profile: Decode profile for every stage
+            accept: Returns False for text that should be re-decoded
+            min_logprob: Escalate below this average token log-prob
+            max_no_speech: Escalate text whose no-speech probability is above this
+            max_compression_ratio: Escalate above this gzip compression ratio
+            int8: Run every stage with int8 weights (QuantizedWhisperBackend)
+        """
+        stage = QuantizedWhisperBackend if int8 else WhisperBackend
+        self.stages = [stage(name, profile) for name in models]
+        self.name = "cascade-" + "-".join(stage.model_name for stage in self.stages)
+        self.accept = accept
+        self.min_logprob = min_logprob
+        self.max_no_speech = max_no_speech
+        self.max_compression_ratio = max_compression_ratio
+        self.escalations = 0
+
+    @property
+    def profile(self) -> DecodeProfile:
+        return self.stages[0].profile
+
+    @profile.setter
+    def profile(self, profile: DecodeProfile):
+        for stage in self.stages:
+            stage.profile = profile
+
+    @property
+    def mel_bins(self) -> Optional[int]:
+        bins = {stage.mel_bins for stage in self.stages}
+        return bins.pop() if len(bins) == 1 else None
+
+    def load(self):
+        # Larger models load on first escalation, through the registry
+        self.stages[0].load()
+
+    def confident(self, transcript: Transcript) -> bool:
+        if transcript.no_speech_prob > self.max_no_speech:
+            return not transcript.text  # silence is fine, text over silence is suspect
+        if transcript.avg_logprob < self.min_logprob:
+            return False
+        if transcript.compression_ratio > self.max_compression_ratio:
+            return False
+        return self.accept is None or self.accept(transcript.text)
+
+    def _cascade(self, decode: Callable[[WhisperBackend], Transcript], audio_seconds: float) -> Transcript:
+        for i, stage in enumerate(self.stages):
+            start = time.perf_counter()
+            transcript = decode(stage)
+            self.record_decode(f"{stage.name}/{stage.profile.name}", time.perf_counter() - start, audio_seconds)
+            if i == len(self.stages) - 1 or self.confident(transcript):
+                return transcript
+            self.escalations += 1
+        return transcript
+
+    def recognize(self, audio: np.ndarray) -> Transcript:
+        return self._cascade(lambda stage: stage.recognize(audio), len(audio) / SAMPLE_RATE)
+
+    def transcribe(self, audio: np.ndarray) -> str:
+        return self.recognize(audio).text
+
+    def transcribe_mel(self, mel: np.ndarray) -> str:
+        return self._cascade(lambda stage: stage.recognize_mel(mel), mel.shape[1] / 100).text
+
+
+class GoogleBackend(ASRBackend):
+    name = "google"
+
+    def __init__(self, recognizer=None):
+        """
+        Google Web Speech API through speech_recognition
+
+        Raises sr.UnknownValueError / sr.RequestError like recognize_google does.
+        """
+        import speech_recognition as sr
+        self.sr = sr
+        self.recognizer = recognizer or sr.Recognizer()
+
+    def transcribe(self, audio: np.ndarray) -> str:
+        pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+        data = self.sr.AudioData(pcm.tobytes(), SAMPLE_RATE, 2)
+        return self.recognizer.recognize_google(data)
+
+
+BACKENDS: Dict[str, Callable[[], ASRBackend]] = {
+    "whisper-tiny": lambda: WhisperBackend("tiny"),
+    "whisper-base": lambda: WhisperBackend("base"),
+    "whisper-small": lambda: WhisperBackend("small"),
+    "whisper-tiny-int8": lambda: QuantizedWhisperBackend("tiny"),
+    "whisper-base-int8": lambda: QuantizedWhisperBackend("base"),
+    "cascade": CascadeBackend,
+    "google": GoogleBackend,
+}
+
+
+def register_backend(name: str, factory: Callable[[], ASRBackend]):
+    """Make a backend available to VoiceEngine and the benchmark by name"""
+    BACKENDS[name] = factory
+
+
+def create_backend(backend: Union[str, ASRBackend],
+                   profile: Union[str, DecodeProfile, None] = None) -> ASRBackend:
+    """Backend by name (or as given), switched to a decode profile if it supports them"""
+    if not isinstance(backend, ASRBackend):
+        if backend not in BACKENDS and backend.startswith("whisper-"):
+            # Any Whisper size, e.g. "whisper-medium" or "whisper-small-int8"
+            return create_backend(WhisperBackend(backend[len("whisper-"):]), profile)
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown ASR backend '{backend}' (available: {', '.join(BACKENDS)})")
+        backend = BACKENDS[backend]()
+    if profile is not None and hasattr(backend, "profile"):
+        backend.profile = get_profile(profile)
+    return backend
@@ -0,0 +1,292 @@
+import atexit
+import multiprocessing
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Callable, Optional, Union
+import numpy as np
+from audio_capture import RingBuffer
+from asr_backends import ASRBackend, SAMPLE_RATE, create_backend
+from decode_profiles import DecodeProfile, get_profile
+
+_HEADER_BYTES = 64  # write position, padded to a cache line ahead of the samples
+_READY = 0          # request id of the worker's startup reply
+
+
+class SharedRingBuffer(RingBuffer):
+    def __init__(self, capacity: int, name: Optional[str] = None):
+        """
+        RingBuffer in shared memory, written by this process and read in place by a worker
+
+        The write position lives in the shared block too, so the reader
+        sees how much audio has arrived without any messages. Only one
+        process may write.
+
+        Args:
+            capacity: Samples held
+            name: Attach to an existing buffer by its shared memory name instead of creating one
+        """
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=_HEADER_BYTES + capacity * 4)
+        else:
+            # Workers are spawned from the owner and share its resource tracker, which
+            # only forgets the block when the owner unlinks it
+            self.shm = shared_memory.SharedMemory(name=name)
+        self._header = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf)
+        super().__init__(capacity, np.ndarray((capacity,), dtype=np.float32,
+                                              buffer=self.shm.buf, offset=_HEADER_BYTES))
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def total_written(self) -> int:
+        return int(self._header[0])
+
+    @total_written.setter
+    def total_written(self, value: int):
+        # Readers never move the write position: attaching (RingBuffer.__init__ sets it
+        # to 0) while the owner is capturing must not clobber it
+        if self.owner:
+            self._header[0] = value
+
+    def view(self, start: int, end: int) -> np.ndarray:
+        """Samples in [start, end) without copying, unless the span wraps around the end"""
+        start = max(start, self.oldest())
+        end = min(end, self.total_written)
+        if end <= start:
+            return np.zeros(0, dtype=np.float32)
+        first = start % self.capacity
+        if first + (end - start) <= self.capacity:
+            return self._data[first:first + (end - start)]
+        return self.read(start, end)
+
+    def release(self):
+        """Unmap the block, and free it if this process created it"""
+        self._data = self._header = None
+        try:
+            self.shm.close()
+        except BufferError:
+            print("Shared audio buffer still referenced, leaving it mapped")
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _worker_main(backend, profile, buffer_names, capacities, requests, results):
+    """Worker process: decode spans of the shared buffers until told to stop"""
+    buffers = {key: SharedRingBuffer(capacities[key], name) for key, name in buffer_names.items()}
+    try:
+        asr = create_backend(backend() if callable(backend) else backend, profile)
+        asr.load()
+    except Exception as e:
+        results.put((_READY, "", f"{type(e).__name__}: {e}", 0.0))
+        return
+    results.put((_READY, "", None, 0.0))
+
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        if request[0] == "profile":
+            asr = create_backend(asr, request[1])
+            continue
+        _, request_id, key, start, end = request
+        buffer = buffers[key]
+        started = time.perf_counter()
+        try:
+            text, error = asr.transcribe(buffer.view(start, end)), None
+            if buffer.oldest() > start:
+                text, error = "", "Audio was overwritten before it was decoded"
+        except Exception as e:
+            text, error = "", f"{type(e).__name__}: {e}"
+        results.put((request_id, text, error, time.perf_counter() - started))
+
+    for buffer in buffers.values():
+        buffer.release()
+
+
+class WorkerCrashed(RuntimeError):
+    """The worker process exited while a request was outstanding"""
+
+
+class ASRWorker(ASRBackend):
+    def __init__(self, backend: Union[str, Callable[[], ASRBackend]] = "whisper-base",
+                 profile: Union[str, DecodeProfile] = "command", buffer_seconds: float = 30.0,
+                 max_retries: int = 1, timeout: float = 60.0, startup_timeout: float = 300.0):
+        """
+        ASR backend run in a separate process, so decoding never holds this process's GIL
+
+        Audio reaches the worker through shared memory ring buffers: `buffer`
+        is meant to be the capture ring itself (StreamingCapture(buffer=...)),
+        so transcribe_span() hands over an utterance as two integers and the
+        worker decodes it in place. transcribe() copies other audio into a
+        second, private ring. Transcripts come back over a queue.
+
+        If the worker dies mid-decode it is restarted and the request resent
+        (the audio is still in shared memory); a decode that hangs past
+        `timeout` kills the worker, which restarts on the next request.
+
+        Args:
+            backend: Backend name (see asr_backends.BACKENDS) or a picklable factory
+                such as a class; callbacks like CascadeBackend's accept can't cross over
+            profile: Decode profile name or instance
+            buffer_seconds: Length of each shared ring buffer
+            max_retries: Times a request is resent to a restarted worker after a crash
+            timeout: Seconds to wait for one decode
+            startup_timeout: Seconds to wait for the worker to load its model
+        """
+        self.backend = backend
+        self._profile = get_profile(profile)
+        self.name = f"{backend if isinstance(backend, str) else getattr(backend, 'name', 'asr')}@worker"
+        capacity = int(SAMPLE_RATE * buffer_seconds)
+        self.buffer = SharedRingBuffer(capacity)
+        self._scratch = SharedRingBuffer(capacity)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+        self.restarts = 0
+        self._ctx = multiprocessing.get_context("spawn")  # fork would copy Tk, torch and audio threads
+        self._process = None
+        self._requests = None
+        self._results = None
+        self._next_id = _READY
+        self._closed = False
+        self._lock = threading.Lock()  # one request in flight; the worker decodes one at a time
+        atexit.register(self.close)
+
+    @property
+    def profile(self) -> DecodeProfile:
+        return self._profile
+
+    @profile.setter
+    def profile(self, profile: DecodeProfile):
+        with self._lock:
+            self._profile = get_profile(profile)
+            if self.alive:
+                self._requests.put(("profile", self._profile))
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    def load(self):
+        """Start the worker and wait until its model is loaded"""
+        with self._lock:
+            self._start()
+
+    start = load
+
+    def transcribe(self, audio: np.ndarray) -> str:
+        if len(audio) > self._scratch.capacity:
+            raise ValueError(f"Audio longer than the {self._scratch.capacity / SAMPLE_RATE:.0f} s worker buffer")
+        with self._lock:
+            start = self._scratch.total_written
+            self._scratch.write(np.asarray(audio, dtype=np.float32))
+            return self._decode("scratch", start, start + len(audio))
+
+    def transcribe_span(self, start: int, end: int) -> str:
+        """Decode samples [start, end) of `buffer` where they are, without copying them"""
+        with self._lock:
+            return self._decode("capture", start, end)
+
+    def close(self, timeout: float = 2.0):
+        """Stop the worker and free the shared buffers (stop capturing into `buffer` first)"""
+        atexit.unregister(self.close)
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._stop_process(timeout)
+            self.buffer.release()
+            self._scratch.release()
+
+    def _start(self):
+        if self._closed:
+            raise RuntimeError("ASR worker has been closed")
+        if self.alive:
+            return
+        # Fresh queues: a killed worker can leave the old ones locked
+        self._requests = self._ctx.Queue()
+        self._results = self._ctx.Queue()
+        buffers = {"capture": self.buffer, "scratch": self._scratch}
+        self._process = self._ctx.Process(
+            target=_worker_main,
+            args=(self.backend, self._profile,
+                  {key: b.name for key, b in buffers.items()},
+                  {key: b.capacity for key, b in buffers.items()},
+                  self._requests, self._results),
+            name=f"asr-{self.name}",
+            daemon=True
+        )
+        self._process.start()
+        try:
+            _, _, error, _ = self._wait(_READY, self.startup_timeout)
+        except (WorkerCrashed, TimeoutError):
+            self._stop_process()
+            raise
+        if error:
+            self._stop_process()
+            raise RuntimeError(f"ASR worker could not load {self.name}: {error}")
+
+    def _stop_process(self, timeout: float = 2.0):
+        if self._process is None:
+            return
+        if self._process.is_alive():
+            try:
+                self._requests.put(None)
+            except (OSError, ValueError):
+                pass
+            self._process.join(timeout)
+            if self._process.is_alive():
+                self._process.terminate()
+                self._process.join(1)
+        for q in (self._requests, self._results):
+            q.close()
+            q.cancel_join_thread()
+        self._process = None
+
+    def _wait(self, request_id: int, timeout: float):
+        """The worker's reply to a request, skipping replies to abandoned ones"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                reply = self._results.get(timeout=0.2)
+            except queue.Empty:
+                if not self._process.is_alive():
+                    raise WorkerCrashed(f"ASR worker exited with code {self._process.exitcode}")
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"ASR worker did not answer within {timeout:.0f} s")
+                continue
+            if reply[0] == request_id:
+                return reply
+
+    def _decode(self, key: str, start: int, end: int) -> str:
+        attempts = 0
+        while True:
+            self._start()
+            self._next_id += 1
+            self._requests.put(("decode", self._next_id, key, start, end))
+            try:
+                _, text, error, seconds = self._wait(self._next_id, self.timeout)
+                break
+            except WorkerCrashed as e:
+                self._stop_process()
+                self.restarts += 1
+                if attempts >= self.max_retries:
+                    raise
+                attempts += 1
+                print(f"{e}, restarting it")
+            except TimeoutError:
+                # Most likely stuck; a fresh worker is started for the next request
+                self._stop_process(timeout=0)
+                raise
+        if error:
+            raise RuntimeError(error)
+        self.record_decode(self._profile.name, seconds, (end - start) / SAMPLE_RATE)
+        return text
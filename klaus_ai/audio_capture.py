@@ -0,0 +1,421 @@
+import threading
+import time
+from typing import Callable, Optional
+import numpy as np
+from audio_sources import AudioSource, MicrophoneSource, MICROPHONE_AVAILABLE
+from audio_frames import PolyphaseResampler, to_mono_float32
+from features import FeatureCache
+
+STREAMING_AVAILABLE = MICROPHONE_AVAILABLE
+
+
+class RingBuffer:
+    """Fixed-size float32 ring buffer addressed by absolute sample position"""
+
+    def __init__(self, capacity: int, data: Optional[np.ndarray] = None):
+        """
+        Args:
+            capacity: Samples held
+            data: Float32 storage of `capacity` samples to use (e.g. shared memory)
+        """
+        self.capacity = capacity
+        self.total_written = 0
+        self._data = np.zeros(capacity, dtype=np.float32) if data is None else data
+        self._cond = threading.Condition()
+
+    def write(self, samples: np.ndarray):
+        """Append samples, overwriting the oldest audio when full"""
+        count = len(samples)
+        if count > self.capacity:
+            samples = samples[-self.capacity:]
+        with self._cond:
+            # Position the (possibly truncated) block so it ends at the new write head
+            start = (self.total_written + count - len(samples)) % self.capacity
+            first = min(len(samples), self.capacity - start)
+            self._data[start:start + first] = samples[:first]
+            self._data[:len(samples) - first] = samples[first:]
+            self.total_written += count
+            self._cond.notify_all()
+
+    def oldest(self) -> int:
+        """Absolute position of the oldest sample still held"""
+        return max(0, self.total_written - self.capacity)
+
+    def read(self, start: int, end: int) -> np.ndarray:
+        """Copy out samples in [start, end), clamped to what is still buffered"""
+        with self._cond:
+            start = max(start, self.oldest())
+            end = min(end, self.total_written)
+            if end <= start:
+                return np.zeros(0, dtype=np.float32)
+            first = start % self.capacity
+            last = first + (end - start)
+            if last <= self.capacity:
+                return self._data[first:last].copy()
+            return np.concatenate((self._data[first:], self._data[:last - self.capacity]))
+
+    def wait_for(self, position: int, timeout: float) -> bool:
+        """Block until at least `position` samples have been written"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.total_written >= position, timeout)
+
+
+class EnergyVAD:
+    """Frame-level voice activity detector based on RMS energy"""
+
+    def __init__(self, threshold: float = 0.01, noise_ratio: float = 3.0):
+        """
+        Args:
+            threshold: Minimum RMS level (float32 full scale) for a frame to count as speech
+            noise_ratio: Speech must exceed the tracked noise floor by this factor (0 disables tracking)
+        """
+        self.threshold = threshold
+        self.noise_ratio = noise_ratio
+        self.noise_floor = 0.0
+
+    @staticmethod
+    def rms(frame: np.ndarray) -> float:
+        return float(np.sqrt(np.mean(np.square(frame))))
+
+    def track(self, frame: np.ndarray):
+        """Update the running noise floor estimate from a captured frame"""
+        if not self.noise_ratio or not len(frame):
+            return
+        level = self.rms(frame)
+        if not self.noise_floor:
+            self.noise_floor = level
+            return
+        # Minimum-statistics style tracker: follow quiet frames quickly, speech only very slowly
+        rate = 0.2 if level < self.noise_floor else 0.005
+        self.noise_floor += rate * (level - self.noise_floor)
+
+    def current_threshold(self) -> float:
+        return max(self.threshold, self.noise_floor * self.noise_ratio)
+
+    def is_loud(self, level: float) -> bool:
+        """Speech decision from an RMS level that was already computed"""
+        return level > self.current_threshold()
+
+    def is_speech(self, frame: np.ndarray) -> bool:
+        return self.is_loud(self.rms(frame))
+
+
+class EchoGate:
+    def __init__(self, is_playing: Callable[[], bool], gate_ratio: float = 4.0,
+                 barge_in_frames: int = 8, tail: float = 0.3,
+                 on_barge_in: Optional[Callable[[], None]] = None):
+        """
+        Keeps Klaus's own voice out of recognition and detects barge-in
+
+        While TTS is playing (and for a short tail afterwards) captured frames
+        only count as speech if they are well above the normal VAD threshold
+        for several frames in a row, which is the user talking over Klaus
+        rather than the speaker bleeding into the microphone.
+
+        Args:
+            is_playing: Returns True while TTS audio is being played
+            gate_ratio: How far above the VAD threshold a frame must be during playback
+            barge_in_frames: Consecutive loud frames that count as the user interrupting
+            tail: Seconds after playback that stay gated (room echo, output latency)
+            on_barge_in: Called once when the user talks over playback
+        """
+        self.is_playing = is_playing
+        self.gate_ratio = gate_ratio
+        self.barge_in_frames = barge_in_frames
+        self.tail = tail
+        self.on_barge_in = on_barge_in
+        self.gated_frames = 0
+        self.barge_ins = 0
+        self._last_playing = 0.0
+        self._loud_run = 0
+        self._barged = False
+
+    def is_gated(self) -> bool:
+        if self.is_playing():
+            self._last_playing = time.monotonic()
+            return True
+        return time.monotonic() - self._last_playing < self.tail
+
+    def filter(self, frame: np.ndarray, speech: bool, vad: EnergyVAD) -> bool:
+        """Adjust a VAD decision for echo; returns whether the frame counts as speech"""
+        if not self.is_gated():
+            self._loud_run = 0
+            self._barged = False
+            return speech
+        if self._barged:
+            return speech
+
+        loud = vad.rms(frame) > vad.current_threshold() * self.gate_ratio
+        self._loud_run = self._loud_run + 1 if loud else 0
+        if self._loud_run < self.barge_in_frames:
+            self.gated_frames += 1
+            return False
+
+        self._barged = True
+        self.barge_ins += 1
+        if self.on_barge_in is not None:
+            self.on_barge_in()
+        return True
+
+
+class StreamingCapture:
+    def __init__(self, samplerate: int = 16000, device: Optional[int] = None,
+                 frame_ms: int = 30, buffer_seconds: float = 30.0,
+                 vad: Optional[EnergyVAD] = None, onset_frames: int = 3,
+                 trailing_silence: float = 0.8, pre_roll: float = 0.3,
+                 source: Optional[AudioSource] = None, device_rate: Optional[float] = None,
+                 buffer: Optional[RingBuffer] = None):
+        """
+        Microphone capture into a ring buffer with VAD endpointing
+
+        Args:
+            samplerate: Capture rate in Hz (Whisper expects 16000)
+            device: sounddevice input device, None for the system default
+            frame_ms: VAD frame length in milliseconds
+            buffer_seconds: Ring buffer length, also caps a single utterance
+            vad: Voice activity detector, defaults to EnergyVAD()
+            onset_frames: Consecutive speech frames needed to start an utterance
+            trailing_silence: Seconds of silence that close an utterance
+            pre_roll: Seconds of audio kept from before the detected onset
+            source: Audio to capture, defaults to the microphone given by `device`
+            device_rate: Open the device at this (native) rate and resample to
+                `samplerate`, instead of relying on the driver to convert
+            buffer: Ring buffer to capture into (e.g. asr_worker.SharedRingBuffer so
+                a worker process reads utterances in place); sized by buffer_seconds if None
+        """
+        self.samplerate = samplerate
+        self.device = device
+        self.source = source if source is not None else MicrophoneSource(device)
+        self.frame_len = int(samplerate * frame_ms / 1000)
+        self.device_rate = int(device_rate) if device_rate else samplerate
+        self.device_frame_len = int(self.device_rate * frame_ms / 1000)
+        self.resampler = None
+        if self.device_rate != samplerate:
+            self.resampler = PolyphaseResampler(self.device_rate, samplerate,
+                                                max_block=self.device_frame_len)
+        self.vad = vad or EnergyVAD()
+        self.echo_gate: Optional[EchoGate] = None
+        self.onset_frames = onset_frames
+        self.trailing_silence = trailing_silence
+        self.pre_roll = pre_roll
+        self.buffer = buffer if buffer is not None else RingBuffer(int(samplerate * buffer_seconds))
+        # Log-mel frames of the buffer, computed on first use and shared by all consumers
+        self.features = FeatureCache(self.buffer)
+        self.last_span = None  # (start, end) buffer positions of the last utterance
+        self.stream = None
+        self._consumed = 0
+
+    def start(self):
+        """Open the input stream"""
+        if self.stream is None:
+            self._open_stream()
+
+    def _open_stream(self, finished_callback: Optional[Callable[[], None]] = None):
+        if self.resampler is not None:
+            # Don't filter across the gap from a previous stream
+            self.resampler.reset()
+        self.stream = self.source.open(self.device_rate, self.device_frame_len, self._callback,
+                                       finished_callback)
+
+    def stop(self):
+        """Close the input stream"""
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _frames(self, indata: np.ndarray) -> np.ndarray:
+        """Mono float32 at the capture rate; a view into the block or the resampler's buffer"""
+        samples = to_mono_float32(indata)
+        if self.resampler is not None:
+            samples = self.resampler.process(samples)
+        return samples
+
+    def _callback(self, indata, frames, time_info, status):
+        """PortAudio callback - keep it short, just copy into the ring buffer"""
+        self.buffer.write(self._frames(indata))
+
+    def capture_utterance(self, timeout: float = 5, phrase_time_limit: float = 10,
+                          on_frame: Optional[Callable[[int, int], bool]] = None) -> Optional[np.ndarray]:
+        """
+        Wait for speech and return it once the speaker goes quiet
+
+        Args:
+            timeout: Seconds to wait for speech onset
+            phrase_time_limit: Maximum utterance length in seconds
+            on_frame: Called with the utterance's (start, end) buffer positions after
+                every frame once speech has started; returning True ends it early
+
+        Returns:
+            Mono float32 audio, or None if nobody spoke before the timeout
+        """
+        sr = self.samplerate
+        silence_limit = int(self.trailing_silence * sr)
+        max_samples = int(min(phrase_time_limit, self.buffer.capacity / sr) * sr)
+        live = self.source.live
+
+        pos = max(self._consumed, self.buffer.oldest())
+        if live:
+            # Look back a little so speech that began between calls is not clipped
+            pos = max(pos, self.buffer.total_written - int(self.pre_roll * sr))
+        # Replayed audio is never skipped and times out in audio time, so runs repeat exactly
+        onset_deadline = time.monotonic() + timeout
+        onset_limit = pos + int(timeout * sr)
+
+        def onset_expired():
+            return time.monotonic() > onset_deadline if live else pos >= onset_limit
+        speech_run = 0
+        start = None
+        silence = 0
+
+        while True:
+            if not self.buffer.wait_for(pos + self.frame_len, timeout=0.5):
+                if not self._is_capturing():
+                    return None
+                if start is None and onset_expired():
+                    return None
+                continue
+
+            frame = self.buffer.read(pos, pos + self.frame_len)
+            pos += self.frame_len
+            speech = self.vad.is_speech(frame)
+            if self.echo_gate is not None:
+                speech = self.echo_gate.filter(frame, speech, self.vad)
+
+            if start is None:
+                speech_run = speech_run + 1 if speech else 0
+                if speech_run >= self.onset_frames:
+                    onset = pos - speech_run * self.frame_len
+                    start = max(onset - int(self.pre_roll * sr), self._consumed, self.buffer.oldest())
+                elif onset_expired():
+                    if not live:
+                        # The next call scans on from here instead of the same silence again;
+                        # a speech run still building may yet be an onset, so it is kept
+                        self._consumed = pos - speech_run * self.frame_len
+                    return None
+                continue
+
+            silence = 0 if speech else silence + self.frame_len
+            stop_early = on_frame is not None and on_frame(start, pos)
+            if stop_early or silence >= silence_limit or pos - start >= max_samples:
+                # Keep a short tail after the last speech frame
+                end = pos - silence + min(silence, int(0.2 * sr))
+                self._consumed = end
+                self.last_span = (start, end)
+                return self.buffer.read(start, end)
+
+    def discard_until(self, position: int):
+        """Make the next capture_utterance() start no earlier than `position`"""
+        self._consumed = max(self._consumed, position)
+
+    def _is_capturing(self) -> bool:
+        return self.stream is not None and self.stream.active
+
+
+class CaptureSession(StreamingCapture):
+    """
+    Long-lived StreamingCapture owned by VoiceEngine
+
+    The input device stays open between listen() calls, the VAD noise floor is
+    tracked continuously from the callback, and a supervisor thread reopens the
+    device if the stream dies or stops delivering audio.
+    """
+
+    def __init__(self, *args, reopen_delay: float = 1.0, stall_timeout: float = 2.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reopen_delay = reopen_delay
+        self.stall_timeout = stall_timeout
+        self._running = False
+        self._lost = threading.Event()
+        self._generation = 0  # bumped per stream, so a closed stream's callbacks are ignored
+        self._supervisor = None
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._lost.clear()
+        self._open_live_stream()
+        self._supervisor = threading.Thread(target=self._supervise, daemon=True)
+        self._supervisor.start()
+
+    def stop(self):
+        self._running = False
+        self._lost.set()
+        self._close_quietly()
+
+    def _callback(self, indata, frames, time_info, status):
+        samples = self._frames(indata)
+        self.buffer.write(samples)
+        # Klaus's own voice must not raise the noise floor
+        if self.echo_gate is None or not self.echo_gate.is_gated():
+            self.vad.track(samples)
+
+    def _is_capturing(self) -> bool:
+        # While running, a dead stream is about to be reopened - keep waiting
+        return self._running
+
+    def _open_live_stream(self):
+        self._generation += 1
+        generation = self._generation
+        self._open_stream(finished_callback=lambda: self._stream_finished(generation))
+
+    def _stream_finished(self, generation: int):
+        # Closing a stream on purpose fires its finished_callback too; only the current one is lost
+        if generation == self._generation:
+            self._lost.set()
+
+    def _close_quietly(self):
+        self._generation += 1
+        stream, self.stream = self.stream, None
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    def _supervise(self):
+        """Reopen the device after stream errors or stalls"""
+        last_written = self.buffer.total_written
+        last_progress = time.monotonic()
+        while self._running:
+            lost = self._lost.wait(timeout=0.5)
+            if not self._running:
+                break
+            if self.buffer.total_written != last_written:
+                last_written = self.buffer.total_written
+                last_progress = time.monotonic()
+            elif time.monotonic() - last_progress > self.stall_timeout:
+                lost = True
+            if not lost:
+                continue
+            if not self.source.live:
+                # End of a replayed recording - nothing to reopen
+                self._running = False
+                break
+
+            print("Audio input lost, reopening device...")
+            self._close_quietly()
+            self._lost.clear()
+            delay = self.reopen_delay
+            while self._running:
+                time.sleep(delay)
+                try:
+                    self._open_live_stream()
+                    if not self._running:
+                        # Stopped while the device was opening (e.g. a hot-plug reset)
+                        self._close_quietly()
+                        break
+                    print("Audio input reopened")
+                    break
+                except Exception as e:
+                    print(f"Audio input reopen failed: {str(e)}")
+                    delay = min(delay * 2, 10.0)
+            last_progress = time.monotonic()
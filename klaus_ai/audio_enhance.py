@@ -0,0 +1,204 @@
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+import numpy as np
+
+
+@dataclass
+class EnhancerStats:
+    """What the enhancer has been doing to captured audio"""
+    count: int = 0
+    seconds: float = 0.0       # processing time
+    audio: float = 0.0         # audio processed, in seconds
+    removed_db: float = 0.0    # summed energy taken out by the noise gate
+    gain_db: float = 0.0       # summed AGC gain
+    noise_dbfs: float = 0.0    # summed estimated noise floor
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def record(self, seconds: float, audio_seconds: float, removed_db: float, gain_db: float,
+               noise_dbfs: float):
+        with self._lock:
+            self.count += 1
+            self.seconds += seconds
+            self.audio += audio_seconds
+            self.removed_db += removed_db
+            self.gain_db += gain_db
+            self.noise_dbfs += noise_dbfs
+
+    def summary(self) -> Dict:
+        n = self.count or 1
+        return {
+            "processed": self.count,
+            "rtf": self.seconds / self.audio if self.audio else 0.0,
+            "mean_removed_db": self.removed_db / n,
+            "mean_gain_db": self.gain_db / n,
+            "mean_noise_dbfs": self.noise_dbfs / n,
+        }
+
+
+@dataclass
+class RecognitionStats:
+    """
+    Recognition outcomes, to tell whether preprocessing helps
+
+    An attempt is a listen() that captured speech. It fails when the
+    recogniser errors or returns no text. An attempt that starts within
+    retry_window seconds of a failure counts as the user repeating themselves.
+    """
+    retry_window: float = 10.0
+    attempts: int = 0
+    failures: int = 0
+    retries: int = 0
+    _last_failure: Optional[float] = field(default=None, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def record(self, success: bool, text: str, started: float, now: Optional[float] = None):
+        """Add one listen() result; (False, "") means nothing was heard and isn't counted"""
+        if not success and not text:
+            return
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.attempts += 1
+            if self._last_failure is not None and started - self._last_failure <= self.retry_window:
+                self.retries += 1
+            if success and text:
+                self._last_failure = None
+            else:
+                self.failures += 1
+                self._last_failure = now
+
+    @property
+    def failure_rate(self) -> float:
+        return self.failures / self.attempts if self.attempts else 0.0
+
+    @property
+    def retry_rate(self) -> float:
+        return self.retries / self.attempts if self.attempts else 0.0
+
+    def summary(self) -> Dict:
+        return {"attempts": self.attempts, "failures": self.failures, "retries": self.retries,
+                "failure_rate": self.failure_rate, "retry_rate": self.retry_rate}
+
+
+def _db(ratio: float) -> float:
+    return float(10 * np.log10(max(ratio, 1e-12)))
+
+
+class AudioEnhancer:
+    def __init__(self, noise_gate: bool = True, agc: bool = True, frame_ms: float = 32,
+                 noise_percentile: float = 10, noise_adapt: float = 0.3,
+                 over_subtraction: float = 1.5, floor_db: float = -20.0,
+                 target_dbfs: float = -20.0, max_gain_db: float = 20.0):
+        """
+        Spectral noise gate and automatic gain control for whole utterances
+
+        The gate estimates each frequency bin's noise level as a low
+        percentile of its magnitude over the utterance (capture keeps some
+        silence around speech, so that is the noise), blended with earlier
+        utterances, and attenuates bins near that level. The AGC then brings
+        the speech level to target_dbfs. Everything is a few array
+        operations per utterance, a small fraction of a decode.
+
+        Args:
+            noise_gate: Apply the spectral gate
+            agc: Normalise the speech level
+            frame_ms: STFT window; half of it is the hop
+            noise_percentile: Magnitude percentile taken as the noise estimate
+            noise_adapt: Weight of the current utterance in the running noise estimate
+            over_subtraction: Gate bins whose level is within this factor of the noise
+            floor_db: Most attenuation applied to a bin (deeper gating sounds watery)
+            target_dbfs: Speech level the AGC aims for
+            max_gain_db: Most boost (or cut) the AGC applies
+        """
+        self.noise_gate = noise_gate
+        self.agc = agc
+        self.frame_ms = frame_ms
+        self.noise_percentile = noise_percentile
+        self.noise_adapt = noise_adapt
+        self.over_subtraction = over_subtraction
+        self.floor = 10 ** (floor_db / 20)
+        self.target = 10 ** (target_dbfs / 20)
+        self.max_gain_db = max_gain_db
+        # Noise bin magnitudes are Rayleigh distributed: scale the percentile to their mean
+        self._to_mean = np.sqrt(np.pi / 2) / np.sqrt(-2 * np.log(1 - noise_percentile / 100))
+        self.stats = EnhancerStats()
+        self._noise: Dict[int, np.ndarray] = {}  # running noise magnitude per sample rate
+        self._windows: Dict[int, np.ndarray] = {}
+
+    def _window(self, n: int) -> np.ndarray:
+        if n not in self._windows:
+            # Periodic Hann at 50% overlap sums to one, so no synthesis window is needed
+            self._windows[n] = np.hanning(n + 1)[:-1].astype(np.float32)
+        return self._windows[n]
+
+    def reset(self):
+        """Forget the noise estimate, e.g. after moving to another room or device"""
+        self._noise.clear()
+
+    def process(self, audio: np.ndarray, samplerate: int = 16000) -> np.ndarray:
+        """Enhanced copy of a mono float32 utterance"""
+        start = time.perf_counter()
+        audio = np.asarray(audio, dtype=np.float32)
+        n = 2 * int(samplerate * self.frame_ms / 2000)
+        if len(audio) < n:
+            return audio
+        out, removed_db, noise_dbfs = audio, 0.0, 0.0
+        if self.noise_gate:
+            out, removed_db, noise_dbfs = self._gate(audio, n, samplerate)
+        gain_db = 0.0
+        if self.agc:
+            out, gain_db = self._gain(out, n // 2)
+        self.stats.record(time.perf_counter() - start, len(audio) / samplerate,
+                          removed_db, gain_db, noise_dbfs)
+        return out
+
+    def _gate(self, audio: np.ndarray, n: int, samplerate: int):
+        hop = n // 2
+        # Pad a hop on each side so every sample lies under two windows
+        padded = np.concatenate((np.zeros(hop, np.float32), audio,
+                                 np.zeros(hop + (-len(audio)) % hop, np.float32)))
+        frames = np.lib.stride_tricks.sliding_window_view(padded, n)[::hop] * self._window(n)
+        spectrum = np.fft.rfft(frames, axis=1)
+        magnitude = np.abs(spectrum)
+
+        estimate = np.percentile(magnitude, self.noise_percentile, axis=0) * self._to_mean
+        noise = self._noise.get(samplerate)
+        noise = estimate if noise is None else (1 - self.noise_adapt) * noise + self.noise_adapt * estimate
+        self._noise[samplerate] = noise
+
+        gain = np.clip(1 - self.over_subtraction * noise / np.maximum(magnitude, 1e-10), self.floor, 1.0)
+        # Smooth over neighbouring frames so isolated bins don't flicker ("musical noise")
+        edged = np.pad(gain, ((1, 1), (0, 0)), mode="edge")
+        gain = (edged[:-2] + edged[1:-1] + edged[2:]) / 3
+        frames = np.fft.irfft(spectrum * gain, n, axis=1).astype(np.float32)
+
+        # Overlap-add: each frame's second half lands on the next frame's first half
+        halves = frames.reshape(len(frames), 2, hop)
+        joined = np.zeros((len(frames) + 1, hop), dtype=np.float32)
+        joined[:-1] += halves[:, 0]
+        joined[1:] += halves[:, 1]
+        out = joined.reshape(-1)[hop:hop + len(audio)]
+
+        energy_in = float(np.sum(magnitude ** 2))
+        energy_out = float(np.sum((magnitude * gain) ** 2))
+        # Parseval: mean noise power (4/pi x squared mean magnitude) back to sample RMS
+        noise_power = 4 / np.pi * float(np.sum(noise ** 2))
+        noise_dbfs = _db(noise_power / (float(np.sum(self._window(n) ** 2)) * n / 2))
+        return out, _db(energy_in / max(energy_out, 1e-12)), noise_dbfs
+
+    def _gain(self, audio: np.ndarray, hop: int):
+        frames = audio[:len(audio) // hop * hop].reshape(-1, hop)
+        levels = np.sqrt(np.mean(np.square(frames), axis=1))
+        # Loud frames are the speech; quiet ones shouldn't drag the level down
+        level = float(np.percentile(levels, 90))
+        if level <= 0:
+            return audio, 0.0
+        gain_db = float(np.clip(20 * np.log10(self.target / level), -self.max_gain_db, self.max_gain_db))
+        gain = 10 ** (gain_db / 20)
+        peak = float(np.max(np.abs(audio)))
+        if peak * gain > 0.99:
+            # Never clip, even if that leaves the speech below target
+            gain = 0.99 / peak
+            gain_db = 20 * np.log10(gain)
+        return audio * np.float32(gain), gain_db
@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+from typing import Callable, Optional, Sequence, Tuple
+import numpy as np
+from phrase_cache import read_wav
+from audio_frames import resample
+from device_registry import portaudio_lock
+
+try:
+    import sounddevice as sd
+    MICROPHONE_AVAILABLE = True
+except (ImportError, OSError):
+    # OSError is raised when the PortAudio library itself is missing
+    MICROPHONE_AVAILABLE = False
+
+
+class AudioSource:
+    """
+    Where captured audio comes from
+
+    open() returns a stream object with the parts of sounddevice.InputStream
+    that capture uses (start/stop/close/active), delivering float32 blocks of
+    shape (frames, 1) to callback(indata, frames, time_info, status).
+    """
+    live = True  # False for sources that run out
+
+    def __init__(self):
+        self.finished = threading.Event()
+
+    def open(self, samplerate: int, blocksize: int, callback: Callable,
+             finished_callback: Optional[Callable[[], None]] = None):
+        raise NotImplementedError
+
+
+class MicrophoneSource(AudioSource):
+    def __init__(self, device: Optional[int] = None):
+        """Live input device (None for the system default)"""
+        super().__init__()
+        self.device = device
+
+    def open(self, samplerate, blocksize, callback, finished_callback=None):
+        if not MICROPHONE_AVAILABLE:
+            raise RuntimeError("Streaming capture requires sounddevice")
+        kwargs = {"finished_callback": finished_callback} if finished_callback else {}
+        with portaudio_lock:
+            stream = sd.InputStream(
+                samplerate=samplerate,
+                device=self.device,
+                channels=1,
+                dtype='float32',
+                blocksize=blocksize,
+                callback=callback,
+                **kwargs
+            )
+            stream.start()
+        return stream
+
+
+class ReplayStream:
+    """Feeds a recording to a capture callback from a thread, paced like a sound card"""
+
+    def __init__(self, source: "ReplaySource", samples: np.ndarray, samplerate: int,
+                 blocksize: int, callback: Callable, finished_callback: Optional[Callable]):
+        self.source = source
+        self.samples = samples
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.callback = callback
+        self.finished_callback = finished_callback
+        self.position = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def active(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="audio-replay", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1)
+
+    close = stop
+
+    def _run(self):
+        block_time = self.blocksize / self.samplerate / self.source.speed
+        # Pace against a fixed schedule so sleep jitter doesn't accumulate
+        next_block = time.monotonic()
+        while not self._stop.is_set():
+            block = self.samples[self.position:self.position + self.blocksize]
+            if len(block) < self.blocksize:
+                if self.source.loop and len(self.samples) >= self.blocksize:
+                    self.position = 0
+                    continue
+                break
+            self.position += self.blocksize
+            self.callback(block[:, None], self.blocksize, None, None)
+            next_block += block_time
+            delay = next_block - time.monotonic()
+            if delay > 0:
+                self._stop.wait(delay)
+
+        if not self._stop.is_set():
+            self.source.finished.set()
+        if self.finished_callback is not None:
+            self.finished_callback()
+
+
+class ReplaySource(AudioSource):
+    live = False
+
+    def __init__(self, samples: np.ndarray, samplerate: int = 16000, speed: float = 1.0,
+                 tail_silence: float = 1.0, loop: bool = False):
+        """
+        Recorded audio played into capture as if it came from a microphone
+
+        Replay is paced in blocks like a real device, so VAD endpointing,
+        wake word detection and recognition see the same audio in the same
+        order on every run.
+
+        Args:
+            samples: Mono float32 audio
+            samplerate: Rate of the samples in Hz
+            speed: Playback speed relative to real time (4.0 plays four times faster)
+            tail_silence: Seconds of silence appended so the last utterance is endpointed
+            loop: Start over at the end instead of finishing
+        """
+        super().__init__()
+        if speed <= 0:
+            raise ValueError("Replay speed must be positive")
+        self.samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+        self.samplerate = samplerate
+        self.speed = speed
+        self.tail_silence = tail_silence
+        self.loop = loop
+        self.stream: Optional[ReplayStream] = None
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "ReplaySource":
+        """Load a 16-bit PCM WAV or a NumPy .npy recording (float32, 16 kHz unless samplerate is given)"""
+        if os.path.splitext(path)[1].lower() == ".npy":
+            return cls(np.load(path), **kwargs)
+        samples, rate = read_wav(path)
+        return cls(samples, rate, **kwargs)
+
+    @classmethod
+    def synthetic(cls, pattern: Sequence[Tuple[float, float]], samplerate: int = 16000,
+                  seed: int = 0, background: float = 0.001, **kwargs) -> "ReplaySource":
+        """
+        Generated test signal from (seconds, rms level) segments
+
+        Segments are seeded noise, which the energy VAD treats as speech when
+        loud enough; level 0 leaves only the background hiss a real room
+        has. Useful to exercise endpointing and load without any recordings.
+        """
+        rng = np.random.default_rng(seed)
+        parts = []
+        for seconds, level in pattern:
+            count = int(seconds * samplerate)
+            parts.append(rng.standard_normal(count).astype(np.float32) * max(level, background))
+        return cls(np.concatenate(parts) if parts else np.zeros(0, np.float32), samplerate, **kwargs)
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / self.samplerate
+
+    def _resampled(self, samplerate: int) -> np.ndarray:
+        samples = resample(self.samples, self.samplerate, samplerate)
+        tail = np.zeros(int(self.tail_silence * samplerate), dtype=np.float32)
+        return np.concatenate((samples, tail))
+
+    def open(self, samplerate, blocksize, callback, finished_callback=None):
+        self.finished.clear()
+        self.stream = ReplayStream(self, self._resampled(samplerate), samplerate,
+                                   blocksize, callback, finished_callback)
+        self.stream.start()
+        return self.stream
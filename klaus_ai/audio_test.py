@@ -1,18 +1,21 @@
-import pyaudio
+import sys
+from device_registry import DeviceRegistry
 
-def list_audio_devices():
-    p = pyaudio.PyAudio()
+def list_audio_devices(refresh=False):
+    registry = DeviceRegistry()
+    if refresh:
+        registry.refresh(force=True)
+    preferred = registry.input_device()
     print("\nAvailable Audio Devices:")
     print("-----------------------")
     
-    for i in range(p.get_device_count()):
-        dev = p.get_device_info_by_index(i)
-        print(f"Index {i}: {dev['name']}")
-        print(f"   Input Channels: {dev['maxInputChannels']} | Output Channels: {dev['maxOutputChannels']}")
-        print(f"   Default Sample Rate: {dev['defaultSampleRate']} Hz")
+    for dev in registry.devices:
+        marker = "  <- Klaus input" if preferred and dev.uid == preferred.uid else ""
+        print(f"Index {dev.index}: {dev.name} [{dev.host_api}]{marker}")
+        print(f"   Input Channels: {dev.max_input_channels} | Output Channels: {dev.max_output_channels}")
+        print(f"   Default Sample Rate: {dev.default_samplerate} Hz")
         print("---")
 
-    p.terminate()
-
 if __name__ == "__main__":
-    list_audio_devices()
\ No newline at end of file
+    # Pass --refresh to re-probe even if the hardware looks unchanged
+    list_audio_devices(refresh="--refresh" in sys.argv)
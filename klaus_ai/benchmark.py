@@ -0,0 +1,195 @@
+"""
+Compare ASR backends on recorded audio
+
+Each fixture is a WAV file with the reference transcript in a .txt file of
+the same name:
+
+    fixtures/
+        turn_on_lights.wav
+        turn_on_lights.txt
+
+Usage:
+    python benchmark.py fixtures whisper-tiny whisper-tiny-int8 --json results.json
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from phrase_cache import read_wav
+from audio_frames import resample
+from model_registry import current_rss_mb
+
+SAMPLE_RATE = 16000
+
+
+def _normalize_words(text: str) -> List[str]:
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def word_errors(reference: str, hypothesis: str) -> Tuple[int, int]:
+    """(word-level edit distance, reference length in words)"""
+    ref, hyp = _normalize_words(reference), _normalize_words(hypothesis)
+    row = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        prev, row[0] = row[0], i
+        for j, h in enumerate(hyp, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (r != h))
+    return row[-1], len(ref)
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """Word-level edit distance divided by the reference length"""
+    edits, words = word_errors(reference, hypothesis)
+    if not words:
+        return 0.0 if not edits else 1.0
+    return edits / words
+
+
+def corpus_word_error_rate(pairs: List[Tuple[str, str]]) -> Optional[float]:
+    """
+    Total edits over total reference words for (reference, hypothesis) pairs
+
+    Unlike the mean of per-utterance rates, a long utterance weighs as much
+    as its words, so one misheard two-word command can't swing the result.
+    """
+    counts = [word_errors(reference, hypothesis) for reference, hypothesis in pairs]
+    if not counts:
+        return None
+    edits, words = map(sum, zip(*counts))
+    if not words:
+        return 0.0 if not edits else 1.0
+    return edits / words
+
+
+def load_fixtures(directory: str) -> List[Tuple[str, np.ndarray, str]]:
+    """(name, 16 kHz float32 audio, reference text) for every WAV with a transcript"""
+    fixtures = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.wav"))):
+        transcript = os.path.splitext(path)[0] + ".txt"
+        if not os.path.exists(transcript):
+            print(f"Skipping {path}: no transcript")
+            continue
+        samples, rate = read_wav(path)
+        samples = resample(samples, rate, SAMPLE_RATE)
+        with open(transcript, 'r', encoding='utf-8') as f:
+            fixtures.append((os.path.basename(path), samples, f.read().strip()))
+    return fixtures
+
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return current_rss_mb()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_backend(backend_name: str, fixtures_dir: str, warmup: bool = True,
+                profile: Optional[str] = None) -> Dict:
+    """Benchmark one backend in the current process"""
+    from asr_backends import create_backend
+
+    fixtures = load_fixtures(fixtures_dir)
+    backend = create_backend(backend_name, profile)
+
+    start = time.perf_counter()
+    backend.load()
+    load_time = time.perf_counter() - start
+    if warmup and fixtures:
+        backend.transcribe(fixtures[0][1])
+
+    latencies, audio_seconds, transcripts = [], 0.0, []
+    samples = []
+    for name, audio, reference in fixtures:
+        start = time.perf_counter()
+        try:
+            text = backend.transcribe(audio)
+        except Exception as e:
+            print(f"{backend_name} failed on {name}: {str(e)}")
+            text = ""
+        elapsed = time.perf_counter() - start
+        wer = word_error_rate(reference, text)
+        latencies.append(elapsed)
+        audio_seconds += len(audio) / SAMPLE_RATE
+        transcripts.append((reference, text))
+        samples.append({"fixture": name, "latency": elapsed, "wer": wer, "text": text})
+
+    return {
+        "backend": backend_name,
+        "profile": profile,
+        "fixtures": len(fixtures),
+        "load_time": load_time,
+        "rtf": sum(latencies) / audio_seconds if audio_seconds else None,
+        "p50": float(np.percentile(latencies, 50)) if latencies else None,
+        "p95": float(np.percentile(latencies, 95)) if latencies else None,
+        "peak_rss_mb": _peak_rss_mb(),
+        "wer": corpus_word_error_rate(transcripts),
+        "samples": samples
+    }
+
+
+def _child(backend_name, fixtures_dir, warmup, profile, results):
+    try:
+        results.put(run_backend(backend_name, fixtures_dir, warmup, profile))
+    except Exception as e:
+        results.put({"backend": backend_name, "error": str(e)})
+
+
+def run_isolated(backend_name: str, fixtures_dir: str, warmup: bool = True,
+                 profile: Optional[str] = None) -> Dict:
+    """Benchmark a backend in a fresh process so peak memory isn't shared between backends"""
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    proc = ctx.Process(target=_child, args=(backend_name, fixtures_dir, warmup, profile, results))
+    proc.start()
+    result = results.get()
+    proc.join()
+    return result
+
+
+def _fmt(value, spec):
+    return "-" if value is None else format(value, spec)
+
+
+def print_report(results: List[Dict]):
+    print(f"{'backend':<16}{'RTF':>8}{'p50 s':>9}{'p95 s':>9}{'RSS MB':>9}{'WER':>8}{'load s':>9}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['backend']:<16} failed: {r['error']}")
+            continue
+        print(f"{r['backend']:<16}{_fmt(r['rtf'], '8.3f')}{_fmt(r['p50'], '9.3f')}"
+              f"{_fmt(r['p95'], '9.3f')}{_fmt(r['peak_rss_mb'], '9.0f')}"
+              f"{_fmt(r['wer'], '8.1%')}{_fmt(r['load_time'], '9.2f')}")
+
+
+def main():
+    from asr_backends import BACKENDS
+    from decode_profiles import DECODE_PROFILES
+
+    parser = argparse.ArgumentParser(description="Benchmark Klaus ASR backends on recorded audio")
+    parser.add_argument("fixtures", help="Directory of WAV files with matching .txt transcripts")
+    parser.add_argument("backends", nargs="*", default=["whisper-tiny", "whisper-tiny-int8", "whisper-base"],
+                        help=f"Backends to compare ({', '.join(BACKENDS)})")
+    parser.add_argument("--profile", choices=list(DECODE_PROFILES), help="Whisper decode profile")
+    parser.add_argument("--no-warmup", action="store_true", help="Include the first decode in the timings")
+    parser.add_argument("--json", help="Also write full results to this file")
+    args = parser.parse_args()
+
+    results = [run_isolated(name, args.fixtures, not args.no_warmup, args.profile)
+               for name in args.backends]
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+_CPUS = os.cpu_count() or 1
+
+
+@dataclass(frozen=True)
+class DecodeProfile:
+    """How Whisper spends compute on one utterance"""
+    name: str
+    language: Optional[str] = "en"          # None auto-detects (an extra encoder pass)
+    beam_size: Optional[int] = None         # None decodes greedily
+    best_of: Optional[int] = None           # samples per fallback temperature
+    temperatures: Tuple[float, ...] = (0.0,)  # more than one enables fallback retries
+    compression_ratio_threshold: Optional[float] = 2.4
+    logprob_threshold: Optional[float] = -1.0
+    no_speech_threshold: Optional[float] = 0.6
+    condition_on_previous_text: bool = False
+    without_timestamps: bool = True
+    threads: Optional[int] = None           # torch intra-op threads, None leaves the default
+
+    def transcribe_options(self) -> Dict:
+        """Keyword arguments for whisper's model.transcribe()"""
+        options = {
+            "language": self.language,
+            "temperature": self.temperatures if len(self.temperatures) > 1 else self.temperatures[0],
+            "compression_ratio_threshold": self.compression_ratio_threshold,
+            "logprob_threshold": self.logprob_threshold,
+            "no_speech_threshold": self.no_speech_threshold,
+            "condition_on_previous_text": self.condition_on_previous_text,
+            "without_timestamps": self.without_timestamps,
+        }
+        if self.beam_size:
+            options["beam_size"] = self.beam_size
+        if self.best_of:
+            options["best_of"] = self.best_of
+        return options
+
+
+DECODE_PROFILES: Dict[str, DecodeProfile] = {
+    # Short English commands: one greedy pass, no language detection, no retries
+    "command": DecodeProfile("command", threads=_CPUS),
+    # Longer free-form speech: beam search with fallback, leaving cores for capture and TTS
+    "dictation": DecodeProfile(
+        "dictation", beam_size=5, best_of=5, temperatures=(0.0, 0.2, 0.4, 0.6),
+        condition_on_previous_text=True, without_timestamps=False, threads=max(1, _CPUS // 2)
+    ),
+    # Best transcript regardless of time (benchmarks, enrolment checks)
+    "accurate": DecodeProfile(
+        "accurate", beam_size=5, best_of=5, temperatures=(0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
+        condition_on_previous_text=True, without_timestamps=False
+    ),
+}
+
+
+def get_profile(profile) -> DecodeProfile:
+    if isinstance(profile, DecodeProfile):
+        return profile
+    if profile not in DECODE_PROFILES:
+        raise ValueError(f"Unknown decode profile '{profile}' (available: {', '.join(DECODE_PROFILES)})")
+    return DECODE_PROFILES[profile]
+
+
+@dataclass
+class DecodeStats:
+    """Running decode timings for one profile"""
+    count: int = 0
+    total: float = 0.0
+    audio: float = 0.0
+    last: float = 0.0
+    worst: float = 0.0
+    fallbacks: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def record(self, seconds: float, audio_seconds: float, fallbacks: int = 0):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.audio += audio_seconds
+            self.last = seconds
+            self.worst = max(self.worst, seconds)
+            self.fallbacks += fallbacks
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def rtf(self) -> float:
+        """Decode time per second of audio"""
+        return self.total / self.audio if self.audio else 0.0
+
+    def summary(self) -> str:
+        return (f"{self.count} decodes, mean {self.mean * 1000:.0f} ms, "
+                f"worst {self.worst * 1000:.0f} ms, RTF {self.rtf:.2f}, {self.fallbacks} fallbacks")
@@ -0,0 +1,274 @@
+import glob
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Callable, List, Optional
+
+try:
+    import sounddevice as sd
+    SOUNDDEVICE_AVAILABLE = True
+except (ImportError, OSError):
+    SOUNDDEVICE_AVAILABLE = False
+
+try:
+    import pyaudio
+    PYAUDIO_AVAILABLE = True
+except ImportError:
+    PYAUDIO_AVAILABLE = False
+
+# Held while a PortAudio stream is opened or a clip plays, so reinitialize_portaudio() waits for them
+portaudio_lock = threading.RLock()
+
+CACHE_DIR = os.getenv("KLAUS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "klaus"))
+DEFAULT_CACHE_FILE = os.path.join(CACHE_DIR, "devices.json")
+
+
+@dataclass
+class AudioDevice:
+    index: int
+    name: str
+    is_input: bool
+    is_output: bool
+    max_input_channels: int = 0
+    max_output_channels: int = 0
+    default_samplerate: float = 0.0
+    host_api: str = ""
+
+    @property
+    def uid(self) -> str:
+        """Identity that survives re-enumeration, unlike the PortAudio index"""
+        return f"{self.host_api}:{self.name}"
+
+
+def hardware_signature() -> Optional[str]:
+    """
+    Cheap fingerprint of the attached audio hardware
+
+    Read from the OS without initialising PortAudio, so it can be polled
+    to notice hot-plugs. None means the platform offers no cheap source.
+    """
+    parts = []
+    if sys.platform.startswith("linux"):
+        try:
+            with open("/proc/asound/cards") as f:
+                parts.append(f.read())
+        except OSError:
+            pass
+        parts.extend(sorted(glob.glob("/dev/snd/*")))
+        # Bluetooth headsets appear as input devices rather than sound cards
+        parts.extend(sorted(glob.glob("/sys/class/bluetooth/*/*:*")))
+    elif sys.platform == "win32":
+        try:
+            import winreg
+            root = r"SOFTWARE\Microsoft\Windows\CurrentVersion\MMDevices\Audio"
+            for flow in ("Capture", "Render"):
+                with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, f"{root}\\{flow}") as key:
+                    for i in range(winreg.QueryInfoKey(key)[0]):
+                        name = winreg.EnumKey(key, i)
+                        with winreg.OpenKey(key, name) as dev:
+                            state = winreg.QueryValueEx(dev, "DeviceState")[0]
+                        if state == 1:  # DEVICE_STATE_ACTIVE
+                            parts.append(f"{flow}:{name}")
+        except OSError:
+            return None
+    else:
+        return None
+
+    if not parts:
+        return None
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def probe_devices() -> List[AudioDevice]:
+    """Enumerate devices through PortAudio (the slow part the cache avoids)"""
+    devices = []
+    if SOUNDDEVICE_AVAILABLE:
+        host_apis = sd.query_hostapis()
+        for i, dev in enumerate(sd.query_devices()):
+            devices.append(AudioDevice(
+                index=i,
+                name=dev['name'],
+                is_input=dev['max_input_channels'] > 0,
+                is_output=dev['max_output_channels'] > 0,
+                max_input_channels=dev['max_input_channels'],
+                max_output_channels=dev['max_output_channels'],
+                default_samplerate=dev['default_samplerate'],
+                host_api=host_apis[dev['hostapi']]['name']
+            ))
+    elif PYAUDIO_AVAILABLE:
+        p = pyaudio.PyAudio()
+        try:
+            for i in range(p.get_device_count()):
+                dev = p.get_device_info_by_index(i)
+                devices.append(AudioDevice(
+                    index=i,
+                    name=dev['name'],
+                    is_input=dev['maxInputChannels'] > 0,
+                    is_output=dev['maxOutputChannels'] > 0,
+                    max_input_channels=dev['maxInputChannels'],
+                    max_output_channels=dev['maxOutputChannels'],
+                    default_samplerate=dev['defaultSampleRate'],
+                    host_api=p.get_host_api_info_by_index(dev['hostApi'])['name']
+                ))
+        finally:
+            p.terminate()
+    return devices
+
+
+def _default_input_index() -> Optional[int]:
+    if SOUNDDEVICE_AVAILABLE:
+        try:
+            index = sd.default.device[0]
+            return index if index is not None and index >= 0 else None
+        except Exception:
+            return None
+    return None
+
+
+class DeviceRegistry:
+    def __init__(self, cache_file: str = DEFAULT_CACHE_FILE, max_age: float = 24 * 3600):
+        """
+        Audio device list that persists across restarts
+
+        Probe results are cached in a JSON file together with a hardware
+        signature and only re-probed when the signature changes (or, where no
+        signature is available, when the cache is older than max_age). The
+        user's chosen input is remembered by name and host API, so it is
+        found again after its index moves.
+
+        Args:
+            cache_file: Where probe results and the preferred input are stored
+            max_age: Seconds before re-probing on platforms without a hardware signature
+        """
+        self.cache_file = cache_file
+        self.max_age = max_age
+        self.devices: List[AudioDevice] = []
+        self.preferred_input: Optional[str] = None
+        self.signature: Optional[str] = None
+        self.probed_at = 0.0
+        self._watcher = None
+        self._stop_watching = threading.Event()
+        self._load()
+        self.refresh()
+
+    def _load(self):
+        try:
+            with open(self.cache_file, 'r') as f:
+                data = json.load(f)
+            self.devices = [AudioDevice(**dev) for dev in data.get("devices", [])]
+            self.preferred_input = data.get("preferred_input")
+            self.signature = data.get("signature")
+            self.probed_at = data.get("probed_at", 0.0)
+        except (OSError, ValueError, TypeError):
+            self.devices = []
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok=True)
+            with open(self.cache_file, 'w') as f:
+                json.dump({
+                    "signature": self.signature,
+                    "probed_at": self.probed_at,
+                    "preferred_input": self.preferred_input,
+                    "devices": [asdict(dev) for dev in self.devices]
+                }, f, indent=2)
+        except OSError as e:
+            print(f"Could not save device cache: {str(e)}")
+
+    def is_stale(self) -> bool:
+        if not self.devices:
+            return True
+        signature = hardware_signature()
+        if signature is None:
+            return time.time() - self.probed_at > self.max_age
+        return signature != self.signature
+
+    def refresh(self, force: bool = False) -> bool:
+        """Re-probe if hardware changed; returns True if the list was rebuilt"""
+        if not force and not self.is_stale():
+            return False
+        try:
+            self.devices = probe_devices()
+        except Exception as e:
+            print(f"Audio device detection failed: {str(e)}")
+            return False
+        self.signature = hardware_signature()
+        self.probed_at = time.time()
+        self._save()
+        return True
+
+    def inputs(self) -> List[AudioDevice]:
+        return [dev for dev in self.devices if dev.is_input]
+
+    def get(self, index: int) -> Optional[AudioDevice]:
+        return next((dev for dev in self.devices if dev.index == index), None)
+
+    def find_input(self, name: str) -> Optional[AudioDevice]:
+        """First input whose name contains the given text (case-insensitive)"""
+        name = name.lower()
+        return next((dev for dev in self.inputs() if name in dev.name.lower()), None)
+
+    def set_preferred_input(self, device: AudioDevice):
+        self.preferred_input = device.uid
+        self._save()
+
+    def input_device(self) -> Optional[AudioDevice]:
+        """The remembered input if attached, else the system default, else the first input"""
+        inputs = self.inputs()
+        for dev in inputs:
+            if dev.uid == self.preferred_input:
+                return dev
+        default = _default_input_index()
+        for dev in inputs:
+            if dev.index == default:
+                return dev
+        return inputs[0] if inputs else None
+
+    def watch(self, on_change: Callable[[], None], interval: float = 5.0):
+        """
+        Poll the hardware signature in the background and call on_change after hot-plugs
+
+        Each signature is reported once, even if the probe on_change runs fails
+        and leaves self.signature behind - otherwise a device in a bad state
+        would reset audio on every poll.
+        """
+        if self._watcher is not None or hardware_signature() is None:
+            return
+
+        def poll():
+            seen = self.signature
+            while not self._stop_watching.wait(interval):
+                signature = hardware_signature()
+                if signature not in (seen, self.signature):
+                    seen = signature
+                    print("Audio devices changed")
+                    on_change()
+                else:
+                    seen = signature
+
+        self._stop_watching.clear()
+        self._watcher = threading.Thread(target=poll, daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        if self._watcher is not None:
+            self._stop_watching.set()
+            self._watcher.join()
+            self._watcher = None
+
+
+def reinitialize_portaudio():
+    """
+    Make sounddevice see added or removed devices
+
+    Input streams must be closed first; playback and stream opens in
+    progress are waited for through portaudio_lock.
+    """
+    if SOUNDDEVICE_AVAILABLE:
+        with portaudio_lock:
+            sd._terminate()
+            sd._initialize()
@@ -0,0 +1,156 @@
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterator
+from ai_core import DEFAULT_SESSION, CancelToken, is_error_reply
+from skills import AUTHORITATIVE_SKILLS, LOOKUP_FAILURES
+
+SKILL = "skill"
+LLM = "llm"
+
+
+@dataclass
+class Outcome:
+    """Who answers a command: a skill reply, or the LLM's reply as it streams"""
+    source: str
+    text: str = ""
+    chunks: Iterator[str] = field(default_factory=lambda: iter(()))
+
+
+@dataclass
+class DispatchStats:
+    serial: int = 0       # no lookup to race: skills first, then the LLM
+    skill_wins: int = 0   # lookup answered first; the LLM request was cancelled
+    llm_wins: int = 0     # LLM answered first; the lookup result was dropped
+    fallbacks: int = 0    # lookup came back empty-handed, the LLM was already running
+    timeouts: int = 0     # lookup gave no answer within lookup_timeout
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def summary(self) -> Dict:
+        return {"serial": self.serial, "skill_wins": self.skill_wins,
+                "llm_wins": self.llm_wins, "fallbacks": self.fallbacks, "timeouts": self.timeouts}
+
+
+class Dispatcher:
+    def __init__(self, skills, ai, speculative: bool = True, lookup_timeout: float = 5.0):
+        """
+        Routes a command to the skills or the LLM
+
+        Serially, skills run first and the LLM only starts once they have
+        nothing to say, so a Wikipedia, Wolfram or weather lookup that fails
+        adds its whole latency to the LLM's. Speculatively, commands routed
+        to such a lookup start the LLM request at the same time. For
+        Wikipedia, a lookup answer that arrives before the LLM's first chunk
+        wins and cancels the request, otherwise the LLM's reply is used and
+        the lookup's is dropped. Weather and calculations are authoritative
+        (skills.AUTHORITATIVE_SKILLS): they win whenever they answer, and the
+        LLM is only used if they fail or take longer than lookup_timeout.
+        Local actions (opening sites, screenshots, shutdown, email) always
+        run serially - they are instant, and their side effects must happen.
+
+        A blocking lookup can't be interrupted; it finishes in the background
+        and its result is ignored. A cancelled LLM request gives its session
+        slot back at once, stops at its next chunk and never enters the
+        conversation history.
+
+        Args:
+            skills: Skills instance
+            ai: AICore instance
+            speculative: Race lookups against the LLM (costs an LLM request per lookup the skill wins)
+            lookup_timeout: Seconds to wait for a lookup before answering with the LLM
+        """
+        self.skills = skills
+        self.ai = ai
+        self.speculative = speculative
+        self.lookup_timeout = lookup_timeout
+        self.stats = DispatchStats()
+
+    def dispatch(self, command: str, session_id: str = DEFAULT_SESSION) -> Outcome:
+        """Answer to a command; session_id names the AICore conversation it belongs to"""
+        if not self.speculative or not self.skills.is_lookup(command):
+            self.stats.count("serial")
+            reply = self.skills.handle_command(command)
+            if reply:
+                return Outcome(SKILL, reply)
+            return Outcome(LLM, chunks=self.ai.stream_query(command, session_id=session_id))
+        return self._race(command, session_id)
+
+    def _race(self, command: str, session_id: str) -> Outcome:
+        events = queue.Queue()   # (SKILL, reply) and (LLM, first chunk or None)
+        chunks = queue.Queue()   # the LLM's reply, None-terminated
+        cancel = CancelToken()
+        authoritative = self.skills.route(command) in AUTHORITATIVE_SKILLS
+
+        def lookup():
+            try:
+                reply = self.skills.handle_command(command)
+            except Exception as e:
+                print(f"Skill error: {str(e)}")
+                reply = ""
+            events.put((SKILL, reply))
+
+        def generate():
+            first = None
+            try:
+                for chunk in self.ai.stream_query(command, cancel=cancel, session_id=session_id):
+                    chunks.put(chunk)
+                    if first is None:
+                        first = chunk
+                        events.put((LLM, chunk))
+            finally:
+                chunks.put(None)
+                if first is None:
+                    events.put((LLM, None))
+
+        threading.Thread(target=lookup, name="skill-lookup", daemon=True).start()
+        threading.Thread(target=generate, name="llm-speculative", daemon=True).start()
+
+        deadline = time.monotonic() + self.lookup_timeout
+        skill_reply = None   # set once the lookup is over without an answer
+        llm_ready = None     # True once the LLM has a reply coming, False if it failed
+        while True:
+            if skill_reply is not None and llm_ready is not None:
+                if llm_ready:
+                    self.stats.count("fallbacks")
+                    return Outcome(LLM, chunks=self._drain(chunks, cancel))
+                break
+            if llm_ready and not authoritative:
+                self.stats.count("llm_wins")
+                return Outcome(LLM, chunks=self._drain(chunks, cancel))
+            try:
+                wait = None if skill_reply is not None else max(0.0, deadline - time.monotonic())
+                source, value = events.get(timeout=wait)
+            except queue.Empty:
+                print("Skill lookup timed out, answering with the AI brain")
+                self.stats.count("timeouts")
+                skill_reply = ""
+                continue
+            if source == SKILL:
+                if value and value not in LOOKUP_FAILURES:
+                    cancel.set()
+                    self.stats.count("skill_wins")
+                    return Outcome(SKILL, value)
+                skill_reply = value
+            else:
+                llm_ready = value is not None and not is_error_reply(value)
+
+        # Neither had an answer: a lookup's "couldn't find" beats an LLM error
+        if skill_reply:
+            return Outcome(SKILL, skill_reply)
+        return Outcome(LLM, chunks=self._drain(chunks, cancel))
+
+    @staticmethod
+    def _drain(chunks: queue.Queue, cancel: threading.Event) -> Iterator[str]:
+        try:
+            while True:
+                chunk = chunks.get()
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            cancel.set()  # the consumer may have stopped early
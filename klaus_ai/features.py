@@ -0,0 +1,160 @@
+import threading
+from typing import Optional, Tuple
+import numpy as np
+
+# Whisper's front end: 25 ms Hann windows every 10 ms at 16 kHz, 80 mel bands
+SAMPLE_RATE = 16000
+N_FFT = 400
+HOP = 160
+N_MELS = 80
+WHISPER_FRAMES = 3000  # one 30 s Whisper input window
+
+
+def _slaney_mel_filters(samplerate: int, n_fft: int, n_mels: int) -> np.ndarray:
+    """Slaney-scale, area-normalised mel filters (what librosa and Whisper use)"""
+    f_sp = 200.0 / 3
+    min_log_hz = 1000.0
+    min_log_mel = min_log_hz / f_sp
+    logstep = np.log(6.4) / 27.0
+
+    def to_mel(f):
+        f = np.asarray(f, dtype=np.float64)
+        return np.where(f < min_log_hz, f / f_sp,
+                        min_log_mel + np.log(np.maximum(f, 1e-10) / min_log_hz) / logstep)
+
+    def to_hz(m):
+        return np.where(m < min_log_mel, m * f_sp, min_log_hz * np.exp(logstep * (m - min_log_mel)))
+
+    edges = to_hz(np.linspace(to_mel(0.0), to_mel(samplerate / 2), n_mels + 2))
+    bins = np.fft.rfftfreq(n_fft, 1.0 / samplerate)
+    lower, center, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    rising = (bins - lower) / (center - lower)
+    falling = (upper - bins) / (upper - center)
+    weights = np.maximum(0.0, np.minimum(rising, falling))
+    weights *= (2.0 / (edges[2:] - edges[:-2]))[:, None]
+    return weights.astype(np.float32)
+
+
+def mel_filters(n_mels: int = N_MELS) -> np.ndarray:
+    """Mel filterbank, shape (n_mels, N_FFT // 2 + 1) - Whisper's own when it is installed"""
+    try:
+        import whisper
+        return whisper.audio.mel_filters("cpu", n_mels).numpy()
+    except Exception:
+        return _slaney_mel_filters(SAMPLE_RATE, N_FFT, n_mels)
+
+
+class LogMelFrontend:
+    """log10 mel power and RMS level for 25 ms frames every 10 ms"""
+
+    def __init__(self, n_mels: int = N_MELS):
+        self.n_mels = n_mels
+        self.window = np.hanning(N_FFT + 1)[:-1].astype(np.float32)  # periodic, like torch
+        self.filters = mel_filters(n_mels)
+        self._pending = np.zeros(0, dtype=np.float32)
+
+    def compute(self, audio: np.ndarray, count: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Features for the first `count` frames of audio, frame i starting at sample i * HOP"""
+        frames = np.lib.stride_tricks.sliding_window_view(audio, N_FFT)[::HOP][:count]
+        power = np.abs(np.fft.rfft(frames * self.window)) ** 2
+        mel = np.log10(np.maximum(power @ self.filters.T, 1e-10)).astype(np.float32)
+        levels = np.sqrt(np.mean(np.square(frames), axis=1)).astype(np.float32)
+        return mel, levels
+
+    def reset(self):
+        self._pending = np.zeros(0, dtype=np.float32)
+
+    def process(self, samples: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Streaming use without a cache: features for every frame completed by these samples"""
+        audio = np.concatenate((self._pending, samples.astype(np.float32, copy=False)))
+        if len(audio) < N_FFT:
+            self._pending = audio
+            return np.zeros((0, self.n_mels), dtype=np.float32), np.zeros(0, dtype=np.float32)
+        count = 1 + (len(audio) - N_FFT) // HOP
+        self._pending = audio[count * HOP:]
+        return self.compute(audio, count)
+
+
+def whisper_normalize(mel: np.ndarray) -> np.ndarray:
+    """Whisper's dynamic range clamp and scaling, applied over one utterance"""
+    mel = np.maximum(mel, mel.max() - 8.0)
+    return (mel + 4.0) / 4.0
+
+
+class FeatureCache:
+    def __init__(self, buffer, n_mels: int = N_MELS):
+        """
+        Log-mel features of a capture ring buffer, computed once per frame
+
+        Frame i is centred on sample i * HOP, matching Whisper's STFT, and is
+        computed the first time any consumer asks for it. The wake word
+        detector, its activity gate and Whisper all read the same frames
+        instead of each running its own FFTs over the same audio.
+
+        Args:
+            buffer: audio_capture.RingBuffer holding 16 kHz mono audio
+            n_mels: Mel bands (80 for every Whisper model but large-v3)
+        """
+        self.buffer = buffer
+        self.n_mels = n_mels
+        self.frontend = LogMelFrontend(n_mels)
+        self.capacity = buffer.capacity // HOP
+        self._mel = np.zeros((self.capacity, n_mels), dtype=np.float32)
+        self._levels = np.zeros(self.capacity, dtype=np.float32)
+        self.computed = 0   # absolute index of the next frame to compute
+        self._lock = threading.Lock()
+
+    def _oldest_frame(self) -> int:
+        """First frame whose window is still entirely in the ring buffer"""
+        oldest = self.buffer.oldest()
+        return 0 if oldest == 0 else -(-(oldest + N_FFT // 2) // HOP)
+
+    def update(self) -> int:
+        """Compute every frame the buffered audio allows; returns the frame count"""
+        with self._lock:
+            written = self.buffer.total_written
+            available = (written - N_FFT // 2) // HOP + 1 if written >= N_FFT // 2 else 0
+            first = max(self.computed, self._oldest_frame(), available - self.capacity)
+            if available <= first:
+                return self.computed
+            start = first * HOP - N_FFT // 2
+            audio = self.buffer.read(max(start, 0), (available - 1) * HOP + N_FFT // 2)
+            if start < 0:
+                # Stream start: pad like a centred STFT would
+                audio = np.concatenate((np.zeros(-start, dtype=np.float32), audio))
+            count = available - first
+            mel, levels = self.frontend.compute(audio, count)
+            slots = np.arange(first, available) % self.capacity
+            self._mel[slots] = mel
+            self._levels[slots] = levels
+            self.computed = available
+            return self.computed
+
+    def read(self, start: int, end: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(mel, levels) for the frames covering samples [start, end), shape (frames, n_mels)"""
+        mel, levels, _ = self.read_frames(start // HOP, end)
+        return mel, levels
+
+    def read_frames(self, frame: int, end: int) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        (mel, levels, next frame) from frame index `frame` up to sample `end`
+
+        Frames near the write head aren't computed until more audio arrives,
+        so a streaming reader continues from the returned index rather than
+        from `end`, which would skip them.
+        """
+        self.update()
+        first = max(frame, self._oldest_frame(), self.computed - self.capacity)
+        last = min(end // HOP, self.computed)
+        if last <= first:
+            empty = np.zeros((0, self.n_mels), dtype=np.float32), np.zeros(0, dtype=np.float32)
+            return empty + (first,)
+        slots = np.arange(first, last) % self.capacity
+        return self._mel[slots], self._levels[slots], last
+
+    def whisper_input(self, start: int, end: int) -> Optional[np.ndarray]:
+        """Normalised (n_mels, frames) mel of an utterance, ready for whisper.decode"""
+        mel, _ = self.read(start, end)
+        if not len(mel):
+            return None
+        return whisper_normalize(mel).T.copy()
@@ -1,7 +1,13 @@
+import argparse
 import time
+from audio_sources import ReplaySource
+from tts_worker import SimulatedTTSEngine
 from voice_interface import VoiceEngine
-from ai_core import AICore
-from skills import Skills
+from wake_word import WakeWordDetector
+from ai_core import AICore, iter_sentences
+from dispatch import Dispatcher, SKILL
+from response_cache import ResponseCache
+from skills import Skills, FIXED_RESPONSES
 from memory import MemorySystem
 from personality import PersonalityEngine
 from utils import print_banner, clear_screen
@@ -9,20 +15,45 @@ import threading
 
 WAKE_WORD = "hey klaus"
 SLEEP_TIMEOUT = 30  # seconds of inactivity before sleeping
+GREETING = "Klaus initialized. Say 'Hey Klaus' to activate me."
+FIXED_PHRASES = ["Activated", "Going to sleep", "Shutting down", GREETING] + FIXED_RESPONSES
 
 class Klaus:
-    def __init__(self):
-        self.voice = VoiceEngine(use_offline=False)  # Explicitly set mode
-        self.ai = AICore()
+    def __init__(self, audio_source=None, tts_engine_factory=None, asr_backend=None,
+                 enhance_audio=False, cache_responses=True, speculative=True):
+        """
+        Args:
+            audio_source: Replay a recording instead of listening to the microphone
+            tts_engine_factory: TTS engine override, e.g. SimulatedTTSEngine on headless machines
+            asr_backend: Local recognition backend (e.g. "cascade"), None for online recognition
+            enhance_audio: Noise gate and AGC on speech before recognition (noisy rooms)
+            cache_responses: Answer repeated questions from the response cache
+            speculative: Start the LLM alongside online skill lookups instead of after them
+        """
         self.skills = Skills()
+        self.voice = VoiceEngine(
+            use_offline=asr_backend not in (None, "google"),  # Explicitly set mode
+            asr_backend=asr_backend,
+            audio_source=audio_source,
+            tts_engine_factory=tts_engine_factory,
+            enhance_audio=enhance_audio,
+            # Cascade: re-decode with the larger model when no skill matches
+            transcript_check=self.skills.matches
+        )
+        self.ai = AICore(cache=ResponseCache(enabled=cache_responses))
+        self.dispatcher = Dispatcher(self.skills, self.ai, speculative)
         self.memory = MemorySystem()
         self.personality = PersonalityEngine()
+        self.wake_detector = WakeWordDetector()
         self.active = False
         self.last_activity = time.time()
         
+        # Render constant phrases while idle so they play back instantly
+        self.voice.prerender_phrases(FIXED_PHRASES)
+        
         # Load memory
         self.memory.load()
-        self.ai.context = self.memory.get_recent_context(10)
+        self.ai.restore_history(self.memory.get_recent_context(10))
         
     def wake(self):
         """Activate the assistant"""
@@ -36,7 +67,7 @@ class Klaus:
         """Put assistant to sleep"""
         if self.active:
             self.active = False
-            self.voice.speak("Going to sleep")
+            self.voice.speak("Going to sleep", wait=False)
             print("Klaus Sleeping")
     
     def process_command(self, command):
@@ -46,39 +77,43 @@ class Klaus:
         # Save interaction to memory
         self.memory.add_interaction(command, "")
         
-        # First try skills system
-        skill_response = self.skills.handle_command(command)
+        # Skills first - or racing the AI brain when the skill is an online lookup
+        outcome = self.dispatcher.dispatch(command)
         
-        if skill_response:
+        if outcome.source == SKILL:
+            skill_response = outcome.text
             if skill_response == "shutdown":
                 self.voice.speak("Shutting down")
                 self.memory.save()
+                self.ai.close()
                 exit()
                 
             # Apply personality to response
             final_response = self.personality.adjust_response(skill_response)
-            self.voice.speak(final_response)
+            # Don't block the listener thread while talking
+            self.voice.speak(final_response, wait=False)
             self.memory.update_last_response(final_response)
         else:
-            # Fallback to AI brain
-            ai_response = self.ai.process_query(command)
-            personality_response = self.personality.adjust_response(ai_response)
-            self.voice.speak(personality_response)
-            self.memory.update_last_response(personality_response)
+            # Fallback to AI brain - speak each sentence as soon as it is generated
+            spoken = []
+            for sentence in self.personality.adjust_stream(iter_sentences(outcome.chunks)):
+                self.voice.speak(sentence, wait=False)
+                spoken.append(sentence)
+            self.memory.update_last_response(" ".join(spoken))
     
     def run(self):
         """Main execution loop"""
         clear_screen()
         print_banner()
         print("Initializing Klaus System...")
-        self.voice.speak("Klaus initialized. Say 'Hey Klaus' to activate me.")
+        self.voice.speak(GREETING)
         
         # Start continuous listening in background
         listener_thread = threading.Thread(target=self.continuous_listener)
         listener_thread.daemon = True
         listener_thread.start()
         
-        while True:
+        while listener_thread.is_alive():
             try:
                 # Check for sleep timeout
                 if self.active and time.time() - self.last_activity > SLEEP_TIMEOUT:
@@ -88,25 +123,70 @@ class Klaus:
             except KeyboardInterrupt:
                 self.voice.speak("Shutting down")
                 self.memory.save()
+                self.ai.close()
                 exit()
+
+        # Only reached when a replayed recording has ended
+        print("Audio replay finished")
+        print(f"Recognition: {self.voice.recognition_metrics()}")
+        print(f"Response cache: {self.ai.cache_metrics()}")
+        print(f"Dispatch: {self.dispatcher.stats.summary()}")
+        self.ai.close()
+        self.voice.close()
     
+    def on_partial(self, partial):
+        """Accept a partial transcription early when it is already a complete skill command"""
+        print(f"\r... {partial.text}", end="", flush=True)
+        return not partial.unstable and self.skills.is_instant_command(partial.stable)
+
     def continuous_listener(self):
         """Background thread for continuous listening"""
-        while True:
+        use_detector = self.wake_detector.ready() and self.voice.streaming
+        if not use_detector:
+            print("No wake word templates enrolled (run wake_word.py), using speech recognition")
+            
+        while not self.voice.input_finished:
             if not self.active:
-                # Low-power mode - check only for wake word
-                user_input = self.voice.listen(timeout=1)
-                if WAKE_WORD in user_input:
+                if use_detector:
+                    # Low-power mode - local keyword spotting, no recognition until it fires
+                    if self.voice.wait_for_wake_word(self.wake_detector, timeout=1):
+                        self.wake()
+                        success, command = self.voice.listen(timeout=3)
+                        if success and command:
+                            self.process_command(command)
+                    continue
+                    
+                # Fallback - recognise everything and look for the wake word
+                success, user_input = self.voice.listen(timeout=1)
+                if success and WAKE_WORD in user_input:
                     self.wake()
                     command = user_input.replace(WAKE_WORD, "").strip()
                     if command:
                         self.process_command(command)
             else:
                 # Active mode - process all speech
-                user_input = self.voice.listen(timeout=2)
-                if user_input:
+                success, user_input = self.voice.listen(timeout=2, on_partial=self.on_partial)
+                if success and user_input:
                     self.process_command(user_input)
 
 if __name__ == "__main__":
-    assistant = Klaus()
+    parser = argparse.ArgumentParser(description="Klaus voice assistant")
+    parser.add_argument("--replay", help="Run on a recorded session (WAV or .npy) instead of the microphone")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed relative to real time")
+    parser.add_argument("--silent", action="store_true", help="Simulate speech output (no audio device needed)")
+    parser.add_argument("--asr", help="Recognise locally with this backend, e.g. whisper-base or cascade")
+    parser.add_argument("--enhance", action="store_true", help="Noise gate and AGC before recognition")
+    parser.add_argument("--no-cache", action="store_true", help="Always ask the model, never a cached reply")
+    parser.add_argument("--no-speculate", action="store_true", help="Only ask the model after skill lookups fail")
+    args = parser.parse_args()
+
+    source = ReplaySource.from_file(args.replay, speed=args.speed) if args.replay else None
+    assistant = Klaus(
+        audio_source=source,
+        tts_engine_factory=SimulatedTTSEngine if args.silent else None,
+        asr_backend=args.asr,
+        enhance_audio=args.enhance,
+        cache_responses=not args.no_cache,
+        speculative=not args.no_speculate
+    )
     assistant.run()
\ No newline at end of file
@@ -6,6 +6,7 @@ import queue
 from voice_interface import VoiceEngine
 from ai_core import AICore
 from skills import Skills
+from dispatch import Dispatcher, SKILL
 import time
 import os
 
@@ -17,9 +18,12 @@ class KlausGUI:
         self.root.minsize(700, 500)
         
         # Initialize Klaus components
-        self.voice = VoiceEngine()
+        # Offline recognition (Whisper, used when Google is unavailable) decodes in its
+        # own process so it never freezes the window
+        self.voice = VoiceEngine(asr_process=True)
         self.ai = AICore()
         self.skills = Skills()
+        self.dispatcher = Dispatcher(self.skills, self.ai)
         self.message_queue = queue.Queue()
         
         # GUI state variables
@@ -189,14 +193,19 @@ class KlausGUI:
     def voice_listen_thread(self):
         """Thread for voice recognition"""
         while self.listening:
-            text = self.voice.listen(timeout=2)
-            if text:
+            success, text = self.voice.listen(timeout=2, on_partial=self.show_partial)
+            if success and text:
                 self.message_queue.put(('user', text))
                 self.process_command(text)
             time.sleep(0.1)
         
         self.status_var.set("Ready")
 
+    def show_partial(self, partial):
+        """Show live transcription in the status bar"""
+        self.status_var.set(f"Hearing: {partial.text}")
+        return False
+
     def send_text_message(self, event=None):
         """Send text message from input box"""
         text = self.user_input.get()
@@ -219,10 +228,11 @@ class KlausGUI:
 
     def process_command_thread(self, command):
         """Thread for processing commands"""
-        # First try skills system
-        skill_response = self.skills.handle_command(command)
+        # Skills first - or racing the AI brain when the skill is an online lookup
+        outcome = self.dispatcher.dispatch(command)
         
-        if skill_response:
+        if outcome.source == SKILL:
+            skill_response = outcome.text
             if skill_response == "shutdown":
                 self.message_queue.put(('system', "Shutting down"))
                 self.root.after(1000, self.root.quit)
@@ -230,7 +240,7 @@ class KlausGUI:
                 self.message_queue.put(('klaus', skill_response))
         else:
             # Fallback to AI brain
-            ai_response = self.ai.process_query(command)
+            ai_response = "".join(outcome.chunks)
             self.message_queue.put(('klaus', ai_response))
         
         self.thinking = False
@@ -307,6 +317,8 @@ class KlausGUI:
         self.message_queue.put(('system', welcome_msg))
         
         self.root.mainloop()
+        self.voice.shutdown()
+        self.ai.close()
 
 if __name__ == "__main__":
     root = tk.Tk()
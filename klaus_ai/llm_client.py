@@ -0,0 +1,197 @@
+import json
+import os
+import random
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    def __init__(self, message: str, status: Optional[int] = None, retryable: bool = False):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+
+
+class LLMTimeout(LLMError):
+    """The request's deadline passed"""
+
+
+def _limit_read_timeout(response: requests.Response, seconds: float):
+    """
+    Shorten the socket timeout of an open streaming response
+
+    requests fixes the read timeout when the request is sent; a stream
+    has to tighten it as its deadline nears. Best effort - it reaches into
+    http.client's socket, which other transports may not have.
+    """
+    try:
+        response.raw._fp.fp.raw._sock.settimeout(max(0.01, seconds))
+    except (AttributeError, OSError):
+        pass
+
+
+class LLMClient:
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 model: str = "gpt-4-turbo", deadline: float = 30.0,
+                 connect_timeout: float = 3.05, read_timeout: float = 15.0,
+                 max_retries: int = 3, backoff: float = 0.5, max_backoff: float = 8.0,
+                 pool_size: int = 8):
+        """
+        Chat completions over a pooled keep-alive session, with bounded waits
+
+        Every call has an overall deadline covering connects, retries and
+        (for streams) the whole reply, so a slow upstream can't hold a
+        caller forever. Connection failures, timeouts and 429/5xx responses
+        are retried with full-jitter exponential backoff, honouring
+        Retry-After; a stream is only retried before its first token.
+
+        Args:
+            api_key: Bearer token, defaults to $OPENAI_API_KEY
+            base_url: API root, defaults to $OPENAI_BASE_URL or OpenAI
+                (point it at llm_stub_server for offline testing)
+            model: Default model for requests that don't name one
+            deadline: Seconds a call may take in total
+            connect_timeout: Seconds to establish a connection
+            read_timeout: Seconds to wait for the next bytes of a response
+            max_retries: Retries after the first attempt
+            backoff: First retry's maximum delay in seconds, doubled per retry
+            max_backoff: Cap on a single retry delay
+            pool_size: Keep-alive connections held for concurrent callers
+        """
+        self.api_key = api_key if api_key is not None else os.getenv("OPENAI_API_KEY")
+        self.base_url = (base_url or os.getenv("OPENAI_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+        self.model = model
+        self.deadline = deadline
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.session = requests.Session()
+        # Retries are ours (they need the deadline); urllib3's stay off
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if self.api_key:
+            self.session.headers["Authorization"] = f"Bearer {self.api_key}"
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    @property
+    def configured(self) -> bool:
+        """False when there is no API key and the endpoint is the real API"""
+        return bool(self.api_key) or self.base_url != DEFAULT_BASE_URL
+
+    def close(self):
+        self.session.close()
+
+    def chat(self, messages: List[Dict], deadline: Optional[float] = None, **params) -> str:
+        """Reply text for a chat completion"""
+        expires = time.monotonic() + (deadline or self.deadline)
+        response = self._post(self._payload(messages, params, stream=False), expires, stream=False)
+        try:
+            return response.json()["choices"][0]["message"]["content"]
+        except (ValueError, KeyError, IndexError) as e:
+            raise LLMError(f"Malformed completion: {str(e)}")
+
+    def stream_chat(self, messages: List[Dict], deadline: Optional[float] = None, **params) -> Iterator[str]:
+        """Reply text in chunks as the server generates it (server-sent events)"""
+        expires = time.monotonic() + (deadline or self.deadline)
+        response = self._post(self._payload(messages, params, stream=True), expires, stream=True)
+        try:
+            # No single read may outlast the deadline, even one stalled mid-line
+            _limit_read_timeout(response, expires - time.monotonic())
+            for line in response.iter_lines(decode_unicode=True):
+                if time.monotonic() > expires:
+                    raise LLMTimeout("Reply did not finish before the deadline")
+                _limit_read_timeout(response, expires - time.monotonic())
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    return
+                try:
+                    text = json.loads(data)["choices"][0]["delta"].get("content")
+                except (ValueError, KeyError, IndexError) as e:
+                    raise LLMError(f"Malformed stream chunk: {str(e)}")
+                if text:
+                    yield text
+        except requests.RequestException as e:
+            # A read cut off by the limit above ends at the deadline, give or take timer slack
+            if time.monotonic() >= expires - 0.05:
+                raise LLMTimeout("Reply did not finish before the deadline")
+            raise LLMError(f"Stream interrupted: {str(e)}")
+        finally:
+            response.close()
+
+    def _payload(self, messages, params, stream: bool) -> Dict:
+        payload = {"model": self.model, "messages": messages, **params}
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _post(self, payload: Dict, expires: float, stream: bool) -> requests.Response:
+        url = f"{self.base_url}/chat/completions"
+        self._count("requests")
+        for attempt in range(self.max_retries + 1):
+            remaining = expires - time.monotonic()
+            if remaining <= 0:
+                self._count("failures")
+                raise LLMTimeout("No reply before the deadline")
+            retry_after = None
+            try:
+                response = self.session.post(
+                    url, json=payload, stream=stream,
+                    timeout=(min(self.connect_timeout, remaining), min(self.read_timeout, remaining))
+                )
+            except requests.Timeout as e:
+                error = LLMTimeout(f"Timed out: {str(e)}", retryable=True)
+            except requests.ConnectionError as e:
+                error = LLMError(f"Connection failed: {str(e)}", retryable=True)
+            else:
+                if response.status_code < 400:
+                    return response
+                error = LLMError(self._error_message(response), response.status_code,
+                                 retryable=response.status_code in RETRY_STATUSES)
+                retry_after = self._retry_after(response)
+                response.close()
+
+            if not error.retryable or attempt == self.max_retries:
+                self._count("failures")
+                raise error
+            # Full jitter keeps many clients from retrying in lockstep
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            if time.monotonic() + delay >= expires:
+                self._count("failures")
+                raise error
+            self._count("retries")
+            time.sleep(delay)
+
+    @staticmethod
+    def _retry_after(response: requests.Response) -> Optional[float]:
+        try:
+            return float(response.headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            return None  # absent, or an HTTP date we don't bother parsing
+
+    @staticmethod
+    def _error_message(response: requests.Response) -> str:
+        try:
+            message = response.json()["error"]["message"]
+        except (ValueError, KeyError, TypeError):
+            message = response.text[:200]
+        return f"HTTP {response.status_code}: {message}"
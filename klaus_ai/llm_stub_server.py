@@ -0,0 +1,234 @@
+"""
+Local stand-in for the OpenAI chat completions API
+
+Answers POST /v1/chat/completions (plain and streamed) with a canned
+reply after a configurable delay, and can inject 429/503 responses, so
+llm_client.LLMClient can be exercised and load-tested without a network.
+
+Usage:
+    python llm_stub_server.py --port 8099 --latency 0.3 --error-rate 0.1
+    OPENAI_BASE_URL=http://127.0.0.1:8099/v1 python klaus.py
+
+    python llm_stub_server.py --load-test 500 --concurrency 16 --error-rate 0.1
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+import numpy as np
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    server: "StubLLMServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: Dict, headers: Optional[Dict] = None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "Invalid JSON"}})
+            return
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        stub = self.server
+        stub.count("requests")
+        failure = stub.pick_failure()
+        if failure:
+            stub.count("errors")
+            self._send_json(failure, {"error": {"message": "Injected failure"}},
+                            {"Retry-After": str(stub.retry_after)} if failure == 429 else None)
+            return
+
+        time.sleep(stub.latency)
+        reply = stub.reply_for(request.get("messages", []))
+        model = request.get("model", "stub")
+        if request.get("stream"):
+            self._stream(reply, model)
+        else:
+            self._send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": reply}}],
+            })
+
+    def _stream(self, reply: str, model: str):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(data: str):
+            payload = f"data: {data}\n\n".encode()
+            self.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+            self.wfile.flush()
+
+        for word in reply.split(" "):
+            chunk = {"object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {"content": word + " "}}]}
+            send(json.dumps(chunk))
+            if self.server.stall:
+                # Half an event, then nothing: the client is left waiting mid-line
+                self.wfile.write(b"6\r\ndata: \r\n")
+                self.wfile.flush()
+                time.sleep(self.server.stall)
+                return
+            time.sleep(self.server.token_delay)
+        send("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.1,
+                 token_delay: float = 0.02, error_rate: float = 0.0, retry_after: float = 0.1,
+                 reply: Optional[str] = None, seed: Optional[int] = None, stall: float = 0.0):
+        """
+        OpenAI-compatible chat completions server for offline tests
+
+        Args:
+            host: Interface to bind
+            port: Port to bind, 0 picks a free one (see base_url)
+            latency: Seconds before a reply starts
+            token_delay: Seconds between streamed words
+            error_rate: Fraction of requests answered with 429 or 503
+            retry_after: Retry-After seconds sent with 429s
+            reply: Fixed reply text, defaults to echoing the last user message
+            seed: Seed for failure injection
+            stall: Go quiet mid-line for this many seconds after the first streamed chunk
+        """
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.token_delay = token_delay
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.reply = reply
+        self.stall = stall
+        self.stats = {"requests": 0, "errors": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def pick_failure(self) -> Optional[int]:
+        with self._lock:
+            if self._random.random() >= self.error_rate:
+                return None
+            return self._random.choice((429, 503))
+
+    def reply_for(self, messages) -> str:
+        if self.reply is not None:
+            return self.reply
+        last = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        return f"You said: {last}. This is the local stand-in model."
+
+    def start(self) -> "StubLLMServer":
+        """Serve from a background thread"""
+        self._thread = threading.Thread(target=self.serve_forever, name="llm-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def load_test(base_url: str, total: int, concurrency: int, stream: bool = False, **client_options) -> Dict:
+    """Send `total` requests from `concurrency` threads through one LLMClient"""
+    from llm_client import LLMClient, LLMError
+
+    client = LLMClient(api_key="stub", base_url=base_url, pool_size=concurrency, **client_options)
+    messages = [{"role": "user", "content": "What is the weather like?"}]
+
+    def one(_):
+        start = time.perf_counter()
+        try:
+            if stream:
+                "".join(client.stream_chat(messages))
+            else:
+                client.chat(messages)
+            return time.perf_counter() - start, None
+        except LLMError as e:
+            return time.perf_counter() - start, str(e)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+    client.close()
+    latencies = [latency for latency, error in results if error is None]
+    return {
+        "requests": total,
+        "ok": len(latencies),
+        "failed": total - len(latencies),
+        "retries": client.retries,
+        "throughput": total / elapsed,
+        "p50": float(np.percentile(latencies, 50)) if latencies else None,
+        "p95": float(np.percentile(latencies, 95)) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds before each reply")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds between streamed words")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 429/503 responses")
+    parser.add_argument("--load-test", type=int, metavar="N", help="Send N requests through LLMClient, then exit")
+    parser.add_argument("--concurrency", type=int, default=8, help="Load test threads")
+    parser.add_argument("--stream", action="store_true", help="Load test with streamed replies")
+    args = parser.parse_args()
+
+    server = StubLLMServer(args.host, 0 if args.load_test else args.port, args.latency,
+                           args.token_delay, args.error_rate)
+    if args.load_test:
+        server.start()
+        try:
+            print(json.dumps(load_test(server.base_url, args.load_test, args.concurrency, args.stream), indent=2))
+            print(f"Server saw {server.stats['requests']} requests, injected {server.stats['errors']} errors")
+        finally:
+            server.stop()
+        return
+
+    print(f"Serving chat completions at {server.base_url} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
+import sys
 import speech_recognition as sr
+from device_registry import DeviceRegistry
 
 def test_microphone(device_index):
     r = sr.Recognizer()
@@ -15,5 +17,18 @@ def test_microphone(device_index):
             print(f"\nERROR: {str(e)}")
             return False
 
-# Replace with your Bluetooth mic index
-test_microphone(device_index=1)  # Change this number
\ No newline at end of file
+def find_microphone(name=None):
+    """Index of a microphone by (part of) its name - indexes change when headsets reconnect"""
+    registry = DeviceRegistry()
+    device = registry.find_input(name) if name else registry.input_device()
+    if device is None:
+        return None
+    # sr.Microphone numbers devices through PyAudio, so match by name there too
+    for index, mic_name in enumerate(sr.Microphone.list_microphone_names()):
+        if mic_name == device.name:
+            return index
+    return None
+
+if __name__ == "__main__":
+    # Usage: python mic_test.py [part of the device name], defaults to Klaus's input
+    test_microphone(device_index=find_microphone(sys.argv[1] if len(sys.argv) > 1 else None))
@@ -29,6 +29,28 @@ class PersonalityEngine:
             
         return response
     
+    def adjust_stream(self, sentences):
+        """adjust_response for a reply that arrives one sentence at a time"""
+        sentences = iter(sentences)
+        word_count = 0
+        for i, sentence in enumerate(sentences):
+            if i == 0 and ("error" in sentence.lower() or "sorry" in sentence.lower()):
+                # Don't modify error messages
+                yield sentence
+                yield from sentences
+                return
+            word_count += len(sentence.split())
+            if self.traits["formality"] < 3:
+                sentence = self.casualize(sentence)
+            if i == 0 and self.traits["enthusiasm"] > 3:
+                sentence = self.add_enthusiasm(sentence)
+            yield sentence
+            
+        if self.traits["humor_level"] > 3 and word_count > 5:
+            ending = self.add_humor("").strip()
+            if ending:
+                yield ending
+    
     def add_humor(self, response):
         """Add witty remarks occasionally"""
         if random.random() > 0.7:  # 30% chance to add humor
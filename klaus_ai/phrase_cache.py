@@ -0,0 +1,150 @@
+import hashlib
+import os
+import time
+import wave
+from collections import Counter, OrderedDict
+from typing import Callable, Optional, Tuple
+import numpy as np
+from device_registry import portaudio_lock
+
+try:
+    import sounddevice as sd
+    PLAYBACK_AVAILABLE = True
+except (ImportError, OSError):
+    PLAYBACK_AVAILABLE = False
+
+Clip = Tuple[np.ndarray, int]  # (float32 samples, sample rate)
+CACHE_DIR = os.path.join(os.getenv("KLAUS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "klaus")), "tts")
+
+
+def read_wav(path: str) -> Clip:
+    """Load a PCM WAV file as mono float32"""
+    with wave.open(path, 'rb') as f:
+        width, channels, rate = f.getsampwidth(), f.getnchannels(), f.getframerate()
+        data = f.readframes(f.getnframes())
+    if width != 2:
+        raise ValueError(f"Unsupported sample width {width}")
+    samples = np.frombuffer(data, dtype=np.int16).reshape(-1, channels)[:, 0]
+    return samples.astype(np.float32) / 32768.0, rate
+
+
+def play_clip(clip: Clip, interrupted: Callable[[], bool]) -> bool:
+    """Play a clip on the default output; returns False if it was interrupted"""
+    samples, rate = clip
+    # PortAudio must not be reinitialised under a playing stream
+    with portaudio_lock:
+        sd.play(samples, rate)
+        stream = sd.get_stream()
+        while stream.active:
+            if interrupted():
+                sd.stop()
+                return False
+            time.sleep(0.02)
+    return True
+
+
+class PhraseCache:
+    def __init__(self, cache_dir: str = CACHE_DIR, max_files: int = 500,
+                 max_memory_items: int = 64, auto_cache_after: int = 3):
+        """
+        Pre-rendered speech for phrases Klaus says often
+
+        Phrases are rendered to WAV once, kept on disk keyed by text, voice
+        and rate, and held in an in-memory LRU so playback can start
+        immediately. Rendering has to happen on the thread that owns the
+        TTS engine, so TTSWorker drives render().
+
+        Args:
+            cache_dir: Directory for rendered WAV files, defaults to ~/.cache/klaus/tts
+            max_files: Oldest files beyond this count are deleted
+            max_memory_items: Clips kept decoded in memory
+            auto_cache_after: Render any phrase once it has been spoken this many times
+        """
+        self.cache_dir = cache_dir
+        self.max_files = max_files
+        self.max_memory_items = max_memory_items
+        self.auto_cache_after = auto_cache_after
+        self.voice_key = ""
+        self._memory: "OrderedDict[str, Clip]" = OrderedDict()
+        self._counts = Counter()
+        self._failed = set()
+
+    def set_voice(self, voice, rate):
+        """Rendered audio depends on the voice settings, so they are part of the key"""
+        self.voice_key = f"{voice}|{rate}"
+        self._memory.clear()
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.voice_key}\n{text}".encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def _remember(self, key: str, clip: Clip):
+        self._memory[key] = clip
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, text: str) -> Optional[Clip]:
+        """Cached clip for the text, or None"""
+        key = self._key(text)
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            clip = read_wav(path)
+            os.utime(path)  # disk LRU is ordered by modification time
+        except (OSError, ValueError, wave.Error):
+            return None
+        self._remember(key, clip)
+        return clip
+
+    def should_render(self, text: str) -> bool:
+        """Count a live-synthesised phrase; True once it is frequent enough to cache"""
+        key = self._key(text)
+        if key in self._failed:
+            return False
+        self._counts[key] += 1
+        return self._counts[key] == self.auto_cache_after
+
+    def render(self, engine, text: str) -> bool:
+        """Synthesise text to the cache with the worker's engine"""
+        key = self._key(text)
+        path = self._path(key)
+        if key in self._memory or os.path.exists(path):
+            return True
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = os.path.join(self.cache_dir, f"{key}.tmp")
+        try:
+            engine.save_to_file(text, tmp)
+            engine.runAndWait()
+            clip = read_wav(tmp)
+            os.replace(tmp, path)
+        except (OSError, ValueError, wave.Error, EOFError) as e:
+            # Some drivers write formats we can't read - keep synthesising those live
+            print(f"Could not cache phrase '{text}': {str(e)}")
+            self._failed.add(key)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return False
+
+        self._remember(key, clip)
+        self._evict_files()
+        return True
+
+    def _evict_files(self):
+        files = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir) if f.endswith('.wav')]
+        if len(files) <= self.max_files:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - self.max_files]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
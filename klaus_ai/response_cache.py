@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional
+
+CACHE_DIR = os.getenv("KLAUS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "klaus"))
+DEFAULT_CACHE_FILE = os.path.join(CACHE_DIR, "responses.json")
+
+# Filler that doesn't change what is being asked
+FILLER = re.compile(r"^(?:(?:hey |ok |okay )?klaus|please|can you|could you|would you|tell me)\s+"
+                    r"|\s+(?:please|klaus)$")
+
+# Answers to these go stale within minutes, so they are never served from the cache
+TIME_SENSITIVE = [
+    r"\b(now|today|tonight|tomorrow|yesterday|currently|current|latest|recent(ly)?)\b",
+    r"\b(this|next|last) (morning|afternoon|evening|week|weekend|month|year)\b",
+    r"\b(time|date|weather|forecast|temperature|news|headlines?|score|stocks?|price)\b",
+]
+
+# Words that point back at the conversation: the answer depends on what came before
+REFERENCES = re.compile(r"\b(it|its|that|this|those|these|he|she|him|her|they|them|their|"
+                        r"one|more|again|else|another|instead|why|same|above|previous)\b")
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, punctuation and filler removed, whitespace collapsed"""
+    text = re.sub(r"[^\w\s'+\-*/.]", " ", query.lower())
+    text = re.sub(r"(?<!\d)\.|\.(?!\d)", " ", text)  # keep decimal points, drop full stops
+    text = " ".join(text.split())
+    previous = None
+    while text != previous:
+        previous = text
+        text = FILLER.sub("", text).strip()
+    return text
+
+
+def refers_back(query: str) -> bool:
+    """True if the query only makes sense after the preceding turns ("why is that?")"""
+    return bool(REFERENCES.search(normalize_query(query)))
+
+
+def fingerprint(*parts) -> str:
+    """Short stable hash of whatever a reply depends on besides the query"""
+    data = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha1(data.encode()).hexdigest()[:16]
+
+
+@dataclass
+class CacheStats:
+    """How often the response cache saved an LLM round trip"""
+    hits: int = 0
+    misses: int = 0
+    bypassed: int = 0     # time-sensitive or uncached requests
+    expired: int = 0
+    evictions: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def summary(self) -> Dict:
+        return {"hits": self.hits, "misses": self.misses, "bypassed": self.bypassed,
+                "expired": self.expired, "evictions": self.evictions, "hit_rate": self.hit_rate}
+
+
+class ResponseCache:
+    def __init__(self, cache_file: Optional[str] = DEFAULT_CACHE_FILE, max_entries: int = 500,
+                 ttl: float = 7 * 24 * 3600, enabled: bool = True,
+                 bypass_patterns: Iterable[str] = TIME_SENSITIVE, autosave_every: int = 10):
+        """
+        LLM replies keyed by normalised query and context fingerprint
+
+        Entries expire after `ttl` seconds, and the least recently used is
+        evicted once there are more than max_entries. The cache is kept in a
+        JSON file so repeated questions stay free across restarts; wall-clock
+        timestamps make expiry hold across them too.
+
+        Args:
+            cache_file: Where entries are persisted (default ~/.cache/klaus/responses.json),
+                None to keep them in memory only
+            max_entries: Entries kept before evicting the least recently used
+            ttl: Seconds an entry may be served
+            enabled: False turns every lookup into a bypass
+            bypass_patterns: Regexes for time-sensitive queries that are never cached
+            autosave_every: Write the file after this many new entries (save() writes it anyway)
+        """
+        self.cache_file = cache_file
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self.bypass = [re.compile(pattern) for pattern in bypass_patterns]
+        self.autosave_every = autosave_every
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def key(query: str, context: str = "") -> str:
+        return hashlib.sha1(f"{normalize_query(query)}\0{context}".encode()).hexdigest()
+
+    def cacheable(self, query: str) -> bool:
+        """False when caching is off or the query asks about something that changes"""
+        text = normalize_query(query)
+        return self.enabled and bool(text) and not any(pattern.search(text) for pattern in self.bypass)
+
+    def get(self, query: str, context: str = "") -> Optional[str]:
+        """Cached reply for query in this context, or None"""
+        if not self.cacheable(query):
+            self.stats.count("bypassed")
+            return None
+        key = self.key(query, context)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry["created"] > self.ttl:
+                del self._entries[key]
+                self.stats.count("expired")
+                entry = None
+            if entry is None:
+                self.stats.count("misses")
+                return None
+            self._entries.move_to_end(key)
+        self.stats.count("hits")
+        return entry["reply"]
+
+    def put(self, query: str, reply: str, context: str = ""):
+        if not reply or not self.cacheable(query):
+            return
+        with self._lock:
+            key = self.key(query, context)
+            self._entries[key] = {"query": normalize_query(query), "reply": reply, "created": time.time()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.count("evictions")
+            self._unsaved += 1
+            autosave = self._unsaved >= self.autosave_every
+        if autosave:
+            self.save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._unsaved += 1
+        self.save()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _load(self):
+        if not self.cache_file:
+            return
+        try:
+            with open(self.cache_file, 'r') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        # The file is in LRU order; expired entries aren't worth reloading
+        for key, entry in entries.items():
+            if isinstance(entry, dict) and now - entry.get("created", 0) <= self.ttl and entry.get("reply"):
+                self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def save(self):
+        """Write the cache file if anything changed"""
+        if not self.cache_file:
+            return
+        with self._lock:
+            if not self._unsaved:
+                return
+            entries = dict(self._entries)
+            self._unsaved = 0
+        try:
+            # Write then rename, so a crash mid-write can't leave a truncated cache
+            os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok=True)
+            temp = f"{self.cache_file}.tmp"
+            with open(temp, 'w') as f:
+                json.dump(entries, f)
+            os.replace(temp, self.cache_file)
+        except OSError as e:
+            print(f"Could not save response cache: {str(e)}")
@@ -1,6 +1,5 @@
 import datetime
 import webbrowser
-import pyautogui
 import wikipedia
 import wolframalpha
 import os
@@ -8,61 +7,146 @@ import requests
 from dotenv import load_dotenv
 import subprocess
 import random
+import re
+
+try:
+    import pyautogui
+    SCREEN_AVAILABLE = True
+except Exception:
+    # pyautogui needs a display; headless replay runs have none
+    SCREEN_AVAILABLE = False
 
 load_dotenv()
 
+# Commands that are complete as soon as these words are heard, so they can run
+# on a stable partial transcription without waiting for the end of speech
+INSTANT_COMMANDS = [
+    r"(what('s| is) the |what )?time( is it)?( now)?",
+    r"what('s| is) (the date|today's date)",
+    r"open (youtube|google)",
+    r"take a screenshot|screenshot",
+    r"tell me a joke",
+    r"shutdown|shut down|turn off",
+]
+
+JOKES = [
+    "Why don't scientists trust atoms? Because they make up everything!",
+    "What did one ocean say to the other ocean? Nothing, they just waved!",
+    "Why did the scarecrow win an award? Because he was outstanding in his field!",
+    "What do you call a fake noodle? An impasta!",
+    "How does a penguin build its house? Igloos it together!"
+]
+
+# Responses that never change, worth pre-rendering for instant playback
+FIXED_RESPONSES = ["Opening YouTube", "Opening Google", "Screenshot saved"] + JOKES
+
+# Skills that answer from an online service: slow, and they can come back empty-handed
+# (calculate only when the arithmetic can't be done locally and goes to Wolfram)
+LOOKUP_SKILLS = {"calculate", "wikipedia", "weather"}
+# Lookups whose answer an LLM can only guess at: they win whenever they answer at all
+AUTHORITATIVE_SKILLS = {"calculate", "weather"}
+
+# Lookup replies that mean the service had no answer (the LLM may still have one)
+LOOKUP_FAILURES = {
+    "I couldn't calculate that", "I couldn't find information on that topic",
+    "Weather API not configured", "Couldn't retrieve weather information", "Weather service unavailable",
+}
+
 class Skills:
     def __init__(self):
         self.wolfram_client = wolframalpha.Client(os.getenv("WOLFRAM_APPID"))
         self.weather_api_key = os.getenv("OPENWEATHER_API_KEY")
     
+    def route(self, command: str) -> str:
+        """Name of the skill handle_command() would run for this text ("" for none), without running it"""
+        command = command.lower()
+        if "send email" in command or "email to" in command:
+            return "email"
+        if "time" in command:
+            return "time"
+        if "date" in command or "today" in command:
+            return "date"
+        if "open youtube" in command:
+            return "youtube"
+        if "open google" in command:
+            return "google"
+        if "search for" in command:
+            return "search"
+        if "calculate" in command or any(op in command for op in ["+", "-", "*", "/"]):
+            return "calculate"
+        if "wikipedia" in command or "who is" in command or "what is" in command:
+            return "wikipedia"
+        if "screenshot" in command:
+            return "screenshot"
+        if "shutdown" in command or "turn off" in command:
+            return "shutdown"
+        if "weather" in command:
+            return "weather"
+        if "tell me a joke" in command:
+            return "joke"
+        return ""
+
+    def is_lookup(self, command: str) -> bool:
+        """True if the command goes to an online lookup rather than a local action"""
+        skill = self.route(command)
+        if skill == "calculate":
+            return self._local_calculation(command) is None
+        return skill in LOOKUP_SKILLS
+
+    def _local_calculation(self, command: str):
+        """Result of the arithmetic in a calculate command, None if it needs Wolfram"""
+        # Extract math expression
+        expr = command.lower().replace("calculate", "").strip()
+        try:
+            # Simple eval for testing (note: security risk for production!)
+            return str(eval(expr))  # Only for testing!
+        except:
+            return None
+
     def handle_command(self, command: str) -> str:
         """Process command and return response if handled"""
         command = command.lower()
+        skill = self.route(command)
         
         #email skills
-        if "send email" in command or "email to" in command:
+        if skill == "email":
             return self.handle_email_command(command)
         # Time skills
-        if "time" in command:
+        if skill == "time":
             return datetime.datetime.now().strftime("It's %I:%M %p")
         
         # Date skills
-        if "date" in command or "today" in command:
+        if skill == "date":
             return datetime.datetime.now().strftime("Today is %A, %B %d, %Y")
         
         # Web skills
-        if "open youtube" in command:
+        if skill == "youtube":
             webbrowser.open("https://youtube.com")
             return "Opening YouTube"
         
-        if "open google" in command:
+        if skill == "google":
             webbrowser.open("https://google.com")
             return "Opening Google"
         
-        if "search for" in command:
+        if skill == "search":
             query = command.split("search for")[-1].strip()
             webbrowser.open(f"https://google.com/search?q={query}")
             return f"Searching for {query}"
         
         # Calculation skills
-        if "calculate" in command or any(op in command for op in ["+", "-", "*", "/"]):
-            try:
-                # Extract math expression
-                expr = command.replace("calculate", "").strip()
-                # Simple eval for testing (note: security risk for production!)
-                result = str(eval(expr))  # Only for testing!
+        if skill == "calculate":
+            result = self._local_calculation(command)
+            if result is not None:
                 return f"The result is {result}"
+            # Fallback to Wolfram
+            try:
+                res = self.wolfram_client.query(command)
+                return next(res.results).text
             except:
-                # Fallback to Wolfram
-                try:
-                    res = self.wolfram_client.query(command)
-                    return next(res.results).text
-                except:
-                    return "I couldn't calculate that"
+                return "I couldn't calculate that"
         
         # Wikipedia skills
-        if "wikipedia" in command or "who is" in command or "what is" in command:
+        if skill == "wikipedia":
             term = command.replace("wikipedia", "").replace("search", "").strip()
             try:
                 summary = wikipedia.summary(term, sentences=2)
@@ -73,23 +157,34 @@ class Skills:
                 return "I couldn't find information on that topic"
         
         # System control
-        if "screenshot" in command:
+        if skill == "screenshot":
+            if not SCREEN_AVAILABLE:
+                return "I can't take screenshots without a display"
             pyautogui.screenshot().save("screenshot.png")
             return "Screenshot saved"
             
-        if "shutdown" in command or "turn off" in command:
+        if skill == "shutdown":
             return "shutdown"
             
         # Weather skills
-        if "weather" in command:
+        if skill == "weather":
             return self.get_weather(command)
         
         # Jokes
-        if "tell me a joke" in command:
+        if skill == "joke":
             return self.tell_joke()
             
         return ""
     
+    def matches(self, command: str) -> bool:
+        """True if handle_command() would route this text to a skill (no side effects)"""
+        return bool(self.route(command))
+
+    def is_instant_command(self, text: str) -> bool:
+        """True if the text is a complete command that needs no further words"""
+        text = re.sub(r"[^\w\s']", "", text.lower()).strip()
+        return any(re.fullmatch(pattern, text) for pattern in INSTANT_COMMANDS)
+
     def get_weather(self, command):
         """Get weather information using OpenWeatherMap API"""
         # Extract location
@@ -115,14 +210,7 @@ class Skills:
             return "Weather service unavailable"
     
     def tell_joke(self):
-        jokes = [
-            "Why don't scientists trust atoms? Because they make up everything!",
-            "What did one ocean say to the other ocean? Nothing, they just waved!",
-            "Why did the scarecrow win an award? Because he was outstanding in his field!",
-            "What do you call a fake noodle? An impasta!",
-            "How does a penguin build its house? Igloos it together!"
-        ]
-        return random.choice(jokes)
+        return random.choice(JOKES)
     
     def open_app(self, app_name):
         """Open applications (Windows implementation)"""
@@ -0,0 +1,85 @@
+import re
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+import numpy as np
+
+
+@dataclass
+class Partial:
+    """Interim transcription of the utterance in progress"""
+    stable: str      # words two consecutive decodes agreed on - will not change
+    unstable: str    # newest words that may still be revised
+
+    @property
+    def text(self) -> str:
+        return f"{self.stable} {self.unstable}".strip()
+
+
+def _words(text: str) -> List[str]:
+    return text.lower().split()
+
+
+def _key(word: str) -> str:
+    return re.sub(r"[^\w']", "", word)
+
+
+class IncrementalTranscriber:
+    def __init__(self, decode: Callable[[np.ndarray], str], samplerate: int = 16000,
+                 step: float = 1.0, window: float = 15.0):
+        """
+        Re-decodes a growing utterance and tracks which words have stabilised
+
+        A word becomes stable once two consecutive decodes agree on it and on
+        everything before it (local agreement). Stable words are never taken
+        back, so callers can act on them before the speaker finishes.
+
+        Args:
+            decode: Function turning float32 mono audio into text
+            samplerate: Audio rate in Hz
+            step: Seconds of new audio between decodes
+            window: Longest stretch of audio decoded at once, taken from the end
+        """
+        self.decode = decode
+        self.samplerate = samplerate
+        self.step = step
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.stable: List[str] = []
+        self.hypothesis: List[str] = []
+        self.decoded_samples = 0
+
+    def due(self, samples: int) -> bool:
+        """True once enough new audio has arrived for another decode"""
+        return samples - self.decoded_samples >= self.step * self.samplerate
+
+    def update(self, audio: np.ndarray) -> Optional[Partial]:
+        """Decode the utterance so far; returns a Partial when the text changed"""
+        self.decoded_samples = len(audio)
+        words = _words(self.decode(audio[-int(self.window * self.samplerate):]))
+
+        # Agreement first: a repeated decode is what confirms its words
+        agreed = 0
+        for old, new in zip(self.hypothesis, words):
+            if _key(old) != _key(new):
+                break
+            agreed += 1
+        stable_before = len(self.stable)
+        if agreed > stable_before:
+            self.stable = words[:agreed]
+
+        if words == self.hypothesis and len(self.stable) == stable_before:
+            return None
+        self.hypothesis = words
+        return self.partial()
+
+    def partial(self) -> Partial:
+        tail = self.hypothesis[len(self.stable):]
+        return Partial(" ".join(self.stable), " ".join(tail))
+
+    def finalize(self, audio: np.ndarray) -> str:
+        """Final text at the endpoint, reusing the last decode if no audio was added"""
+        if self.hypothesis and len(audio) - self.decoded_samples < 0.1 * self.samplerate:
+            return " ".join(self.hypothesis)
+        return self.decode(audio).lower().strip()
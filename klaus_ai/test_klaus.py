@@ -1,11 +1,60 @@
 import unittest
+import threading
+import time
+import numpy as np
 from voice_interface import VoiceEngine
 from skills import Skills
+from audio_capture import CaptureSession, EchoGate, EnergyVAD, RingBuffer, StreamingCapture
+from audio_sources import AudioSource, ReplaySource
+from audio_frames import PolyphaseResampler, resample, to_mono_float32
+from features import HOP, FeatureCache, LogMelFrontend
+from wake_word import WakeWordDetector
+from streaming_asr import IncrementalTranscriber
+from tts_worker import SimulatedTTSEngine, TTSWorker, PRIORITY_HIGH, PRIORITY_LOW
+from phrase_cache import PhraseCache, read_wav
+from ai_core import iter_sentences
+import os
+import tempfile
+from dataclasses import asdict
+import device_registry
+from device_registry import AudioDevice, DeviceRegistry
+from benchmark import corpus_word_error_rate, word_error_rate
+from decode_profiles import DECODE_PROFILES
+from asr_backends import ASRBackend, CascadeBackend, Transcript
+from asr_worker import ASRWorker, SharedRingBuffer
+from audio_enhance import AudioEnhancer, RecognitionStats
+from llm_client import LLMClient, LLMTimeout
+from llm_stub_server import StubLLMServer
+from context_window import ContextWindow
+from response_cache import ResponseCache
+from ai_core import AICore, BUSY_REPLY
+from dispatch import Dispatcher, LLM, SKILL
+from model_registry import ModelRegistry, int8_supported, quantize_int8
+from weights_cache import convert, load_mapped, mmap_supported
+
+try:
+    import torch
+    import whisper
+except ImportError:
+    torch = whisper = None
+
+def spoken_clip(text):
+    """text rendered by the system TTS voice as 16 kHz audio, None if it can't be rendered"""
+    path = os.path.join(tempfile.mkdtemp(), "clip.wav")
+    try:
+        import pyttsx3
+        engine = pyttsx3.init()
+        engine.save_to_file(text, path)
+        engine.runAndWait()
+        samples, rate = read_wav(path)
+    except Exception:
+        return None
+    return resample(samples, rate)
 
 class TestKlaus(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
-        cls.voice = VoiceEngine()
+        cls.voice = VoiceEngine(cache_dir=tempfile.mkdtemp())
         cls.skills = Skills()
 
     def test_voice_initialization(self):
@@ -20,5 +69,872 @@ class TestKlaus(unittest.TestCase):
         result = self.skills.handle_email_command("dummy command send email to test@test.com about hello")
         self.assertIn("test@test.com", result)
 
+class FakeStream:
+    """Input stream that delivers nothing; closing it fires finished_callback, as sounddevice does"""
+    def __init__(self, finished_callback):
+        self.finished_callback = finished_callback
+        self.active = True
+
+    def stop(self):
+        self.active = False
+
+    def close(self):
+        self.active = False
+        if self.finished_callback is not None:
+            self.finished_callback()
+
+class FakeLiveSource(AudioSource):
+    def __init__(self):
+        super().__init__()
+        self.streams = []
+
+    def open(self, samplerate, blocksize, callback, finished_callback=None):
+        self.streams.append(FakeStream(finished_callback))
+        return self.streams[-1]
+
+class TestStreamingCapture(unittest.TestCase):
+    def test_ring_buffer_wraps(self):
+        buf = RingBuffer(10)
+        buf.write(np.arange(14, dtype=np.float32))
+        self.assertEqual(buf.oldest(), 4)
+        self.assertEqual(buf.read(0, 20).tolist(), list(range(4, 14)))
+
+    def test_utterance_ends_on_trailing_silence(self):
+        capture = StreamingCapture(trailing_silence=0.5, pre_roll=0.3)
+        capture.stream = type('Stream', (), {'active': True})()
+        sr = capture.samplerate
+        speech = 0.1 * np.sin(np.arange(int(1.5 * sr)) / 5)
+        signal = np.concatenate([np.zeros(sr), speech, np.zeros(3 * sr)]).astype(np.float32)
+
+        def feed():
+            for i in range(0, len(signal), capture.frame_len):
+                capture.buffer.write(signal[i:i + capture.frame_len])
+                time.sleep(0.001)
+
+        threading.Thread(target=feed, daemon=True).start()
+        audio = capture.capture_utterance(timeout=5, phrase_time_limit=10)
+        # 1.5 s of speech plus 0.3 s pre-roll and 0.2 s tail, trailing silence dropped
+        self.assertAlmostEqual(len(audio) / sr, 2.0, delta=0.05)
+
+    def test_replay_is_captured_in_full(self):
+        source = ReplaySource.synthetic([(0.5, 0), (1.0, 0.1), (1.0, 0), (0.7, 0.1)], speed=20)
+        with StreamingCapture(trailing_silence=0.5, source=source) as capture:
+            time.sleep(0.1)  # replay runs ahead of the reader
+            first = capture.capture_utterance(timeout=2)
+            second = capture.capture_utterance(timeout=2)
+            self.assertIsNone(capture.capture_utterance(timeout=2))
+        self.assertAlmostEqual(len(first) / 16000, 1.5, delta=0.05)
+        self.assertAlmostEqual(len(second) / 16000, 1.2, delta=0.05)
+        self.assertTrue(source.finished.is_set())
+
+    def test_replay_silence_longer_than_the_timeout_is_skipped(self):
+        source = ReplaySource.synthetic([(2.5, 0), (1, 0.1), (1, 0)], speed=20)
+        with StreamingCapture(trailing_silence=0.5, source=source) as capture:
+            attempts = [capture.capture_utterance(timeout=1) for _ in range(3)]
+        self.assertEqual(attempts[:2], [None, None])
+        # Speech starts 2.5 s in; each one-second wait scans on from the last, so the third reaches it
+        self.assertAlmostEqual(len(attempts[2]) / 16000, 1.5, delta=0.05)
+
+    def test_resampler_streams_without_seams(self):
+        block = np.zeros((1323, 1), dtype=np.float32)
+        self.assertTrue(np.shares_memory(to_mono_float32(block), block))
+
+        rate = 44100
+        tone = (0.5 * np.sin(2 * np.pi * 1000 * np.arange(rate) / rate)).astype(np.float32)
+        resampler = PolyphaseResampler(rate)
+        streamed = np.concatenate([resampler.process(tone[i:i + 1323]).copy()
+                                   for i in range(0, len(tone), 1323)])
+        self.assertEqual(len(streamed), 16000)
+        np.testing.assert_allclose(streamed, resample(tone, rate), atol=1e-5)
+        # Still a 1 kHz tone at the new rate
+        spectrum = np.abs(np.fft.rfft(streamed[1000:]))
+        self.assertAlmostEqual(np.argmax(spectrum) * 16000 / len(streamed[1000:]), 1000, delta=2)
+
+    def test_feature_cache_computes_frames_once(self):
+        audio = (0.1 * np.random.default_rng(0).standard_normal(32000)).astype(np.float32)
+        buf = RingBuffer(48000)
+        cache = FeatureCache(buf)
+        for i in range(0, len(audio), 480):
+            buf.write(audio[i:i + 480])
+            cache.update()
+        mel, levels = cache.read(8000, 24000)
+        self.assertEqual(len(mel), 100)
+        # Frame i is centred on sample i * HOP, like Whisper's STFT
+        direct, _ = LogMelFrontend().compute(audio[50 * HOP - 200:], 100)
+        np.testing.assert_allclose(mel, direct, atol=1e-4)
+        computed = cache.computed
+        cache.read(0, 32000)
+        self.assertEqual(cache.computed, computed)
+
+    def test_session_noise_floor_follows_the_room_but_not_klaus(self):
+        session = CaptureSession(source=FakeLiveSource())
+        rng = np.random.default_rng(0)
+
+        def feed(level, frames=100):
+            for _ in range(frames):
+                session._callback(level * rng.standard_normal((480, 1)).astype(np.float32), 480, None, None)
+
+        feed(0.01)
+        self.assertAlmostEqual(session.vad.noise_floor, 0.01, delta=0.002)
+        session.echo_gate = EchoGate(lambda: True)
+        feed(0.3)  # Klaus talking
+        self.assertAlmostEqual(session.vad.noise_floor, 0.01, delta=0.002)
+        session.echo_gate = None
+        feed(0.002)  # a quieter room is picked up quickly
+        self.assertAlmostEqual(session.vad.noise_floor, 0.002, delta=0.0005)
+
+    def test_session_reopens_a_lost_device_once(self):
+        source = FakeLiveSource()
+        session = CaptureSession(source=source, reopen_delay=0.05, stall_timeout=30)
+        session.start()
+        try:
+            source.streams[0].finished_callback()  # device unplugged
+            deadline = time.monotonic() + 2
+            while len(source.streams) < 2 and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertEqual(len(source.streams), 2)
+            # Closing the dead stream fired its callback again; that must not trigger another reopen
+            time.sleep(1.2)
+            self.assertEqual(len(source.streams), 2)
+            self.assertTrue(source.streams[1].active)
+        finally:
+            session.stop()
+
+    def test_session_reopens_a_stalled_device(self):
+        source = FakeLiveSource()
+        session = CaptureSession(source=source, reopen_delay=0.05, stall_timeout=0.3)
+        session.start()
+        try:
+            deadline = time.monotonic() + 3
+            while len(source.streams) < 2 and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertGreaterEqual(len(source.streams), 2)
+        finally:
+            session.stop()
+
+    def test_streamed_feature_reads_cover_every_frame(self):
+        audio = (0.1 * np.random.default_rng(1).standard_normal(96000)).astype(np.float32)
+        buf = RingBuffer(48000)
+        cache = FeatureCache(buf)
+        frame, frames = 0, 0
+        # Read right up to the write head, as wait_for_wake_word does
+        for i in range(0, len(audio), 480):
+            buf.write(audio[i:i + 480])
+            mel, _, frame = cache.read_frames(frame, buf.total_written)
+            frames += len(mel)
+        self.assertEqual(frames, frame)
+        self.assertEqual(frame, cache.computed)
+        self.assertGreaterEqual(frame, len(audio) // HOP - 2)
+
+class TestEchoGate(unittest.TestCase):
+    def setUp(self):
+        self.playing = True
+        self.barge_ins = []
+        self.gate = EchoGate(lambda: self.playing, barge_in_frames=4, tail=0.1,
+                             on_barge_in=lambda: self.barge_ins.append(True))
+        self.vad = EnergyVAD(threshold=0.01, noise_ratio=0)
+        rng = np.random.default_rng(0)
+        # Klaus bleeding into the mic: speech to the VAD, but under 4x its threshold
+        self.echo = 0.02 * rng.standard_normal(480).astype(np.float32)
+        self.voice = 0.2 * rng.standard_normal(480).astype(np.float32)
+
+    def run_frames(self, frame, count):
+        return [self.gate.filter(frame, self.vad.is_speech(frame), self.vad) for _ in range(count)]
+
+    def test_echo_is_gated_and_the_user_can_barge_in(self):
+        self.assertEqual(self.run_frames(self.echo, 20), [False] * 20)
+        # A short loud burst isn't enough to interrupt Klaus
+        self.assertEqual(self.run_frames(self.voice, 3) + self.run_frames(self.echo, 1), [False] * 4)
+        self.assertEqual(self.barge_ins, [])
+
+        self.assertEqual(self.run_frames(self.voice, 6), [False] * 3 + [True] * 3)
+        self.assertEqual((self.barge_ins, self.gate.barge_ins, self.gate.gated_frames), ([True], 1, 27))
+
+    def test_gate_stays_closed_for_the_tail_after_playback(self):
+        self.playing = False
+        self.assertEqual(self.run_frames(self.echo, 1), [True])
+        self.playing = True
+        self.run_frames(self.echo, 1)
+        self.playing = False
+        self.assertEqual(self.run_frames(self.echo, 1), [False])  # room echo after Klaus stops
+        time.sleep(0.15)
+        self.assertEqual(self.run_frames(self.echo, 1), [True])
+        self.assertEqual(self.barge_ins, [])
+
+class TestWakeWord(unittest.TestCase):
+    @staticmethod
+    def tone_sweep(freqs, seconds):
+        """Harmonic tone gliding through freqs - a stand-in for a spoken word"""
+        n = int(seconds * 16000)
+        f = np.interp(np.linspace(0, 1, n), np.linspace(0, 1, len(freqs)), freqs)
+        phase = 2 * np.pi * np.cumsum(f) / 16000
+        return (0.2 * (np.sin(phase) + 0.5 * np.sin(2 * phase))).astype(np.float32)
+
+    def feed(self, detector, audio):
+        detector.reset()
+        return any(detector.process(audio[i:i + 1600]) for i in range(0, len(audio), 1600))
+
+    def test_detects_enrolled_word_only(self):
+        template_file = os.path.join(tempfile.mkdtemp(), "klaus", "wake_templates.npz")
+        detector = WakeWordDetector(template_file=template_file)
+        keyword = [300, 800, 500, 1200, 400]
+        for stretch in (0.9, 1.0, 1.1):
+            self.assertTrue(detector.enroll(self.tone_sweep(keyword, 0.7 * stretch)))
+
+        silence = np.zeros(16000, dtype=np.float32)
+        spoken = np.concatenate([silence, self.tone_sweep(keyword, 0.75), silence])
+        other = np.concatenate([silence, self.tone_sweep([900, 300, 1000, 250, 700], 0.7), silence])
+        self.assertTrue(self.feed(detector, spoken))
+        self.assertFalse(self.feed(detector, other))
+
+        detector.save()
+        self.assertEqual(len(WakeWordDetector(template_file=template_file).templates), 3)
+
+class TestIncrementalTranscriber(unittest.TestCase):
+    def test_stable_words_need_two_agreeing_decodes(self):
+        hypotheses = iter(["what", "what time", "what time is", "what time is it"])
+        transcriber = IncrementalTranscriber(lambda audio: next(hypotheses))
+        audio = np.zeros(16000 * 4, dtype=np.float32)
+
+        self.assertEqual(transcriber.update(audio[:16000]).stable, "")
+        self.assertEqual(transcriber.update(audio[:32000]).stable, "what")
+        partial = transcriber.update(audio[:48000])
+        self.assertEqual((partial.stable, partial.unstable), ("what time", "is"))
+        self.assertEqual(transcriber.update(audio).text, "what time is it")
+        # No new audio since the last decode, so the final text is reused
+        self.assertEqual(transcriber.finalize(audio), "what time is it")
+
+    def test_repeated_decode_makes_its_words_stable(self):
+        hypotheses = iter(["open youtube", "open youtube", "open youtube"])
+        transcriber = IncrementalTranscriber(lambda audio: next(hypotheses))
+        audio = np.zeros(16000 * 3, dtype=np.float32)
+
+        self.assertEqual(transcriber.update(audio[:16000]).unstable, "open youtube")
+        partial = transcriber.update(audio[:32000])
+        self.assertEqual((partial.stable, partial.unstable), ("open youtube", ""))
+        # Nothing left to change
+        self.assertIsNone(transcriber.update(audio))
+
+class FakeTTSEngine:
+    """Minimal pyttsx3 stand-in that 'speaks' one word every 20 ms"""
+    def __init__(self):
+        self.pending, self.spoken, self.stopped = [], [], False
+
+    def connect(self, name, callback):
+        self.on_word = callback
+
+    def say(self, text):
+        self.pending.append(text)
+
+    def stop(self):
+        self.stopped = True
+
+    def runAndWait(self):
+        for text in self.pending:
+            self.stopped = False
+            for _ in text.split():
+                self.on_word('started-word', 0, 0)
+                if self.stopped:
+                    break
+                time.sleep(0.02)
+            self.spoken.append(text)
+        self.pending = []
+
+class TestTTSWorker(unittest.TestCase):
+    def test_priority_cancel_and_interrupt(self):
+        engine = FakeTTSEngine()
+        worker = TTSWorker(lambda: engine)
+        self.assertTrue(worker.wait_ready(1))
+
+        long_reply = worker.say("one two three four five six seven eight")
+        time.sleep(0.03)
+        low = worker.say("low", PRIORITY_LOW)
+        high = worker.say("high", PRIORITY_HIGH)
+        dropped = worker.say("dropped")
+        dropped.cancel()
+        worker.cancel(long_reply)
+
+        self.assertFalse(long_reply.result(1))
+        self.assertTrue(high.result(1))
+        self.assertTrue(low.result(1))
+        self.assertEqual(engine.spoken[1:], ["high", "low"])
+        worker.shutdown()
+
+class TestPhraseCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.engine = SimulatedTTSEngine(rate=600)  # 0.1 s of silence per word
+
+    def wav_files(self):
+        return sorted(f for f in os.listdir(self.cache_dir) if f.endswith(".wav"))
+
+    def test_rendered_phrase_round_trips_through_wav(self):
+        cache = PhraseCache(self.cache_dir, auto_cache_after=2)
+        self.assertFalse(cache.should_render("Opening YouTube"))
+        self.assertTrue(cache.should_render("Opening YouTube"))
+        self.assertTrue(cache.render(self.engine, "Opening YouTube"))
+        self.assertEqual(len(self.wav_files()), 1)
+
+        # A new process reads the clip back from disk
+        samples, rate = PhraseCache(self.cache_dir).get("Opening YouTube")
+        self.assertEqual((samples.dtype, rate, len(samples)), (np.float32, 16000, 3200))
+        other_voice = PhraseCache(self.cache_dir)
+        other_voice.set_voice("david", 200)
+        self.assertIsNone(other_voice.get("Opening YouTube"))
+
+    def test_memory_and_disk_keep_the_most_recently_used(self):
+        cache = PhraseCache(self.cache_dir, max_files=2, max_memory_items=2)
+        cache.render(self.engine, "one")
+        cache.render(self.engine, "two")
+        cache.get("one")
+        cache.render(self.engine, "three")
+        for name in self.wav_files():
+            os.remove(os.path.join(self.cache_dir, name))
+        # "two" was least recently used when "three" arrived
+        self.assertIsNotNone(cache.get("one"))
+        self.assertIsNotNone(cache.get("three"))
+        self.assertIsNone(cache.get("two"))
+
+        cache = PhraseCache(self.cache_dir, max_files=2)
+        cache.render(self.engine, "one")
+        cache.render(self.engine, "two")
+        for name in self.wav_files():
+            os.utime(os.path.join(self.cache_dir, name), (1, 1))
+        PhraseCache(self.cache_dir).get("one")  # a hit refreshes the file
+        cache.render(self.engine, "three")
+        self.assertEqual(len(self.wav_files()), 2)
+        self.assertIsNotNone(PhraseCache(self.cache_dir).get("one"))
+        self.assertIsNone(PhraseCache(self.cache_dir).get("two"))
+
+class TestSentenceStreaming(unittest.TestCase):
+    def test_sentences_released_from_token_stream(self):
+        reply = "Sure! Dr. Smith says it costs 3.50 today. Anything else?"
+        tokens = [reply[i:i + 3] for i in range(0, len(reply), 3)]
+        self.assertEqual(
+            list(iter_sentences(tokens)),
+            ["Sure!", "Dr. Smith says it costs 3.50 today.", "Anything else?"]
+        )
+
+class TestDeviceRegistry(unittest.TestCase):
+    def setUp(self):
+        self.cache_file = os.path.join(tempfile.mkdtemp(), "devices.json")
+        self.probes = 0
+        self.attached = [
+            AudioDevice(0, "Built-in Mic", True, False, 2, 0, 48000.0, "MME"),
+            AudioDevice(1, "Headset", True, True, 1, 2, 16000.0, "MME"),
+        ]
+        self.signature = "a"
+        self.saved = (device_registry.probe_devices, device_registry.hardware_signature)
+        device_registry.probe_devices = self.fake_probe
+        device_registry.hardware_signature = lambda: self.signature
+
+    def tearDown(self):
+        device_registry.probe_devices, device_registry.hardware_signature = self.saved
+
+    def fake_probe(self):
+        self.probes += 1
+        return list(self.attached)
+
+    def test_cached_until_hardware_changes_and_input_followed_by_name(self):
+        registry = DeviceRegistry(self.cache_file)
+        registry.set_preferred_input(registry.get(1))
+        DeviceRegistry(self.cache_file)
+        self.assertEqual(self.probes, 1)
+
+        # Headset reconnects and comes back at a different index
+        self.attached = [
+            AudioDevice(0, "Headset", True, True, 1, 2, 16000.0, "MME"),
+            AudioDevice(1, "Built-in Mic", True, False, 2, 0, 48000.0, "MME"),
+        ]
+        self.signature = "b"
+        registry = DeviceRegistry(self.cache_file)
+        self.assertEqual(self.probes, 2)
+        self.assertEqual(registry.input_device().index, 0)
+
+    def test_failed_probe_is_not_retried_on_every_poll(self):
+        registry = DeviceRegistry(self.cache_file)
+        changes = []
+
+        def on_change():
+            changes.append(self.signature)
+            registry.refresh(force=True)
+
+        def broken_probe():
+            raise OSError("device busy")
+
+        device_registry.probe_devices = broken_probe
+        registry.watch(on_change, interval=0.02)
+        self.addCleanup(registry.stop_watching)
+        self.signature = "b"
+        time.sleep(0.3)
+        self.assertEqual(changes, ["b"])
+        self.assertEqual(registry.signature, "a")
+        # The next real change is still noticed, and a good probe catches up
+        device_registry.probe_devices = self.fake_probe
+        self.signature = "c"
+        time.sleep(0.3)
+        self.assertEqual(changes, ["b", "c"])
+        self.assertEqual(registry.signature, "c")
+
+class TestBenchmark(unittest.TestCase):
+    def test_word_error_rate(self):
+        self.assertEqual(word_error_rate("Turn on the lights.", "turn on the lights"), 0.0)
+        self.assertAlmostEqual(word_error_rate("turn on the lights", "turn the light"), 0.5)
+        self.assertEqual(word_error_rate("", ""), 0.0)
+
+    def test_corpus_wer_weighs_utterances_by_length(self):
+        pairs = [("turn on the kitchen lights please", "turn on the kitchen lights please"),
+                 ("stop", "top")]
+        # One error in seven words, not the mean of 0% and 100%
+        self.assertAlmostEqual(corpus_word_error_rate(pairs), 1 / 7)
+        self.assertIsNone(corpus_word_error_rate([]))
+
+    def test_command_profile_is_a_single_greedy_english_pass(self):
+        options = DECODE_PROFILES["command"].transcribe_options()
+        self.assertEqual(options["language"], "en")
+        self.assertEqual(options["temperature"], 0.0)
+        self.assertNotIn("beam_size", options)
+        self.assertIsInstance(DECODE_PROFILES["dictation"].transcribe_options()["temperature"], tuple)
+
+class FakeModelLoader:
+    """Loads a fresh object per call and counts loads by name; `gate` holds loads back until set"""
+    def __init__(self):
+        self.loads = {}
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def __call__(self, name):
+        self.gate.wait(5)
+        self.loads[name] = self.loads.get(name, 0) + 1
+        return object()
+
+class TestModelRegistry(unittest.TestCase):
+    def setUp(self):
+        self.loader = FakeModelLoader()
+        self.now = 0.0
+
+    def registry(self, **kwargs):
+        return ModelRegistry(loader=self.loader, check_interval=3600, clock=lambda: self.now, **kwargs)
+
+    def test_loads_lazily_once_and_preload_is_shared(self):
+        registry = self.registry(idle_timeout=0)
+        self.assertFalse(registry.is_loaded("tiny"))
+        self.assertEqual(self.loader.loads, {})
+        model = registry.get("tiny")
+        self.assertIs(registry.get("tiny"), model)
+
+        self.loader.gate.clear()
+        thread = registry.preload("base")
+        waiter = []
+        getter = threading.Thread(target=lambda: waiter.append(registry.get("base")))
+        getter.start()
+        time.sleep(0.1)
+        self.assertEqual(waiter, [])
+        self.loader.gate.set()
+        thread.join(2)
+        getter.join(2)
+        # get() waited for the preload instead of loading a second copy
+        self.assertIs(waiter[0], registry.get("base"))
+        self.assertEqual(self.loader.loads, {"tiny": 1, "base": 1})
+
+    def test_idle_models_are_unloaded_and_reloaded_on_use(self):
+        registry = self.registry(idle_timeout=10)
+        registry.get("tiny")
+        self.now = 8.0
+        registry.get("base")
+        self.now = 15.0
+        registry.reap()
+        self.assertFalse(registry.is_loaded("tiny"))
+        self.assertTrue(registry.is_loaded("base"))
+        registry.get("tiny")
+        self.assertEqual(self.loader.loads, {"tiny": 2, "base": 1})
+
+    def test_least_recently_used_go_first_while_over_the_watermark(self):
+        names = ["tiny", "base", "small"]
+        registry = self.registry(idle_timeout=0, memory_watermark_mb=150,
+                                 memory_usage=lambda: 100.0 * sum(map(registry.is_loaded, names)))
+        for name in names:
+            registry.get(name)
+            self.now += 1
+        registry.get("tiny")
+        registry.reap()
+        self.assertEqual([name for name in names if registry.is_loaded(name)], ["tiny"])
+
+@unittest.skipUnless(whisper is not None and mmap_supported(), "needs openai-whisper and torch 2.1+")
+class TestWeightsCache(unittest.TestCase):
+    def test_mapped_model_matches_whisper_load_model(self):
+        from whisper.model import ModelDimensions, Whisper
+        torch.manual_seed(0)
+        dims = ModelDimensions(n_mels=80, n_audio_ctx=8, n_audio_state=16, n_audio_head=2, n_audio_layer=1,
+                               n_vocab=64, n_text_ctx=8, n_text_state=16, n_text_head=2, n_text_layer=1)
+        cache_dir = tempfile.mkdtemp()
+        checkpoint = os.path.join(cache_dir, "tiny-random.pt")
+        torch.save({"dims": asdict(dims), "model_state_dict": Whisper(dims).state_dict()}, checkpoint)
+
+        stock = whisper.load_model(checkpoint, device="cpu")
+        self.assertIsNone(load_mapped(checkpoint, cache_dir))
+        convert(checkpoint, cache_dir)
+        mapped = load_mapped(checkpoint, cache_dir)
+        self.assertEqual(mapped.state_dict().keys(), stock.state_dict().keys())
+
+        mel = torch.randn(1, 80, 16)
+        tokens = torch.tensor([[1, 2, 3, 4]])
+        with torch.no_grad():
+            torch.testing.assert_close(mapped(mel, tokens), stock(mel, tokens))
+
+@unittest.skipUnless(whisper is not None and int8_supported(), "needs openai-whisper and int8-capable torch")
+class TestQuantization(unittest.TestCase):
+    def test_int8_model_transcribes_like_the_float_one(self):
+        audio = spoken_clip("What time is it in London?")
+        if audio is None:
+            self.skipTest("no TTS voice to render the clip with")
+        options = {"language": "en", "fp16": False, "temperature": 0.0}
+        expected = whisper.load_model("tiny", device="cpu").transcribe(audio, **options)["text"]
+        self.assertIn("time", expected.lower())
+
+        model = quantize_int8(whisper.load_model("tiny", device="cpu"))
+        self.assertTrue(any(isinstance(m, torch.ao.nn.quantized.dynamic.Linear) for m in model.modules()))
+        text = model.transcribe(audio, **options)["text"]
+        self.assertLessEqual(word_error_rate(expected, text), 0.1, f"{expected!r} vs {text!r}")
+
+class FakeStage:
+    def __init__(self, name, transcript):
+        self.name = self.model_name = name
+        self.profile = DECODE_PROFILES["command"]
+        self.transcript = transcript
+        self.calls = 0
+
+    def recognize(self, audio):
+        self.calls += 1
+        return self.transcript
+
+class TestCascade(unittest.TestCase):
+    def cascade(self, first, accept=None):
+        cascade = CascadeBackend(accept=accept)
+        cascade.stages = [FakeStage("tiny", first), FakeStage("base", Transcript("what time is it", -0.2))]
+        return cascade
+
+    def test_escalates_only_on_poor_confidence_or_unmatched_text(self):
+        audio = np.zeros(16000, dtype=np.float32)
+        confident = self.cascade(Transcript("what time is it", -0.3))
+        self.assertEqual(confident.transcribe(audio), "what time is it")
+        self.assertEqual(confident.stages[1].calls, 0)
+
+        unsure = self.cascade(Transcript("what tyme is it", -1.2))
+        self.assertEqual(unsure.transcribe(audio), "what time is it")
+        self.assertEqual(unsure.escalations, 1)
+
+        unmatched = self.cascade(Transcript("what dime fizz it", -0.3), accept=lambda text: "time" in text)
+        self.assertEqual(unmatched.transcribe(audio), "what time is it")
+
+class SpanBackend(ASRBackend):
+    """Runs in the worker process: describes the audio it was given, crashes once on request"""
+    name = "span"
+
+    def transcribe(self, audio):
+        flag = os.environ.get("KLAUS_TEST_CRASH_FLAG")
+        if flag and os.path.exists(flag):
+            os.remove(flag)
+            os._exit(1)
+        return f"{len(audio)} {audio[0]:.1f} {audio[-1]:.1f}"
+
+class TestASRWorker(unittest.TestCase):
+    def test_decodes_shared_spans_and_survives_a_crash(self):
+        worker = ASRWorker(SpanBackend, buffer_seconds=1.0)
+        try:
+            worker.load()
+            # Captured audio is decoded where it lies, including across the ring's wrap point
+            worker.buffer.write(np.full(12000, 0.5, dtype=np.float32))
+            worker.buffer.write(np.linspace(0.0, 1.0, 8000, dtype=np.float32))
+            self.assertEqual(worker.transcribe_span(12000, 20000), "8000 0.0 1.0")
+            self.assertEqual(worker.transcribe(np.full(160, 0.2, dtype=np.float32)), "160 0.2 0.2")
+
+            with tempfile.NamedTemporaryFile(delete=False) as f:
+                os.environ["KLAUS_TEST_CRASH_FLAG"] = f.name
+            worker._stop_process()  # restart so the worker sees the flag
+            self.assertEqual(worker.transcribe_span(12000, 20000), "8000 0.0 1.0")
+            self.assertEqual(worker.restarts, 1)
+        finally:
+            os.environ.pop("KLAUS_TEST_CRASH_FLAG", None)
+            worker.close()
+        self.assertFalse(worker.alive)
+
+    def test_cascade_check_cannot_be_dropped_by_the_worker(self):
+        with self.assertRaises(ValueError):
+            VoiceEngine(asr_backend="cascade", asr_process=True, transcript_check=lambda text: True,
+                        cache_dir=tempfile.mkdtemp())
+
+    def test_attaching_leaves_the_write_position_alone(self):
+        owner = SharedRingBuffer(1000)
+        owner.write(np.ones(300, dtype=np.float32))
+        reader = SharedRingBuffer(1000, owner.name)
+        try:
+            self.assertEqual(reader.total_written, 300)
+            owner.write(np.ones(50, dtype=np.float32))
+            self.assertEqual(reader.total_written, 350)
+        finally:
+            reader.release()
+            owner.release()
+
+class TestAudioEnhancer(unittest.TestCase):
+    def test_gate_removes_noise_and_agc_sets_level(self):
+        rng = np.random.default_rng(0)
+        t = np.arange(32000) / 16000
+        speech = np.where((t > 0.5) & (t < 1.5), 0.05 * np.sin(2 * np.pi * 220 * t), 0.0)
+        noisy = (speech + 0.01 * rng.standard_normal(len(t))).astype(np.float32)
+
+        gated = AudioEnhancer(agc=False).process(noisy)
+        self.assertEqual(len(gated), len(noisy))
+        noise_before = np.sum((noisy - speech) ** 2)
+        self.assertLess(np.sum((gated - speech) ** 2), noise_before / 4)  # over 6 dB better
+
+        louder = AudioEnhancer(noise_gate=False, target_dbfs=-20.0).process(noisy * 0.5)
+        levels = np.sqrt(np.mean(np.square(louder.reshape(-1, 256)), axis=1))
+        self.assertAlmostEqual(np.percentile(levels, 90), 0.1, places=3)  # speech frames at -20 dBFS
+
+    def test_failures_followed_by_speech_count_as_retries(self):
+        stats = RecognitionStats(retry_window=10)
+        stats.record(False, "Could not understand audio", started=0, now=2)
+        stats.record(False, "", started=3, now=3)   # nothing heard, not an attempt
+        stats.record(True, "what time is it", started=5, now=7)
+        stats.record(True, "", started=8, now=9)     # empty transcript is a failure
+        stats.record(True, "hello", started=30, now=31)
+        self.assertEqual((stats.attempts, stats.failures, stats.retries), (4, 2, 1))
+
+class TestLLMClient(unittest.TestCase):
+    def setUp(self):
+        self.server = StubLLMServer(latency=0.0, token_delay=0.0, retry_after=0.0, seed=1).start()
+        self.addCleanup(self.server.stop)
+
+    def test_retries_injected_errors_and_streams(self):
+        self.server.error_rate = 0.5
+        client = LLMClient(api_key="test", base_url=self.server.base_url, backoff=0.01, max_retries=8)
+        messages = [{"role": "user", "content": "hello"}]
+        for _ in range(5):
+            self.assertIn("hello", client.chat(messages))
+        self.assertGreater(client.retries, 0)
+        self.assertEqual(client.failures, 0)
+        self.server.error_rate = 0.0
+        self.assertIn("You said: hello", "".join(client.stream_chat(messages)))
+
+    def test_slow_upstream_is_cut_off_at_the_deadline(self):
+        self.server.latency = 2.0
+        client = LLMClient(api_key="test", base_url=self.server.base_url, deadline=0.3)
+        start = time.monotonic()
+        with self.assertRaises(LLMTimeout):
+            client.chat([{"role": "user", "content": "hello"}])
+        self.assertLess(time.monotonic() - start, 1.0)
+
+    def test_stream_stalled_mid_line_is_cut_off_at_the_deadline(self):
+        self.server.latency = 0.6
+        self.server.stall = 5.0
+        client = LLMClient(api_key="test", base_url=self.server.base_url, deadline=1.0)
+        start = time.monotonic()
+        chunks = []
+        with self.assertRaises(LLMTimeout):
+            for chunk in client.stream_chat([{"role": "user", "content": "hello"}]):
+                chunks.append(chunk)
+        self.assertEqual(chunks, ["You "])
+        self.assertLess(time.monotonic() - start, 1.3)
+
+class TestContextWindow(unittest.TestCase):
+    def test_prompt_stays_in_budget_and_old_turns_are_summarised(self):
+        release = threading.Event()
+
+        def summarizer(summary, turns):
+            release.wait(5)
+            return f"{summary} {len(turns)} turns about the garden".strip()
+
+        window = ContextWindow("You are Klaus.", budget=200, summarizer=summarizer, summary_budget=40)
+        for i in range(20):
+            window.add("user" if i % 2 == 0 else "assistant", f"Turn {i} " + "words " * 30)
+            # Never waits on the summariser and never exceeds the budget
+            self.assertLessEqual(window.tokens(), 200)
+        self.assertEqual(window.prompt()[-1]["content"].split()[1], "19")
+        self.assertEqual(window.folds, 0)
+        release.set()
+        self.assertTrue(window.flush())
+        self.assertGreater(window.folds, 0)
+        self.assertIn("garden", window.prompt()[1]["content"])
+        self.assertLessEqual(window.tokens(), 200)
+        self.assertLess(len(window.turns), 20)
+
+    def test_failing_summarizer_falls_back_to_first_sentences(self):
+        def summarizer(summary, turns):
+            raise RuntimeError("offline")
+
+        window = ContextWindow("You are Klaus.", budget=60, summarizer=summarizer)
+        window.add("user", "My name is Ada. " + "filler " * 40)
+        window.add("assistant", "Nice to meet you.")
+        window.add("user", "What is my name?")
+        self.assertTrue(window.flush())
+        self.assertIn("My name is Ada.", window.summary)
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "responses.json")
+
+    def test_normalised_lru_ttl_and_persisted(self):
+        cache = ResponseCache(self.path, max_entries=2, ttl=60)
+        cache.put("What is a kilometre?", "1000 metres")
+        self.assertEqual(cache.get("hey klaus, what is a   KILOMETRE"), "1000 metres")
+        self.assertIsNone(cache.get("What is a kilometre?", context="other model"))
+        self.assertIsNone(cache.get("What's the weather today?"))
+        cache.put("What's the weather today?", "Sunny")
+        self.assertEqual(len(cache), 1)
+
+        cache.put("what is a mile", "1609 metres")
+        cache.get("what is a kilometre")
+        cache.put("what is an inch", "2.54 centimetres")
+        self.assertIsNone(cache.get("what is a mile"))  # least recently used
+        cache.save()
+
+        reloaded = ResponseCache(self.path, max_entries=2, ttl=60)
+        self.assertEqual(reloaded.get("what is an inch"), "2.54 centimetres")
+        reloaded.ttl = 0
+        time.sleep(0.01)
+        self.assertIsNone(reloaded.get("what is a kilometre"))
+        self.assertEqual(cache.stats.summary()["bypassed"], 1)
+        self.assertEqual(reloaded.stats.expired, 1)
+
+    def test_repeated_question_skips_the_model(self):
+        server = StubLLMServer(latency=0.0, token_delay=0.0).start()
+        self.addCleanup(server.stop)
+        ai = AICore(LLMClient(api_key="test", base_url=server.base_url), cache=ResponseCache(self.path))
+        first = ai.process_query("What can you do?")
+        self.assertEqual(ai.process_query("what can you do"), first)
+        self.assertEqual(server.stats["requests"], 1)
+        # A follow-up depends on the conversation, and fresh answers can be forced
+        ai.process_query("Why is that?")
+        ai.process_query("What can you do?", use_cache=False)
+        self.assertEqual(server.stats["requests"], 3)
+        self.assertEqual(ai.cache_metrics()["hits"], 1)
+
+class FakeLookupSkills:
+    """Every command is an online lookup by `skill` taking `delay` seconds"""
+    def __init__(self, delay, reply, skill="wikipedia"):
+        self.delay = delay
+        self.reply = reply
+        self.skill = skill
+
+    def route(self, command):
+        return self.skill
+
+    def is_lookup(self, command):
+        return True
+
+    def handle_command(self, command):
+        time.sleep(self.delay)
+        return self.reply
+
+class TestDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.server = StubLLMServer(latency=0.1, token_delay=0.05).start()
+        self.addCleanup(self.server.stop)
+        self.ai = AICore(LLMClient(api_key="test", base_url=self.server.base_url),
+                         cache=ResponseCache(None))
+
+    def test_slow_lookup_does_not_delay_the_llm(self):
+        dispatcher = Dispatcher(FakeLookupSkills(1.0, "I couldn't find information on that topic"), self.ai)
+        start = time.monotonic()
+        outcome = dispatcher.dispatch("what is a quasar")
+        self.assertEqual(outcome.source, LLM)
+        self.assertLess(time.monotonic() - start, 0.8)
+        self.assertIn("what is a quasar", "".join(outcome.chunks))
+        self.assertEqual(dispatcher.stats.llm_wins, 1)
+
+    def test_lookup_answer_wins_and_cancels_the_llm(self):
+        dispatcher = Dispatcher(FakeLookupSkills(0.0, "A quasar is an active galactic nucleus."), self.ai)
+        outcome = dispatcher.dispatch("what is a quasar")
+        self.assertEqual((outcome.source, outcome.text), (SKILL, "A quasar is an active galactic nucleus."))
+        time.sleep(0.5)
+        # The abandoned request never reaches the conversation
+        self.assertEqual(self.ai.window.turns, [])
+        self.assertEqual(dispatcher.stats.skill_wins, 1)
+
+    def test_local_arithmetic_does_not_start_the_llm(self):
+        skills = Skills()
+        self.assertTrue(skills.is_lookup("calculate the integral of x squared"))
+        dispatcher = Dispatcher(skills, self.ai)
+        outcome = dispatcher.dispatch("15 * 4")
+        self.assertEqual((outcome.source, outcome.text), (SKILL, "The result is 60"))
+        self.assertEqual(dispatcher.stats.summary()["serial"], 1)
+        self.assertEqual(self.ai.client.requests, 0)
+
+    def test_weather_lookup_wins_even_when_the_llm_is_faster(self):
+        dispatcher = Dispatcher(FakeLookupSkills(0.5, "It's 12 degrees in London.", skill="weather"), self.ai)
+        outcome = dispatcher.dispatch("what's the weather in london")
+        self.assertEqual((outcome.source, outcome.text), (SKILL, "It's 12 degrees in London."))
+        self.assertEqual(dispatcher.stats.skill_wins, 1)
+
+    def test_hung_lookup_falls_back_to_the_llm(self):
+        dispatcher = Dispatcher(FakeLookupSkills(2.0, "It's 12 degrees in London.", skill="weather"), self.ai,
+                                lookup_timeout=0.3)
+        start = time.monotonic()
+        outcome = dispatcher.dispatch("what's the weather in london")
+        self.assertEqual(outcome.source, LLM)
+        self.assertLess(time.monotonic() - start, 1.5)
+        self.assertEqual(dispatcher.stats.timeouts, 1)
+
+    def test_cancelled_request_frees_its_slot_before_the_first_byte(self):
+        self.server.latency = 1.0
+        ai = AICore(LLMClient(api_key="test", base_url=self.server.base_url),
+                    cache=ResponseCache(None), queue_timeout=0.3)
+        dispatcher = Dispatcher(FakeLookupSkills(0.0, "A quasar is an active galactic nucleus."), ai)
+        self.assertEqual(dispatcher.dispatch("what is a quasar").source, SKILL)
+        # The abandoned request is still waiting on its first byte
+        self.assertNotEqual(ai.process_query("and a pulsar"), BUSY_REPLY)
+        time.sleep(0.5)
+        self.assertEqual([turn["content"] for turn in ai.window.turns][:1], ["and a pulsar"])
+        self.assertEqual(len(ai.window.turns), 2)
+
+class TestSessions(unittest.TestCase):
+    def test_sessions_run_concurrently_with_separate_ordered_history(self):
+        server = StubLLMServer(latency=0.3, token_delay=0.0).start()
+        self.addCleanup(server.stop)
+        ai = AICore(LLMClient(api_key="test", base_url=server.base_url), cache=ResponseCache(None))
+
+        def converse(session_id):
+            for turn in range(2):
+                ai.process_query(f"{session_id} turn {turn}", session_id=session_id)
+
+        start = time.monotonic()
+        threads = [threading.Thread(target=converse, args=(f"user{i}",)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Four conversations of two turns each take two turns' time, not eight
+        self.assertLess(time.monotonic() - start, 1.5)
+        for i in range(4):
+            asked = [f"user{i} turn {turn}" for turn in range(2)]
+            expected = [{"role": role, "content": text} for question in asked for role, text in
+                        (("user", question), ("assistant", server.reply_for([{"role": "user", "content": question}])))]
+            self.assertEqual(ai.session(f"user{i}").window.turns, expected)
+
+    def test_in_flight_limit_per_session(self):
+        server = StubLLMServer(latency=0.3, token_delay=0.0).start()
+        self.addCleanup(server.stop)
+        ai = AICore(LLMClient(api_key="test", base_url=server.base_url), cache=ResponseCache(None),
+                    queue_timeout=0.1)
+        replies = []
+        threads = [threading.Thread(target=lambda: replies.append(ai.process_query("hello"))) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertIn(BUSY_REPLY, replies)
+        self.assertEqual(len(ai.window.turns), 2)
+
+    def test_sessions_in_use_are_not_evicted(self):
+        ai = AICore(LLMClient(api_key="test", base_url="http://127.0.0.1:9"), cache=ResponseCache(None),
+                    max_sessions=1)
+        waiting = ai._checkout("alice")  # a request still queued for alice's slot
+        ai.session("bob")
+        self.assertEqual(ai.sessions(), ["alice", "bob"])
+        ai._checkin(waiting)
+        ai.session("carol")
+        self.assertEqual(ai.sessions(), ["carol"])
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
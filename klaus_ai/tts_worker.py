@@ -0,0 +1,213 @@
+import itertools
+import queue
+import threading
+import time
+import wave
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Optional
+from phrase_cache import PhraseCache, play_clip
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 9
+PRIORITY_IDLE = 10  # background phrase rendering
+
+
+@dataclass(order=True)
+class Utterance:
+    priority: int
+    seq: int
+    text: Optional[str] = field(compare=False)
+    future: Future = field(compare=False, default_factory=Future)
+    render_only: bool = field(compare=False, default=False)
+
+
+class SimulatedTTSEngine:
+    def __init__(self, rate: int = 180):
+        """
+        Silent stand-in for a pyttsx3 engine on machines without audio output
+
+        Takes as long to "speak" as the real voice would at the given rate
+        (words per minute) and fires started-word callbacks, so replayed
+        sessions keep realistic TTS timing and barge-in behaviour.
+        """
+        self.properties = {'voice': 'simulated', 'rate': rate, 'volume': 1.0}
+        self.spoken = []
+        self._pending = []
+        self._callbacks = {}
+        self._stopped = False
+
+    def connect(self, topic, callback):
+        self._callbacks.setdefault(topic, []).append(callback)
+
+    def getProperty(self, name):
+        return self.properties.get(name)
+
+    def setProperty(self, name, value):
+        self.properties[name] = value
+
+    def say(self, text):
+        self._pending.append(text)
+
+    def save_to_file(self, text, path):
+        self._pending.append((text, path))
+
+    def stop(self):
+        self._stopped = True
+
+    def _word_time(self) -> float:
+        return 60.0 / self.properties['rate']
+
+    def runAndWait(self):
+        self._stopped = False
+        pending, self._pending = self._pending, []
+        for item in pending:
+            if isinstance(item, tuple):
+                text, path = item
+                seconds = len(text.split()) * self._word_time()
+                with wave.open(path, 'wb') as f:
+                    f.setnchannels(1)
+                    f.setsampwidth(2)
+                    f.setframerate(16000)
+                    f.writeframes(bytes(2 * int(seconds * 16000)))
+                continue
+            location = 0
+            for word in item.split():
+                if self._stopped:
+                    return
+                for callback in self._callbacks.get('started-word', []):
+                    callback(None, location, len(word))
+                location += len(word) + 1
+                time.sleep(self._word_time())
+            self.spoken.append(item)
+
+
+class TTSWorker:
+    def __init__(self, engine_factory: Callable, name: str = "tts-worker",
+                 phrase_cache: Optional[PhraseCache] = None):
+        """
+        Owns the pyttsx3 engine on a dedicated thread
+
+        pyttsx3 engines are not thread-safe, so the engine is created and
+        driven only from the worker thread. Other threads queue utterances
+        with say() and get a Future that resolves to True when the text was
+        spoken in full, or False if it was interrupted or failed. Cancel a
+        queued utterance with future.cancel() or cancel(); interrupt() stops
+        the one playing.
+
+        Args:
+            engine_factory: Creates and configures the TTS engine (runs on the worker thread)
+            name: Worker thread name
+            phrase_cache: Play cached renders of known phrases instead of synthesising them
+        """
+        self._factory = engine_factory
+        self.phrase_cache = phrase_cache
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._ready = threading.Event()
+        self._interrupted = False
+        self.speaking = threading.Event()
+        self.current: Optional[Utterance] = None
+        self.engine = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Wait for engine initialisation; True if it finished in time"""
+        return self._ready.wait(timeout)
+
+    def say(self, text: str, priority: int = PRIORITY_NORMAL) -> Future:
+        """Queue text for speech; lower priority values are spoken first"""
+        utterance = Utterance(priority, next(self._seq), text)
+        self._queue.put(utterance)
+        return utterance.future
+
+    def prerender(self, phrases: Iterable[str]):
+        """Render phrases into the cache while the worker is otherwise idle"""
+        if self.phrase_cache is None:
+            return
+        for text in phrases:
+            self._queue.put(Utterance(PRIORITY_IDLE, next(self._seq), text, render_only=True))
+
+    def cancel(self, future: Future):
+        """Drop a queued utterance, or stop it if it is already playing"""
+        if not future.cancel():
+            current = self.current
+            if current is not None and current.future is future:
+                self.interrupt()
+
+    def interrupt(self):
+        """Stop the utterance currently playing"""
+        if self.speaking.is_set():
+            self._interrupted = True
+
+    def cancel_all(self):
+        """Drop everything queued and stop the current utterance"""
+        while True:
+            try:
+                utterance = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if utterance.text is None or utterance.render_only:
+                # Keep pending shutdown and render requests
+                self._queue.put(utterance)
+                break
+            utterance.future.cancel()
+        self.interrupt()
+
+    def shutdown(self, wait: bool = True):
+        self.cancel_all()
+        self._queue.put(Utterance(-1, next(self._seq), None))
+        if wait:
+            self._thread.join(timeout=5)
+
+    def _on_word(self, name, location, length):
+        # Called by pyttsx3 on the worker thread, the only safe place to stop it
+        if self._interrupted:
+            self.engine.stop()
+
+    def _run(self):
+        try:
+            self.engine = self._factory()
+            self.engine.connect('started-word', self._on_word)
+            if self.phrase_cache is not None:
+                self.phrase_cache.set_voice(self.engine.getProperty('voice'), self.engine.getProperty('rate'))
+        except Exception as e:
+            print(f"TTS initialization failed: {str(e)}")
+            self.engine = None
+        self._ready.set()
+
+        while True:
+            utterance = self._queue.get()
+            if utterance.text is None:
+                break
+            if not utterance.future.set_running_or_notify_cancel():
+                continue
+            if self.engine is None:
+                utterance.future.set_result(False)
+                continue
+            if utterance.render_only:
+                utterance.future.set_result(self.phrase_cache.render(self.engine, utterance.text))
+                continue
+
+            self._interrupted = False
+            self.current = utterance
+            self.speaking.set()
+            try:
+                clip = self.phrase_cache.get(utterance.text) if self.phrase_cache else None
+                if clip is not None:
+                    completed = play_clip(clip, lambda: self._interrupted)
+                else:
+                    self.engine.say(utterance.text)
+                    self.engine.runAndWait()
+                    completed = not self._interrupted
+                    if self.phrase_cache and self.phrase_cache.should_render(utterance.text):
+                        self.prerender([utterance.text])
+                utterance.future.set_result(completed)
+            except Exception as e:
+                print(f"Speech synthesis failed: {str(e)}")
+                utterance.future.set_result(False)
+            finally:
+                self.speaking.clear()
+                self.current = None
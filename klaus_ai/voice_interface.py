@@ -1,9 +1,22 @@
+import os
 import sys
+import threading
 import time
-from typing import Optional, Tuple
+from typing import Callable, Optional, Tuple, Union
 import pyttsx3
 import numpy as np
-from dataclasses import dataclass
+from audio_capture import CaptureSession, EchoGate, STREAMING_AVAILABLE
+from audio_sources import AudioSource
+from audio_frames import TARGET_RATE, resample, to_mono_float32
+from features import HOP, WHISPER_FRAMES
+from device_registry import CACHE_DIR, AudioDevice, DeviceRegistry, portaudio_lock, reinitialize_portaudio
+from streaming_asr import IncrementalTranscriber, Partial
+from tts_worker import TTSWorker, PRIORITY_HIGH, PRIORITY_NORMAL
+from asr_backends import (ASRBackend, CascadeBackend, GoogleBackend, create_backend,
+                          default_offline_backend)
+from asr_worker import ASRWorker
+from audio_enhance import AudioEnhancer, RecognitionStats
+from phrase_cache import PhraseCache, PLAYBACK_AVAILABLE
 
 try:
     import pyaudio
@@ -18,30 +31,70 @@ try:
 except ImportError:
     OFFLINE_MODE_AVAILABLE = False
 
-@dataclass
-class AudioDevice:
-    index: int
-    name: str
-    is_input: bool
-    is_output: bool
-
 class VoiceEngine:
-    def __init__(self, use_offline: bool = False, energy_threshold: int = 3000):
+    def __init__(self, use_offline: bool = False, energy_threshold: int = 3000,
+                 streaming: bool = True, trailing_silence: float = 0.8,
+                 model_name: str = "base", cache_phrases: bool = True,
+                 barge_in: bool = True, asr_backend: Optional[Union[str, ASRBackend]] = None,
+                 audio_source: Optional[AudioSource] = None,
+                 tts_engine_factory: Optional[Callable] = None,
+                 decode_profile: str = "command",
+                 transcript_check: Optional[Callable[[str], bool]] = None,
+                 asr_process: bool = False, enhance_audio: bool = False,
+                 cache_dir: Optional[str] = None):
         """
         Initialize voice engine with fallback modes
         
         Args:
             use_offline: Force offline Whisper mode
             energy_threshold: Audio detection sensitivity (3000-4000 recommended)
+            streaming: Capture from a persistent input stream and end utterances on trailing silence
+            trailing_silence: Seconds of silence that end an utterance in streaming mode
+            model_name: Whisper model size for offline mode
+            cache_phrases: Play frequent phrases from pre-rendered audio
+            barge_in: Stop talking when the user speaks over Klaus
+            asr_backend: Recognition backend name or instance (see asr_backends.BACKENDS);
+                defaults to Whisper offline and Google online
+            audio_source: Capture from this source instead of the microphone
+                (e.g. audio_sources.ReplaySource to replay a recorded session)
+            tts_engine_factory: Creates the TTS engine, defaults to pyttsx3
+                (tts_worker.SimulatedTTSEngine runs without audio output)
+            decode_profile: Whisper decode preset - "command" (fastest), "dictation"
+                or "accurate" (see decode_profiles.DECODE_PROFILES)
+            transcript_check: With asr_backend="cascade", text it rejects is re-decoded
+                with the larger model (e.g. Skills.matches)
+            asr_process: Run offline recognition in a worker process (asr_worker.ASRWorker)
+                that reads utterances straight from shared capture memory, so decoding
+                doesn't stall this process (e.g. a Tk main loop). Online recognition
+                has nothing to move and stays in-process; can't be combined with
+                transcript_check
+            enhance_audio: Pass captured speech through a spectral noise gate and
+                automatic gain control (audio_enhance.AudioEnhancer) before recognition
+            cache_dir: Where the device list and rendered phrases are cached, defaults to ~/.cache/klaus
+                (or $KLAUS_CACHE_DIR)
         """
         self.energy_threshold = energy_threshold
-        self._init_modes(use_offline)
+        self.audio_source = audio_source
+        self.cache_dir = cache_dir or CACHE_DIR
+        # Replayed audio only reaches the engine through streaming capture
+        self.streaming = (streaming and STREAMING_AVAILABLE) or audio_source is not None
+        self.trailing_silence = trailing_silence
+        self.model_name = model_name
+        self.decode_profile = decode_profile
+        self.cache_phrases = cache_phrases and PLAYBACK_AVAILABLE
+        self.barge_in = barge_in
+        self.tts_engine_factory = tts_engine_factory or self._create_tts_engine
+        self.capture = None
+        self._wake_pos = 0
+        self.enhancer = AudioEnhancer() if enhance_audio else None
+        self.recognition_stats = RecognitionStats()
+        self._init_modes(use_offline, asr_backend, transcript_check, asr_process)
         self._init_audio_devices()
         self._init_tts()
 
-    def _init_modes(self, use_offline):
+    def _init_modes(self, use_offline, asr_backend=None, transcript_check=None, asr_process=False):
         """Initialize recognition modes with proper fallbacks"""
-        if use_offline and not OFFLINE_MODE_AVAILABLE:
+        if use_offline and not OFFLINE_MODE_AVAILABLE and asr_backend is None:
             raise RuntimeError("Offline mode requested but Whisper not installed")
         
         self.use_offline = use_offline
@@ -50,94 +103,278 @@ class VoiceEngine:
             print("Warning: Online mode unavailable, falling back to offline")
             self.use_offline = True
 
-        if self.use_offline and OFFLINE_MODE_AVAILABLE:
+        self.asr = None
+        if asr_backend is not None:
+            print("Initializing voice recognition...")
+            self.asr = create_backend(asr_backend, self.decode_profile)
+        elif self.use_offline and OFFLINE_MODE_AVAILABLE:
             print("Initializing offline voice recognition...")
-            self.model = whisper.load_model("base")
+            # Float weights mapped from the weights cache, int8 where they can't be mapped
+            self.asr = default_offline_backend(self.model_name, self.decode_profile)
         elif not self.use_offline:
             print("Initializing online voice recognition...")
             self.recognizer = sr.Recognizer()
             self.recognizer.energy_threshold = self.energy_threshold
             self.recognizer.dynamic_energy_threshold = False
+            self.asr = GoogleBackend(self.recognizer)
+
+        if asr_process and isinstance(self.asr, GoogleBackend):
+            print("Online recognition decodes nothing locally, not starting an ASR worker process")
+        elif asr_process and self.asr is not None:
+            if isinstance(asr_backend, ASRBackend):
+                print("Warning: an ASR backend instance can't be moved to a worker process, decoding in-process")
+            elif isinstance(self.asr, CascadeBackend) and transcript_check is not None:
+                # The check (e.g. Skills.matches) lives in this process and can't follow the decoder
+                raise ValueError("transcript_check needs the cascade to decode in-process; "
+                                 "pass asr_process=False or drop the check")
+            else:
+                self.asr = ASRWorker(asr_backend or self.asr.name, self.decode_profile)
+
+        if isinstance(self.asr, CascadeBackend) and transcript_check is not None:
+            self.asr.accept = transcript_check
+
+        if self.asr is not None:
+            # Models are shared across engines; warm up in the background instead of blocking here
+            threading.Thread(target=self._preload_asr, daemon=True).start()
+
+    def _preload_asr(self):
+        try:
+            self.asr.load()
+        except Exception as e:
+            print(f"Speech model preload failed: {str(e)}")
+
+    def set_decode_profile(self, profile: str):
+        """Switch Whisper decode preset, e.g. to "dictation" for long free-form speech"""
+        self.asr = create_backend(self.asr, profile)
+        self.decode_profile = profile
+
+    def decode_stats(self) -> dict:
+        """Per-profile decode timings (decode_profiles.DecodeStats) recorded so far"""
+        return dict(getattr(self.asr, "stats", {}))
+
+    def recognition_metrics(self) -> dict:
+        """Failure and retry rates, plus what the enhancer did if it is on - compare runs with and without"""
+        metrics = {"enhance_audio": self.enhancer is not None, **self.recognition_stats.summary()}
+        if self.enhancer is not None:
+            metrics.update(self.enhancer.stats.summary())
+        return metrics
+
+    def _enhance(self, audio: np.ndarray, samplerate: int = TARGET_RATE) -> np.ndarray:
+        return audio if self.enhancer is None else self.enhancer.process(audio, samplerate)
 
     def _init_audio_devices(self):
-        """Detect available audio devices"""
-        self.audio_devices = []
-        self.input_device_index = 0
+        """Load audio devices from the registry cache, probing only if hardware changed"""
+        self.device_registry = DeviceRegistry(os.path.join(self.cache_dir, "devices.json"))
+        self.audio_devices = self.device_registry.devices
         self.output_device_index = 0
         
-        if ONLINE_MODE_AVAILABLE:
-            try:
-                p = pyaudio.PyAudio()
-                for i in range(p.get_device_count()):
-                    dev = p.get_device_info_by_index(i)
-                    self.audio_devices.append(
-                        AudioDevice(
-                            index=i,
-                            name=dev['name'],
-                            is_input=dev['maxInputChannels'] > 0,
-                            is_output=dev['maxOutputChannels'] > 0
-                        )
-                    )
-                p.terminate()
-                
-                # Auto-select first input device
-                for dev in self.audio_devices:
-                    if dev.is_input:
-                        self.input_device_index = dev.index
-                        break
-                        
-            except Exception as e:
-                print(f"Audio device detection failed: {str(e)}")
+        # Remembered input by name, else the system default input
+        device = self.device_registry.input_device()
+        self.input_device_index = device.index if device else None
+        if self.audio_source is None:
+            self.device_registry.watch(self._on_devices_changed)
+
+    def _on_devices_changed(self):
+        """Hot-plug: re-probe and find the preferred input at its new index"""
+        # Holding the lock keeps listen() from reopening capture on a stale index meanwhile,
+        # and waits out a cached phrase that is playing
+        with portaudio_lock:
+            self.close()
+            reinitialize_portaudio()
+            self.device_registry.refresh(force=True)
+            self.audio_devices = self.device_registry.devices
+            device = self.device_registry.input_device()
+            self.input_device_index = device.index if device else None
+        if device:
+            print(f"Using input device: {device.name}")
 
     def _init_tts(self):
-        """Initialize text-to-speech engine"""
-        try:
-            self.engine = pyttsx3.init()
-            voices = self.engine.getProperty('voices')
-            
-            # Try to find a natural-sounding voice
-            preferred_voices = ['david', 'zira', 'english']
-            for voice in voices:
-                if any(v in voice.name.lower() for v in preferred_voices):
-                    self.engine.setProperty('voice', voice.id)
-                    break
-                    
-            self.engine.setProperty('rate', 180)
-        except Exception as e:
-            print(f"TTS initialization failed: {str(e)}")
-            self.engine = None
+        """Start the text-to-speech worker"""
+        phrase_cache = PhraseCache(os.path.join(self.cache_dir, "tts")) if self.cache_phrases else None
+        self.tts = TTSWorker(self.tts_engine_factory, phrase_cache=phrase_cache)
+        self.tts.wait_ready(timeout=10)
+        self.engine = self.tts.engine
+
+    def _create_tts_engine(self):
+        """Create and configure the pyttsx3 engine (runs on the TTS worker thread)"""
+        engine = pyttsx3.init()
+        voices = engine.getProperty('voices')
+        
+        # Try to find a natural-sounding voice
+        preferred_voices = ['david', 'zira', 'english']
+        for voice in voices:
+            if any(v in voice.name.lower() for v in preferred_voices):
+                engine.setProperty('voice', voice.id)
+                break
+                
+        engine.setProperty('rate', 180)
+        return engine
 
     def list_audio_devices(self) -> list[AudioDevice]:
         """List all available audio devices"""
         return self.audio_devices
 
     def set_input_device(self, device_index: int):
-        """Set specific input device by index"""
-        if any(dev.index == device_index and dev.is_input for dev in self.audio_devices):
+        """Set specific input device by index (remembered by name for later sessions)"""
+        device = self.device_registry.get(device_index)
+        if device and device.is_input:
             self.input_device_index = device_index
+            self.device_registry.set_preferred_input(device)
+            # Reopen the capture session on the new device at the next listen()
+            self.close()
         else:
             raise ValueError("Invalid input device index")
 
-    def listen(self, timeout: int = 5, phrase_time_limit: int = 10) -> Tuple[bool, str]:
+    def listen(self, timeout: int = 5, phrase_time_limit: int = 10,
+               on_partial: Optional[Callable[[Partial], bool]] = None) -> Tuple[bool, str]:
         """
         Listen for voice input with robust error handling
         
+        Args:
+            on_partial: Offline streaming mode only - called with interim text while the
+                user is still speaking; returning True ends the utterance on its stable words
+        
         Returns:
             Tuple (success, text) where success indicates if audio was captured
         """
         try:
-            if self.use_offline:
-                return self._listen_offline(timeout)
-            return self._listen_online(timeout, phrase_time_limit)
+            started = time.monotonic()
+            if self.use_offline and self.streaming and on_partial:
+                result = self._listen_offline_incremental(timeout, phrase_time_limit, on_partial)
+            elif self.use_offline:
+                result = self._listen_offline(timeout, phrase_time_limit)
+            else:
+                result = self._listen_online(timeout, phrase_time_limit)
+            self.recognition_stats.record(*result, started)
+            return result
         except Exception as e:
             print(f"Listening error: {str(e)}")
             return False, ""
 
+    def _input_rate(self) -> int:
+        """Native rate of the input device; capturing at it avoids driver-side resampling"""
+        device = self.device_registry.get(self.input_device_index)
+        if device and device.default_samplerate:
+            return int(device.default_samplerate)
+        return TARGET_RATE
+
+    def _capture_session(self) -> CaptureSession:
+        """Return the long-lived capture session, opening it on first use"""
+        if self.capture is None:
+            capture = CaptureSession(
+                device=self.input_device_index,
+                trailing_silence=self.trailing_silence,
+                source=self.audio_source,
+                device_rate=None if self.audio_source else self._input_rate(),
+                # Capture straight into the worker's shared memory when decoding out of process
+                buffer=self.asr.buffer if isinstance(self.asr, ASRWorker) else None
+            )
+            # Ignore our own voice while speaking, unless the user talks over it
+            capture.echo_gate = EchoGate(
+                self.tts.speaking.is_set,
+                on_barge_in=self._on_barge_in if self.barge_in else None
+            )
+            capture.start()
+            self.capture = capture
+        return self.capture
+
+    @property
+    def input_finished(self) -> bool:
+        """True once a replayed audio source has played to the end"""
+        return self.audio_source is not None and self.audio_source.finished.is_set()
+
+    def _on_barge_in(self):
+        print("\nUser interrupted, stopping speech")
+        self.stop_speaking()
+
+    def close(self):
+        """Release the capture session"""
+        if self.capture is not None:
+            self.capture.stop()
+            self.capture = None
+            self._wake_pos = 0
+
+    def shutdown(self):
+        """Stop watching for hot-plugs, release the capture session and stop the ASR worker process, if any"""
+        self.device_registry.stop_watching()
+        self.close()
+        if isinstance(self.asr, ASRWorker):
+            self.asr.close()
+
+    def wait_for_wake_word(self, detector, timeout: float = 1.0) -> bool:
+        """
+        Run the on-device wake word detector over captured audio
+
+        No recognition is done here - the caller runs listen() for the
+        command only after this returns True.
+        """
+        try:
+            capture = self._capture_session()
+        except Exception as e:
+            print(f"Wake word capture error: {str(e)}")
+            time.sleep(timeout)
+            return False
+        # Share the session's noise-floor tracking VAD for activity gating
+        detector.vad = capture.vad
+        buf = capture.buffer
+        block = capture.frame_len * 4
+        live = capture.source.live
+        pos = max(self._wake_pos, buf.oldest())
+        if live:
+            # Resume where the last call stopped, but never go back more than a second
+            pos = max(pos, buf.total_written - capture.samplerate)
+        # Replayed audio is scanned in full and times out in audio time
+        deadline = time.monotonic() + timeout
+        limit = pos + int(timeout * capture.samplerate)
+
+        def more_time():
+            return time.monotonic() < deadline if live else pos < limit
+
+        while more_time():
+            if not buf.wait_for(pos + block, timeout=0.2):
+                if self.input_finished:
+                    break
+                continue
+            end = min(buf.total_written, pos + block * 4)
+            # Frames come from the session's feature cache, shared with Whisper; continue
+            # from the last frame returned, as the newest ones aren't computed yet
+            features, levels, frame = capture.features.read_frames(pos // HOP, end)
+            pos = frame * HOP
+            if capture.echo_gate.is_gated():
+                # Klaus is talking - don't let it wake itself
+                detector.reset()
+                continue
+            if detector.process_features(features, levels):
+                self._wake_pos = pos
+                capture.discard_until(pos)
+                return True
+
+        self._wake_pos = pos
+        return False
+
     def _listen_online(self, timeout: int, phrase_time_limit: int) -> Tuple[bool, str]:
         """Online recognition using Google Speech Recognition"""
         if not ONLINE_MODE_AVAILABLE:
             return False, "Online mode not available"
 
+        if not self.streaming:
+            return self._listen_online_microphone(timeout, phrase_time_limit)
+
+        try:
+            print("\nListening... (Speak now)")
+            samples = self._capture_session().capture_utterance(timeout, phrase_time_limit)
+            if samples is None:
+                return False, ""
+            text = self.asr.transcribe(self._enhance(samples))
+            return True, text.lower()
+            
+        except sr.UnknownValueError:
+            return False, "Could not understand audio"
+        except sr.RequestError as e:
+            return False, f"API unavailable: {str(e)}"
+
+    def _listen_online_microphone(self, timeout: int, phrase_time_limit: int) -> Tuple[bool, str]:
+        """Online recognition through a per-call sr.Microphone"""
         with sr.Microphone(device_index=self.input_device_index) as source:
             try:
                 print("\nListening... (Speak now)")
@@ -147,6 +384,8 @@ class VoiceEngine:
                     timeout=timeout,
                     phrase_time_limit=phrase_time_limit
                 )
+                if self.enhancer is not None:
+                    audio = self._enhance_audio_data(audio)
                 
                 text = self.recognizer.recognize_google(audio)
                 return True, text.lower()
@@ -158,45 +397,138 @@ class VoiceEngine:
             except sr.RequestError as e:
                 return False, f"API unavailable: {str(e)}"
 
-    def _listen_offline(self, timeout: int) -> Tuple[bool, str]:
-        """Offline recognition using Whisper"""
-        if not OFFLINE_MODE_AVAILABLE:
+    def _enhance_audio_data(self, audio: "sr.AudioData") -> "sr.AudioData":
+        """Enhance speech_recognition audio, which arrives as 16-bit PCM at the device rate"""
+        pcm = np.frombuffer(audio.get_raw_data(convert_width=2), dtype=np.int16)
+        enhanced = self._enhance(pcm.astype(np.float32) / 32768.0, audio.sample_rate)
+        pcm = (np.clip(enhanced, -1.0, 1.0) * 32767).astype(np.int16)
+        return sr.AudioData(pcm.tobytes(), audio.sample_rate, 2)
+
+    def _listen_offline(self, timeout: int, phrase_time_limit: int) -> Tuple[bool, str]:
+        """Offline recognition using the local ASR backend"""
+        if self.asr is None:
             return False, "Offline mode not available"
 
         try:
-            import sounddevice as sd
             print("\nListening offline... (Speak now)")
             
-            fs = 16000  # Sample rate
-            recording = sd.rec(int(timeout * fs), samplerate=fs, channels=1)
-            sd.wait()  # Wait until recording is finished
+            if self.streaming:
+                # Wait for speech onset, stop once the speaker goes quiet
+                capture = self._capture_session()
+                audio = capture.capture_utterance(timeout, phrase_time_limit)
+                if audio is None:
+                    return False, ""
+                # Enhanced audio differs from what capture holds, so it takes the plain path
+                if isinstance(self.asr, ASRWorker) and self.enhancer is None:
+                    # The worker reads the utterance where capture left it
+                    return True, self.asr.transcribe_span(*capture.last_span).lower()
+                mel = self._utterance_mel(capture) if self.enhancer is None else None
+                if mel is not None:
+                    return True, self.asr.transcribe_mel(mel).lower()
+            else:
+                import sounddevice as sd
+                fs = self._input_rate()
+                with portaudio_lock:
+                    recording = sd.rec(int(timeout * fs), samplerate=fs, channels=1,
+                                       dtype='float32', device=self.input_device_index)
+                    sd.wait()  # Wait until recording is finished
+                audio = resample(to_mono_float32(recording), fs)
             
-            audio = whisper.pad_or_trim(recording)
-            result = self.model.transcribe(audio)
-            return True, result["text"].lower()
+            text = self.asr.transcribe(self._enhance(audio))
+            return True, text.lower()
             
         except Exception as e:
             return False, f"Offline recognition failed: {str(e)}"
 
-    def speak(self, text: str, wait: bool = True) -> bool:
-        """Convert text to speech with error handling"""
+    def _utterance_mel(self, capture) -> Optional[np.ndarray]:
+        """The last utterance's log-mel from the capture's feature cache, if the backend takes it"""
+        if self.asr.mel_bins != capture.features.n_mels or capture.last_span is None:
+            return None
+        mel = capture.features.whisper_input(*capture.last_span)
+        if mel is None or mel.shape[1] > WHISPER_FRAMES:
+            return None
+        return mel
+
+    def _listen_offline_incremental(self, timeout: int, phrase_time_limit: int,
+                                    on_partial: Callable[[Partial], bool]) -> Tuple[bool, str]:
+        """Offline recognition that re-decodes the utterance while it is being spoken"""
+        if self.asr is None:
+            return False, "Offline mode not available"
+
+        capture = self._capture_session()
+        transcriber = IncrementalTranscriber(
+            lambda audio: self.asr.transcribe(self._enhance(audio)),
+            samplerate=capture.samplerate
+        )
+        span = {}
+        accepted = threading.Event()
+        done = threading.Event()
+
+        def on_frame(start, end):
+            span['start'], span['end'] = start, end
+            return accepted.is_set()
+
+        def decode_loop():
+            # Decoding runs beside capture so endpointing never waits on Whisper
+            while not done.wait(0.1):
+                if 'start' not in span or not transcriber.due(span['end'] - span['start']):
+                    continue
+                partial = transcriber.update(capture.buffer.read(span['start'], span['end']))
+                if partial and on_partial(partial):
+                    accepted.set()
+                    return
+
+        try:
+            print("\nListening offline... (Speak now)")
+            worker = threading.Thread(target=decode_loop, daemon=True)
+            worker.start()
+            try:
+                audio = capture.capture_utterance(timeout, phrase_time_limit, on_frame=on_frame)
+            finally:
+                done.set()
+                worker.join()
+
+            if accepted.is_set():
+                return True, transcriber.partial().stable
+            if audio is None:
+                return False, ""
+            return True, transcriber.finalize(audio)
+            
+        except Exception as e:
+            return False, f"Offline recognition failed: {str(e)}"
+
+    def speak(self, text: str, wait: bool = True, priority: int = PRIORITY_NORMAL) -> bool:
+        """
+        Convert text to speech on the TTS worker
+        
+        With wait=False this returns as soon as the text is queued, so the
+        caller can keep listening while Klaus talks.
+        """
         if not self.engine:
             print("TTS engine not available")
             return False
             
-        try:
-            print(f"Speaking: {text}")
-            self.engine.say(text)
-            if wait:
-                self.engine.runAndWait()
-            return True
-        except Exception as e:
-            print(f"Speech synthesis failed: {str(e)}")
-            return False
+        print(f"Speaking: {text}")
+        future = self.tts.say(text, priority)
+        if wait:
+            return future.result()
+        return True
+
+    def prerender_phrases(self, phrases):
+        """Render fixed responses in the background so they play without synthesis delay"""
+        self.tts.prerender(phrases)
+
+    def stop_speaking(self):
+        """Cancel queued speech and cut off the current utterance"""
+        self.tts.cancel_all()
+
+    @property
+    def is_speaking(self) -> bool:
+        return self.tts.speaking.is_set()
 
     def play_activation_sound(self):
         """Play a brief activation sound"""
-        self.speak("Activated", wait=False)
+        self.speak("Activated", wait=False, priority=PRIORITY_HIGH)
 
 if __name__ == "__main__":
     # Test the voice interface
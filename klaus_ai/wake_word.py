@@ -0,0 +1,203 @@
+import os
+import time
+from typing import List, Optional
+import numpy as np
+from audio_capture import EnergyVAD
+from features import HOP, LogMelFrontend
+
+CACHE_DIR = os.getenv("KLAUS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "klaus"))
+DEFAULT_TEMPLATE_FILE = os.path.join(CACHE_DIR, "wake_templates.npz")
+
+
+def _normalize(features: np.ndarray) -> np.ndarray:
+    """Floor 40 dB below the peak, mean-normalise over time and scale each frame to unit length"""
+    # log10 features: without the floor, near-silent bins and background hiss dominate the distance
+    features = np.maximum(features, features.max() - 4.0)
+    features = features - features.mean(axis=0)
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    return features / np.maximum(norms, 1e-6)
+
+
+def subsequence_dtw_cost(template: np.ndarray, window: np.ndarray) -> float:
+    """
+    Best alignment cost of the whole template against any part of the window
+
+    Uses cosine distance between frames and slope-constrained steps
+    (1,1), (1,2), (2,1) so every row only depends on the two rows above it
+    and can be computed as one vector operation. The result is normalised
+    by template length, so 0 is a perfect match and ~1 is unrelated audio.
+    """
+    cost = 1.0 - template @ window.T
+    rows, cols = cost.shape
+    inf = np.float32(np.inf)
+    prev2 = np.full(cols, inf, dtype=np.float32)
+    prev = cost[0].copy()  # free start anywhere in the window
+
+    for i in range(1, rows):
+        best = np.full(cols, inf, dtype=np.float32)
+        best[1:] = prev[:-1]
+        best[2:] = np.minimum(best[2:], prev[:-2])
+        best[1:] = np.minimum(best[1:], prev2[:-1])
+        prev2, prev = prev, cost[i] + best
+
+    return float(prev.min() / rows)
+
+
+class WakeWordDetector:
+    def __init__(self, template_file: str = DEFAULT_TEMPLATE_FILE, threshold: float = 0.2,
+                 samplerate: int = 16000, vad: Optional[EnergyVAD] = None):
+        """
+        On-device keyword spotter for the wake word
+
+        Incoming audio is turned into log-mel frames as it arrives, and while
+        there is voice activity the recent frames are matched against enrolled
+        recordings of the wake word with DTW. Nothing is sent anywhere and
+        silence costs only the feature extraction.
+
+        Args:
+            template_file: .npz file holding enrolled wake word templates
+                (default ~/.cache/klaus/wake_templates.npz)
+            threshold: Maximum DTW cost that counts as a detection (lower is stricter)
+            samplerate: Audio rate in Hz
+            vad: Voice activity detector used to skip matching during silence
+        """
+        self.template_file = template_file
+        self.threshold = threshold
+        self.samplerate = samplerate
+        self.vad = vad or EnergyVAD()
+        self.frontend = LogMelFrontend()
+        self.templates: List[np.ndarray] = []
+        self.eval_every = 10       # frames between matches (100 ms)
+        self.hangover = 30         # keep matching 300 ms past the last voiced frame
+        self.refractory = 100      # ignore 1 s of audio after a detection
+        self.last_score = None
+        self._cooldown = 0
+        self.reset()
+        self.load()
+
+    def ready(self) -> bool:
+        """True once at least one template is enrolled"""
+        return bool(self.templates)
+
+    def reset(self):
+        self.frontend.reset()
+        max_len = max((len(t) for t in self.templates), default=100)
+        self._history = np.zeros((0, self.frontend.n_mels), dtype=np.float32)
+        self._max_frames = int(max_len * 2)
+        self._since_voice = self.hangover + 1
+        self._since_eval = 0
+
+    def load(self, path: Optional[str] = None):
+        """Load enrolled templates if the file exists"""
+        path = path or self.template_file
+        if os.path.exists(path):
+            with np.load(path) as data:
+                templates = [data[key] for key in sorted(data.files)]
+            if any(t.shape[1] != self.frontend.n_mels for t in templates):
+                print("Wake word templates use an older feature format, run wake_word.py to re-enroll")
+                return
+            self.templates = templates
+            self.reset()
+
+    def save(self, path: Optional[str] = None):
+        path = path or self.template_file
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(path, **{f"t{i:02d}": t for i, t in enumerate(self.templates)})
+
+    def enroll(self, audio: np.ndarray) -> bool:
+        """Add a recording of the wake word as a template"""
+        features = self._trimmed_features(audio)
+        if features is None:
+            return False
+        self.templates.append(_normalize(features))
+        self.reset()
+        return True
+
+    def _trimmed_features(self, audio: np.ndarray) -> Optional[np.ndarray]:
+        """Log-mel features of the voiced part of a recording"""
+        voiced = [i for i in range(0, len(audio) - HOP, HOP) if self.vad.is_speech(audio[i:i + HOP])]
+        if not voiced:
+            return None
+        features, _ = LogMelFrontend(self.frontend.n_mels).process(audio[voiced[0]:voiced[-1] + HOP])
+        return features if len(features) >= 10 else None
+
+    def score(self, features: np.ndarray) -> float:
+        """Lowest DTW cost of the given frames against all templates"""
+        window = _normalize(features)
+        return min(subsequence_dtw_cost(t, window) for t in self.templates)
+
+    def process(self, samples: np.ndarray) -> bool:
+        """Feed captured audio; returns True when the wake word was just spoken"""
+        if not self.templates:
+            return False
+        return self.process_features(*self.frontend.process(samples))
+
+    def process_features(self, features: np.ndarray, levels: np.ndarray) -> bool:
+        """
+        Feed precomputed frames, e.g. from the capture's FeatureCache
+
+        Args:
+            features: log-mel frames, shape (frames, n_mels)
+            levels: RMS level of each frame, for voice activity gating
+        """
+        if not self.templates:
+            return False
+
+        for level in levels:
+            if self.vad.is_loud(level):
+                self._since_voice = 0
+            else:
+                self._since_voice += 1
+
+        if self._cooldown > 0:
+            self._cooldown -= len(features)
+            return False
+        if len(features):
+            self._history = np.concatenate((self._history, features))[-self._max_frames:]
+        self._since_eval += len(features)
+
+        if self._since_voice > self.hangover or self._since_eval < self.eval_every:
+            return False
+        self._since_eval = 0
+
+        shortest = min(len(t) for t in self.templates)
+        if len(self._history) < shortest // 2:
+            return False
+
+        self.last_score = self.score(self._history)
+        if self.last_score <= self.threshold:
+            self.reset()
+            self._cooldown = self.refractory
+            return True
+        return False
+
+
+def enroll_from_microphone(samples: int = 3, seconds: float = 2.0,
+                           template_file: str = DEFAULT_TEMPLATE_FILE):
+    """Record the wake word a few times and save the templates"""
+    import sounddevice as sd
+
+    detector = WakeWordDetector(template_file)
+    detector.templates = []
+    fs = detector.samplerate
+    for i in range(samples):
+        input(f"\nPress Enter and say 'hey klaus' ({i + 1}/{samples})...")
+        recording = sd.rec(int(seconds * fs), samplerate=fs, channels=1, dtype='float32')
+        sd.wait()
+        if not detector.enroll(recording[:, 0]):
+            print("No speech detected, skipping this sample")
+        time.sleep(0.2)
+
+    if len(detector.templates) > 1:
+        # Leave-one-out scores help choose a threshold
+        for i, template in enumerate(detector.templates):
+            others = detector.templates[:i] + detector.templates[i + 1:]
+            costs = [subsequence_dtw_cost(t, template) for t in others]
+            print(f"Template {i}: best cost against the others {min(costs):.3f}")
+
+    detector.save()
+    print(f"Saved {len(detector.templates)} templates to {template_file}")
+
+
+if __name__ == "__main__":
+    enroll_from_microphone()
@@ -0,0 +1,205 @@
+"""
+Whisper weights stored for memory-mapped loading
+
+whisper.load_model() reads the whole fp16 checkpoint into memory and
+copies it into a freshly allocated fp32 model on every start. The first
+load here converts it once into a cache file holding the fp32 tensors
+exactly as the model uses them; later loads build the model on the meta
+device and point its parameters at the mmapped file, so startup maps
+pages instead of copying them and every Klaus process on the host shares
+the same page cache.
+
+Usage (startup benchmark):
+    python weights_cache.py tiny base --json startup.json
+"""
+import argparse
+import inspect
+import json
+import multiprocessing
+import os
+import time
+from dataclasses import asdict
+from typing import Dict, List, Optional
+from model_registry import current_rss_mb
+
+CACHE_DIR = os.getenv("KLAUS_WEIGHTS_CACHE",
+                      os.path.join(os.path.expanduser("~"), ".cache", "klaus", "weights"))
+FORMAT_VERSION = 1
+
+
+def cache_path(name: str, cache_dir: Optional[str] = None) -> str:
+    return os.path.join(cache_dir or CACHE_DIR, f"whisper-{os.path.basename(name)}.v{FORMAT_VERSION}.pt")
+
+
+def mmap_supported() -> bool:
+    """True if torch can mmap checkpoints and assign them to a model (torch 2.1+)"""
+    try:
+        import torch
+    except ImportError:
+        return False
+    return ("mmap" in inspect.signature(torch.load).parameters
+            and "assign" in inspect.signature(torch.nn.Module.load_state_dict).parameters)
+
+
+def _extra_buffers(model) -> Dict:
+    """Non-persistent buffers (the decoder mask, alignment heads), which state_dict() leaves out"""
+    persistent = set(model.state_dict())
+    return {name: buffer for name, buffer in model.named_buffers() if name not in persistent}
+
+
+def convert(name: str, cache_dir: Optional[str] = None):
+    """Load a Whisper checkpoint the normal way and save it in the mmap layout; returns the model"""
+    import torch
+    import whisper
+
+    model = whisper.load_model(name, device="cpu")
+    path = cache_path(name, cache_dir)
+    buffers = _extra_buffers(model)
+    checkpoint = {
+        "dims": asdict(model.dims),
+        "model_state_dict": model.state_dict(),
+        "buffers": {key: b.to_dense() if b.is_sparse else b for key, b in buffers.items()},
+        "sparse": [key for key, b in buffers.items() if b.is_sparse],
+    }
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        torch.save(checkpoint, tmp)
+        os.replace(tmp, path)  # readers never see a half-written file
+    except (OSError, RuntimeError) as e:
+        print(f"Could not cache {name} weights: {str(e)}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return model
+
+
+def load_mapped(name: str, cache_dir: Optional[str] = None):
+    """Whisper model backed by the pages of its cache file, None if it hasn't been converted"""
+    import torch
+    from whisper.model import ModelDimensions, Whisper
+
+    path = cache_path(name, cache_dir)
+    if not os.path.exists(path):
+        return None
+    checkpoint = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    # Meta tensors take no memory; assign=True swaps in the mapped ones instead of copying
+    with torch.device("meta"):
+        model = Whisper(ModelDimensions(**checkpoint["dims"]))
+    model.load_state_dict(checkpoint["model_state_dict"], assign=True)
+    for key, buffer in checkpoint["buffers"].items():
+        module, _, leaf = key.rpartition(".")
+        if key in checkpoint["sparse"]:
+            buffer = buffer.to_sparse()
+        model.get_submodule(module).register_buffer(leaf, buffer, persistent=False)
+    if any(t.is_meta for t in list(model.parameters()) + list(model.buffers())):
+        raise RuntimeError(f"{path} does not cover every model tensor")
+    return model
+
+
+def load_whisper(name: str, cache_dir: Optional[str] = None):
+    """whisper.load_model() through the weights cache, converting the checkpoint on first use"""
+    import torch
+    import whisper
+
+    # GPU weights are copied to the device anyway, and old torch can't map them
+    if torch.cuda.is_available() or not mmap_supported():
+        return whisper.load_model(name)
+    try:
+        model = load_mapped(name, cache_dir)
+        if model is not None:
+            return model
+    except Exception as e:
+        print(f"Cached {name} weights unusable, converting again: {str(e)}")
+    return convert(name, cache_dir)
+
+
+def _evict_page_cache(path: Optional[str]):
+    """Best effort: drop a file's pages from the OS cache so the next read hits the disk"""
+    if not path or not os.path.exists(path) or not hasattr(os, "posix_fadvise"):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def _source_checkpoint(name: str) -> Optional[str]:
+    """Where whisper.load_model() keeps the downloaded checkpoint"""
+    try:
+        import whisper
+        url = whisper._MODELS[name]
+    except (ImportError, AttributeError, KeyError):
+        return name if os.path.isfile(name) else None
+    root = os.path.join(os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")), "whisper")
+    return os.path.join(root, os.path.basename(url))
+
+
+def _measure(name: str, mode: str, results):
+    """Child process: load one way, then time a first decode (which pages in mapped weights)"""
+    try:
+        import numpy as np
+        import whisper
+        rss_before = current_rss_mb()
+        start = time.perf_counter()
+        model = whisper.load_model(name, device="cpu") if mode == "stock" else load_mapped(name)
+        load_time = time.perf_counter() - start
+        rss_loaded = current_rss_mb()
+        start = time.perf_counter()
+        model.transcribe(np.zeros(16000, dtype=np.float32), language="en", fp16=False)
+        results.put({
+            "model": name, "mode": mode, "load_time": load_time,
+            "first_decode": time.perf_counter() - start,
+            "rss_mb": rss_loaded - rss_before if rss_loaded and rss_before else None
+        })
+    except Exception as e:
+        results.put({"model": name, "mode": mode, "error": str(e)})
+
+
+def benchmark_startup(name: str) -> List[Dict]:
+    """
+    Stock whisper.load_model() against mapped loads with the file out of
+    (cold) and in (warm) the OS page cache, each in a fresh process
+    """
+    if not os.path.exists(cache_path(name)):
+        convert(name)
+    ctx = multiprocessing.get_context("spawn")
+    runs = []
+    for mode, evict in (("stock", _source_checkpoint(name)), ("cold", cache_path(name)), ("warm", None)):
+        _evict_page_cache(evict)
+        results = ctx.Queue()
+        proc = ctx.Process(target=_measure, args=(name, mode, results))
+        proc.start()
+        runs.append(results.get())
+        proc.join()
+    return runs
+
+
+def _fmt(value, spec):
+    return "-" if value is None else format(value, spec)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Whisper startup with and without the mapped weights cache")
+    parser.add_argument("models", nargs="*", default=["tiny", "base"], help="Whisper model names")
+    parser.add_argument("--json", help="Also write results to this file")
+    args = parser.parse_args()
+
+    if not mmap_supported():
+        parser.error("mapped loading needs torch 2.1 or newer")
+
+    results = [run for name in args.models for run in benchmark_startup(name)]
+    print(f"{'model':<10}{'load':<8}{'load s':>9}{'1st decode s':>14}{'RSS MB':>9}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['model']:<10}{r['mode']:<8} failed: {r['error']}")
+            continue
+        print(f"{r['model']:<10}{r['mode']:<8}{_fmt(r['load_time'], '9.2f')}"
+              f"{_fmt(r['first_decode'], '14.2f')}{_fmt(r['rss_mb'], '9.0f')}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()